@@ -5,6 +5,7 @@ import argparse
 from .. import defaults
 from .datamodules import DataModule  # noqa: F401
 from .batches import PaddedBatch, PaddedTensor  # noqa: F401
+from .caches import Cache  # noqa: F401
 from .indexes import Index  # noqa: F401
 
 
@@ -57,12 +58,110 @@ def add_argparse_args(parser: argparse.ArgumentParser) -> None:
         "an empty string indicates that each Unicode codepoint "
         "is its own symbol. Default: %(default)r.",
     )
+    parser.add_argument(
+        "--cache_encoded",
+        action="store_true",
+        default=defaults.CACHE_ENCODED,
+        help="Caches encoded data files as memory-mapped arrays in the "
+        "model directory. Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--no_cache_encoded",
+        action="store_false",
+        dest="cache_encoded",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        default=defaults.STREAMING,
+        help="Streams data files rather than loading them into memory; "
+        "incompatible with --cache_encoded, --bucket_by_length, and "
+        "--max_tokens_per_batch. Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--no_streaming",
+        action="store_false",
+        dest="streaming",
+    )
+    parser.add_argument(
+        "--shuffle_buffer_size",
+        type=int,
+        default=defaults.SHUFFLE_BUFFER_SIZE,
+        help="Size of the buffer used to shuffle training data when "
+        "streaming. Default: %(default)s.",
+    )
     parser.add_argument(
         "--batch_size",
         type=int,
         default=defaults.BATCH_SIZE,
         help="Batch size. Default: %(default)s.",
     )
+    parser.add_argument(
+        "--bucket_by_length",
+        action="store_true",
+        default=defaults.BUCKET_BY_LENGTH,
+        help="Batches together strings of similar length, to reduce "
+        "padding. Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--no_bucket_by_length",
+        action="store_false",
+        dest="bucket_by_length",
+    )
+    parser.add_argument(
+        "--max_tokens_per_batch",
+        type=int,
+        help="Maximum number of padded source and target symbols per batch, "
+        "counting the start and end symbols added to each string; if "
+        "specified, batches hold varying numbers of strings of similar "
+        "length, and --batch_size is ignored.",
+    )
+    parser.add_argument(
+        "--parse_processes",
+        type=int,
+        default=defaults.PARSE_PROCESSES,
+        help="Number of processes used to parse and encode data files, "
+        "which are split into that many byte ranges; not used when "
+        "streaming. Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        help="Number of DataLoader worker processes; 0 loads data in the "
+        "main process. Default: one fewer than the number of CPUs, up to "
+        f"{defaults.MAX_AUTO_NUM_WORKERS}.",
+    )
+    parser.add_argument(
+        "--pin_memory",
+        action="store_true",
+        default=None,
+        help="Loads batches into pinned memory, which speeds up copying to "
+        "the GPU. Default: enabled if CUDA is available.",
+    )
+    parser.add_argument(
+        "--no_pin_memory",
+        action="store_false",
+        dest="pin_memory",
+    )
+    parser.add_argument(
+        "--persistent_workers",
+        action="store_true",
+        default=defaults.PERSISTENT_WORKERS,
+        help="Keeps DataLoader workers alive between epochs. "
+        "Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--no_persistent_workers",
+        action="store_false",
+        dest="persistent_workers",
+    )
+    parser.add_argument(
+        "--prefetch_factor",
+        type=int,
+        default=defaults.PREFETCH_FACTOR,
+        help="Number of batches loaded in advance by each DataLoader "
+        "worker. Default: %(default)s.",
+    )
     parser.add_argument(
         "--max_source_length",
         type=int,
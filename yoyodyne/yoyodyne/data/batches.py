@@ -1,21 +1,23 @@
 """Batching, padding, and related utilities.
 
-Anything which has a tensor member should inherit from nn.Module, run the
-superclass constructor, and register the tensor as a buffer. This enables the
-Trainer to move them to the appropriate device."""
+These are lightweight classes with __slots__, since they are constructed for
+every batch. They provide `to` and `pin_memory` methods; the former is used
+by the Trainer's default transfer_batch_to_device hook to move them to the
+appropriate device, and the latter by the DataLoader."""
 
-from typing import Callable, List, Optional
+from typing import Callable, List, Optional, Union
 
 import torch
-from torch import nn
 
 
-class PaddedTensor(nn.Module):
+class PaddedTensor:
     """A tensor and its mask.
 
     This is ordinarily used for padding a tensor list, so it represents
     one of (source, target, features) for a batch."""
 
+    __slots__ = ("padded", "mask", "_lengths")
+
     padded: torch.Tensor
     mask: torch.Tensor
 
@@ -41,68 +43,113 @@ class PaddedTensor(nn.Module):
             pad_len (int, optional): desired length for padding.
 
         """
-        super().__init__()
+        lengths = torch.tensor([len(tensor) for tensor in tensorlist])
         if pad_len is None:
-            pad_len = max(len(tensor) for tensor in tensorlist)
+            pad_len = int(lengths.max())
+        elif pad_len < lengths.max():
+            tensorlist = [tensor[:pad_len] for tensor in tensorlist]
+            lengths = lengths.clamp(max=pad_len)
         if length_msg_callback is not None:
             length_msg_callback(pad_len)
-        self.register_buffer(
-            "padded",
-            torch.stack(
-                [
-                    self.pad_tensor(tensor, pad_idx, pad_len)
-                    for tensor in tensorlist
-                ],
-            ),
-        )
-        self.register_buffer("mask", self.padded == pad_idx)
-
-    @staticmethod
-    def pad_tensor(
-        tensor: torch.Tensor, pad_idx: int, pad_max: int
-    ) -> torch.Tensor:
-        """Pads a tensor.
-
-        Args:
-            tensor (torch.Tensor).
-            pad_idx (int): padding index.
-            pad_max (int): desired tensor length.
-
-        Returns:
-            torch.Tensor.
-        """
-        padding = pad_max - len(tensor)
-        return nn.functional.pad(tensor, (0, padding), "constant", pad_idx)
+        # This stays on CPU when the tensor is moved.
+        self._lengths = lengths
+        mask = torch.arange(pad_len) >= lengths.unsqueeze(1)
+        # Fills a single pre-allocated tensor; items may be stored more
+        # compactly, but embedding lookups and scatters require int64
+        # indices.
+        padded = torch.full((len(tensorlist), pad_len), pad_idx)
+        padded.masked_scatter_(~mask, torch.cat(tensorlist).long())
+        self.padded = padded
+        self.mask = mask
 
     def __len__(self) -> int:
         return len(self.padded)
 
     def lengths(self) -> torch.Tensor:
-        """Computes the lengths of all the strings in the tensor.
+        """Returns the lengths of all the strings in the tensor.
 
         By convention we seem to want this tensor on CPU.
 
         Returns:
             torch.Tensor.
         """
-        return (self.mask == 0).sum(dim=1).cpu()
+        return self._lengths
+
+    def pin_memory(self) -> "PaddedTensor":
+        """Pins the tensors; this is called by the DataLoader.
+
+        Returns:
+            PaddedTensor.
+        """
+        self.padded = self.padded.pin_memory()
+        self.mask = self.mask.pin_memory()
+        return self
+
+    def to(
+        self, device: Union[torch.device, str], non_blocking: bool = False
+    ) -> "PaddedTensor":
+        """Moves the tensors to a device, in place.
+
+        Args:
+            device (Union[torch.device, str]).
+            non_blocking (bool, optional).
+
+        Returns:
+            PaddedTensor.
+        """
+        self.padded = self.padded.to(device, non_blocking=non_blocking)
+        self.mask = self.mask.to(device, non_blocking=non_blocking)
+        return self
 
 
-class PaddedBatch(nn.Module):
+class PaddedBatch:
     """Padded source tensor, with optional padded features and target tensors.
 
     This represents a padded batch. It is produced by the collator and fed to
     the trainer."""
 
+    __slots__ = ("source", "features", "target")
+
     source: PaddedTensor
     features: Optional[PaddedTensor]
     target: Optional[PaddedTensor]
 
     def __init__(self, source, features=None, target=None):
-        super().__init__()
-        self.register_module("source", source)
-        self.register_module("target", target)
-        self.register_module("features", features)
+        self.source = source
+        self.features = features
+        self.target = target
+
+    def _padded_tensors(self) -> List[PaddedTensor]:
+        return [
+            padded
+            for padded in (self.source, self.features, self.target)
+            if padded is not None
+        ]
+
+    def pin_memory(self) -> "PaddedBatch":
+        """Pins the tensors; this is called by the DataLoader.
+
+        Returns:
+            PaddedBatch.
+        """
+        for padded in self._padded_tensors():
+            padded.pin_memory()
+        return self
+
+    def to(self, device: Union[torch.device, str]) -> "PaddedBatch":
+        """Moves the tensors to a device, in place.
+
+        Args:
+            device (Union[torch.device, str]).
+
+        Returns:
+            PaddedBatch.
+        """
+        # Copies from pinned memory to CUDA can be asynchronous.
+        non_blocking = torch.device(device).type == "cuda"
+        for padded in self._padded_tensors():
+            padded.to(device, non_blocking)
+        return self
 
     @property
     def has_features(self):
@@ -0,0 +1,157 @@
+"""Pre-encoded dataset caches.
+
+Encoding a TSV file requires a Python-level lookup for every symbol. The Cache
+does this once per file, and stores each encoded column as a pair of NumPy
+arrays (see datasets.EncodedColumn) next to the index. These are
+memory-mapped when read.
+
+Cache entries are keyed by a digest of the file contents, the index symbol
+tables, the parser configuration, and CACHE_VERSION, so a stale entry is never
+read; it is simply rebuilt under a new key.
+"""
+
+import dataclasses
+import hashlib
+import os
+from typing import Dict, Iterator
+
+import numpy
+
+from .. import util
+from . import datasets, indexes, parallel, tsv
+
+# Increment this whenever the on-disk layout changes.
+CACHE_VERSION = 1
+
+
+@dataclasses.dataclass
+class Cache:
+    """Reads and writes encoded columns for TSV files.
+
+    Args:
+        cache_dir (str): directory for cached arrays.
+        index (indexes.Index).
+        parser (tsv.TsvParser).
+        processes (int, optional): number of processes for encoding.
+    """
+
+    cache_dir: str
+    index: indexes.Index
+    parser: tsv.TsvParser
+    processes: int = 1
+
+    @staticmethod
+    def cache_path(model_dir: str, experiment: str) -> str:
+        """Computes path for the cache directory.
+
+        This sits next to the index file.
+
+        Args:
+            model_dir (str).
+            experiment (str).
+
+        Returns:
+            str.
+        """
+        return f"{model_dir}/{experiment}/cache"
+
+    def key(self, path: str) -> str:
+        """Computes the cache key for a TSV file.
+
+        Args:
+            path (str).
+
+        Returns:
+            str: hexadecimal digest.
+        """
+        hasher = hashlib.sha256()
+        hasher.update(f"{CACHE_VERSION}\n".encode("utf-8"))
+        hasher.update(f"{self.index.checksum}\n".encode("utf-8"))
+        hasher.update(
+            f"{dataclasses.astuple(self.parser)!r}\n".encode("utf-8")
+        )
+        with open(path, "rb") as source:
+            for chunk in iter(lambda: source.read(1 << 20), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def _array_path(self, key: str, column: str, name: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.{column}.{name}.npy")
+
+    @property
+    def columns(self) -> Iterator[str]:
+        yield "source"
+        if self.parser.has_features:
+            yield "features"
+        if self.parser.has_target:
+            yield "target"
+
+    def _read(self, key: str) -> Dict[str, datasets.EncodedColumn]:
+        # Copy-on-write mapping gives writable arrays, which torch requires
+        # for zero-copy conversion, without ever modifying the file.
+        return {
+            column: datasets.EncodedColumn(
+                numpy.load(
+                    self._array_path(key, column, "tokens"), mmap_mode="c"
+                ),
+                numpy.load(
+                    self._array_path(key, column, "offsets"), mmap_mode="c"
+                ),
+            )
+            for column in self.columns
+        }
+
+    def _write(
+        self, key: str, columns: Dict[str, datasets.EncodedColumn]
+    ) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for column, encoded in columns.items():
+            for name, array in (
+                ("tokens", encoded.tokens),
+                ("offsets", encoded.offsets),
+            ):
+                path = self._array_path(key, column, name)
+                # Writes to a temporary file and then renames it, so that
+                # concurrent readers never see a partial array.
+                temporary = f"{path}.{os.getpid()}.tmp.npy"
+                numpy.save(temporary, array)
+                os.replace(temporary, path)
+
+    def _is_cached(self, key: str) -> bool:
+        return all(
+            os.path.exists(self._array_path(key, column, name))
+            for column in self.columns
+            for name in ("tokens", "offsets")
+        )
+
+    def save(
+        self, path: str, columns: Dict[str, datasets.EncodedColumn]
+    ) -> None:
+        """Writes already-encoded columns for a TSV file, if not yet cached.
+
+        Args:
+            path (str): path to the TSV file.
+            columns (Dict[str, datasets.EncodedColumn]).
+        """
+        key = self.key(path)
+        if not self._is_cached(key):
+            util.log_info(f"Caching {path} to {self.cache_dir}")
+            self._write(key, columns)
+
+    def load(self, path: str) -> Dict[str, datasets.EncodedColumn]:
+        """Loads the encoded columns for a TSV file, encoding it if needed.
+
+        Args:
+            path (str): path to the TSV file.
+
+        Returns:
+            Dict[str, datasets.EncodedColumn]: memory-mapped columns.
+        """
+        key = self.key(path)
+        if not self._is_cached(key):
+            util.log_info(f"Encoding {path} to {self.cache_dir}")
+            encoder = datasets.Encoder(self.index, self.parser)
+            self._write(
+                key, parallel.encode_samples(encoder, path, self.processes)
+            )
+        return self._read(key)
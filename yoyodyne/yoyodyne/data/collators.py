@@ -65,15 +65,25 @@ class Collator:
         self,
         itemlist: List[datasets.Item],
     ) -> List[torch.Tensor]:
-        """Concatenates source and feature tensors."""
-        return [
-            (
-                torch.cat((item.source, item.features + self.features_offset))
-                if item.has_features
-                else item.source
-            )
-            for item in itemlist
-        ]
+        """Concatenates source and feature tensors.
+
+        This concatenates the whole batch at once, and then splits it into
+        views of the individual concatenated strings.
+        """
+        if not self.has_features:
+            return [item.source for item in itemlist]
+        features = torch.cat([item.features for item in itemlist])
+        features = features + self.features_offset
+        features_lengths = [len(item.features) for item in itemlist]
+        pieces = []
+        lengths = []
+        for item, item_features in zip(
+            itemlist, features.split(features_lengths)
+        ):
+            pieces.append(item.source)
+            pieces.append(item_features)
+            lengths.append(len(item.source) + len(item_features))
+        return list(torch.cat(pieces).split(lengths))
 
     def pad_source(
         self, itemlist: List[datasets.Item]
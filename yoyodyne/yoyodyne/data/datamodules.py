@@ -1,12 +1,44 @@
 """Data modules."""
 
-from typing import Iterator, Optional, Set
+import os
+from typing import Dict, Iterator, Optional
 
 import pytorch_lightning as pl
+import torch
 from torch.utils import data
 
 from .. import defaults, util
-from . import collators, datasets, indexes, tsv
+from . import (
+    caches,
+    collators,
+    datasets,
+    indexes,
+    parallel,
+    samplers,
+    tsv,
+)
+
+
+class Error(Exception):
+    """Module-specific exception."""
+
+    pass
+
+
+def _auto_num_workers() -> int:
+    """Picks the number of DataLoader workers from the CPU count.
+
+    One CPU is left for the main process. Batches are small, so more than
+    defaults.MAX_AUTO_NUM_WORKERS workers rarely helps.
+
+    Returns:
+        int.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on all platforms.
+        cpus = os.cpu_count() or 1
+    return max(1, min(cpus - 1, defaults.MAX_AUTO_NUM_WORKERS))
 
 
 class DataModule(pl.LightningDataModule):
@@ -14,7 +46,18 @@ class DataModule(pl.LightningDataModule):
 
     parser: tsv.TsvParser
     index: indexes.Index
+    cache_dir: Optional[str]
     batch_size: int
+    bucket_by_length: bool
+    max_tokens_per_batch: Optional[int]
+    streaming: bool
+    shuffle_buffer_size: int
+    parse_processes: int
+    num_workers: int
+    pin_memory: bool
+    persistent_workers: bool
+    prefetch_factor: int
+    _encoded: Dict[str, Dict[str, datasets.EncodedColumn]]
     collator: collators.Collator
 
     def __init__(
@@ -36,13 +79,36 @@ class DataModule(pl.LightningDataModule):
         target_sep: str = defaults.TARGET_SEP,
         # Collator options.
         batch_size=defaults.BATCH_SIZE,
+        bucket_by_length: bool = defaults.BUCKET_BY_LENGTH,
+        max_tokens_per_batch: Optional[int] = None,
         separate_features: bool = False,
         max_source_length: int = defaults.MAX_SOURCE_LENGTH,
         max_target_length: int = defaults.MAX_TARGET_LENGTH,
         # Indexing.
         index: Optional[indexes.Index] = None,
+        # Caching.
+        cache_dir: Optional[str] = None,
+        # Streaming.
+        streaming: bool = defaults.STREAMING,
+        shuffle_buffer_size: int = defaults.SHUFFLE_BUFFER_SIZE,
+        # Parsing.
+        parse_processes: int = defaults.PARSE_PROCESSES,
+        # Loading.
+        num_workers: Optional[int] = None,
+        pin_memory: Optional[bool] = None,
+        persistent_workers: bool = defaults.PERSISTENT_WORKERS,
+        prefetch_factor: int = defaults.PREFETCH_FACTOR,
     ):
         super().__init__()
+        if streaming and (
+            bucket_by_length
+            or max_tokens_per_batch is not None
+            or cache_dir is not None
+        ):
+            raise Error(
+                "Streaming is incompatible with bucketing by length, "
+                "token-budget batching, and caching"
+            )
         self.parser = tsv.TsvParser(
             source_col=source_col,
             features_col=features_col,
@@ -56,7 +122,24 @@ class DataModule(pl.LightningDataModule):
         self.predict = predict
         self.test = test
         self.batch_size = batch_size
+        self.bucket_by_length = bucket_by_length
+        self.max_tokens_per_batch = max_tokens_per_batch
         self.separate_features = separate_features
+        self.cache_dir = cache_dir
+        self.streaming = streaming
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.num_workers = (
+            num_workers if num_workers is not None else _auto_num_workers()
+        )
+        # Pinned memory only speeds up copies to a CUDA device.
+        self.pin_memory = (
+            pin_memory if pin_memory is not None else torch.cuda.is_available()
+        )
+        self.persistent_workers = persistent_workers
+        self.prefetch_factor = prefetch_factor
+        self.parse_processes = parse_processes
+        # Encoded samples from the pass which builds the index, by path.
+        self._encoded = {}
         self.index = index if index is not None else self._make_index()
         self.collator = collators.Collator(
             pad_idx=self.index.pad_idx,
@@ -71,37 +154,40 @@ class DataModule(pl.LightningDataModule):
         )
 
     def _make_index(self) -> indexes.Index:
-        # Computes index.
-        source_vocabulary: Set[str] = set()
-        features_vocabulary: Set[str] = set()
-        target_vocabulary: Set[str] = set()
+        # Computes index, keeping the encoded samples unless streaming.
+        encoder = datasets.ProvisionalEncoder(self.parser)
+        provisional = {}
         for path in self.paths:
-            if self.has_features:
-                if self.has_target:
-                    for source, features, target in self.parser.samples(path):
-                        source_vocabulary.update(source)
-                        features_vocabulary.update(features)
-                        target_vocabulary.update(target)
-                else:
-                    for source, features in self.parser.samples(path):
-                        source_vocabulary.update(source)
-                        features_vocabulary.update(features)
-            elif self.has_target:
-                for source, target in self.parser.samples(path):
-                    source_vocabulary.update(source)
-                    target_vocabulary.update(target)
+            if self.streaming:
+                for sample in self.parser.samples(path):
+                    encoder.encode_sample(sample)
             else:
-                for source in self.parser.samples(path):
-                    source_vocabulary.update(source)
-        return indexes.Index(
-            source_vocabulary=sorted(source_vocabulary),
+                provisional[path] = parallel.encode_samples(
+                    encoder, path, self.parse_processes
+                )
+        source_vocabulary = encoder.source_vocabulary
+        features_vocabulary = encoder.features_vocabulary
+        target_vocabulary = encoder.target_vocabulary
+        index = indexes.Index(
+            source_vocabulary=source_vocabulary,
             features_vocabulary=(
-                sorted(features_vocabulary) if features_vocabulary else None
+                features_vocabulary if features_vocabulary else None
             ),
             target_vocabulary=(
-                sorted(target_vocabulary) if target_vocabulary else None
+                target_vocabulary if target_vocabulary else None
             ),
         )
+        self._encoded = {
+            path: encoder.finalize(columns, index)
+            for path, columns in provisional.items()
+        }
+        # Caches the samples just encoded, once, rather than each time a
+        # dataloader is built.
+        if self.cache_dir is not None:
+            cache = caches.Cache(self.cache_dir, index, self.parser)
+            for path, columns in self._encoded.items():
+                cache.save(path, columns)
+        return index
 
     # Helpers.
 
@@ -149,48 +235,114 @@ class DataModule(pl.LightningDataModule):
                 self.index.source_vocab_size + self.index.features_vocab_size
             )
 
-    def _dataset(self, path: str) -> datasets.Dataset:
-        return datasets.Dataset(
-            list(self.parser.samples(path)),
-            self.index,
-            self.parser,
+    def _dataset(
+        self, path: str, shuffle: bool = False
+    ) -> datasets.BaseDataset:
+        if self.streaming:
+            return datasets.IterableDataset(
+                self.index,
+                self.parser,
+                path,
+                self.shuffle_buffer_size if shuffle else 0,
+            )
+        if path in self._encoded:
+            columns = self._encoded[path]
+        elif self.cache_dir is not None:
+            cache = caches.Cache(
+                self.cache_dir, self.index, self.parser, self.parse_processes
+            )
+            columns = cache.load(path)
+        else:
+            encoder = datasets.Encoder(self.index, self.parser)
+            columns = parallel.encode_samples(
+                encoder, path, self.parse_processes
+            )
+        return datasets.Dataset(self.index, self.parser, **columns)
+
+    @property
+    def train_dataset(self) -> datasets.BaseDataset:
+        """The training dataset, e.g., for building the expert."""
+        assert self.train is not None, "no train path"
+        return self._dataset(self.train)
+
+    def _dataloader(
+        self,
+        path: str,
+        scale: int = 1,
+        shuffle: bool = False,
+        in_order: bool = False,
+    ) -> data.DataLoader:
+        """Creates a dataloader.
+
+        Args:
+            path (str): path to the TSV file.
+            scale (int, optional): multiplier for the batch size, or for the
+                token budget.
+            shuffle (bool, optional).
+            in_order (bool, optional): whether batches must be yielded in the
+                order of the data, as when predicting.
+
+        Returns:
+            data.DataLoader.
+        """
+        dataset = self._dataset(path, shuffle)
+        num_workers = self.num_workers
+        if self.streaming and in_order:
+            # Streaming workers read disjoint shards of the file, and their
+            # batches are interleaved, so only one preserves the order.
+            num_workers = min(num_workers, 1)
+        kwargs = {
+            "collate_fn": self.collator,
+            "num_workers": num_workers,
+            "pin_memory": self.pin_memory,
+        }
+        if num_workers > 0:
+            kwargs["persistent_workers"] = self.persistent_workers
+            kwargs["prefetch_factor"] = self.prefetch_factor
+        if self.streaming:
+            return data.DataLoader(
+                dataset, batch_size=scale * self.batch_size, **kwargs
+            )
+        if self.max_tokens_per_batch is not None:
+            batch_sampler_cls = samplers.TokenBudgetBatchSampler
+            batch_size = scale * self.max_tokens_per_batch
+        elif self.bucket_by_length:
+            batch_sampler_cls = samplers.LengthBucketingBatchSampler
+            batch_size = scale * self.batch_size
+        else:
+            return data.DataLoader(
+                dataset,
+                batch_size=scale * self.batch_size,
+                shuffle=shuffle,
+                **kwargs,
+            )
+        sampler = (
+            data.RandomSampler(dataset)
+            if shuffle
+            else data.SequentialSampler(dataset)
+        )
+        return data.DataLoader(
+            dataset,
+            batch_sampler=batch_sampler_cls(sampler, batch_size),
+            **kwargs,
         )
 
     # Required API.
 
     def train_dataloader(self) -> data.DataLoader:
         assert self.train is not None, "no train path"
-        return data.DataLoader(
-            self._dataset(self.train),
-            collate_fn=self.collator,
-            batch_size=self.batch_size,
-            shuffle=True,
-            num_workers=1,
-        )
+        return self._dataloader(self.train, shuffle=True)
 
     def val_dataloader(self) -> data.DataLoader:
         assert self.val is not None, "no val path"
-        return data.DataLoader(
-            self._dataset(self.val),
-            collate_fn=self.collator,
-            batch_size=2 * self.batch_size,  # Because no gradients.
-            num_workers=1,
-        )
+        # Larger batches because no gradients.
+        return self._dataloader(self.val, scale=2)
 
     def predict_dataloader(self) -> data.DataLoader:
         assert self.predict is not None, "no predict path"
-        return data.DataLoader(
-            self._dataset(self.predict),
-            collate_fn=self.collator,
-            batch_size=self.batch_size,  # Because no gradients.
-            num_workers=1,
-        )
+        return self._dataloader(self.predict, in_order=True)
 
     def test_dataloader(self) -> data.DataLoader:
         assert self.test is not None, "no test path"
-        return data.DataLoader(
-            self._dataset(self.test),
-            collate_fn=self.collator,
-            batch_size=2 * self.batch_size,  # Because no gradients.
-            num_workers=1,
-        )
+        # Larger batches because no gradients.
+        return self._dataloader(self.test, scale=2)
@@ -1,15 +1,13 @@
-"""Datasets and related utilities.
-
-Anything which has a tensor member should inherit from nn.Module, run the
-superclass constructor, and register the tensor as a buffer. This enables the
-Trainer to move them to the appropriate device."""
+"""Datasets and related utilities."""
 
 import dataclasses
+import functools
+import random
 
-from typing import Iterator, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
+import numpy
 import torch
-from torch import nn
 from torch.utils import data
 
 from .. import special
@@ -17,10 +15,13 @@ from .. import special
 from . import indexes, tsv
 
 
-class Item(nn.Module):
+class Item:
     """Source tensor, with optional features and target tensors.
 
-    This represents a single item or observation."""
+    This represents a single item or observation. It uses __slots__ since one
+    is constructed for every sample."""
+
+    __slots__ = ("source", "features", "target")
 
     source: torch.Tensor
     features: Optional[torch.Tensor]
@@ -34,10 +35,9 @@ class Item(nn.Module):
             features (torch.Tensor, optional).
             target (torch.Tensor, optional).
         """
-        super().__init__()
-        self.register_buffer("source", source)
-        self.register_buffer("features", features)
-        self.register_buffer("target", target)
+        self.source = source
+        self.features = features
+        self.target = target
 
     @property
     def has_features(self):
@@ -49,81 +49,359 @@ class Item(nn.Module):
 
 
 @dataclasses.dataclass
-class Dataset(data.Dataset):
-    """Datatset class."""
+class EncodedColumn:
+    """A column of encoded sequences, stored as flat arrays.
 
-    samples: List[List[str]]
-    index: indexes.Index  # Usually copied from the DataModule.
-    parser: tsv.TsvParser  # Ditto.
+    The symbol indices of all sequences are concatenated into a single int32
+    array; the i-th sequence occupies tokens[offsets[i]:offsets[i + 1]]. The
+    arrays may be memory-mapped, in which case retrieving a sequence is a
+    zero-copy slice."""
 
-    @property
-    def has_features(self) -> bool:
-        return self.parser.has_features
+    tokens: numpy.ndarray
+    offsets: numpy.ndarray
 
-    @property
-    def has_target(self) -> bool:
-        return self.parser.has_target
+    @classmethod
+    def from_sequences(cls, sequences: Iterable[List[int]]) -> "EncodedColumn":
+        """Builds the column from encoded sequences.
+
+        Args:
+            sequences (Iterable[List[int]]).
+
+        Returns:
+            EncodedColumn.
+        """
+        tokens = []
+        offsets = [0]
+        for sequence in sequences:
+            tokens.extend(sequence)
+            offsets.append(len(tokens))
+        return cls(
+            numpy.array(tokens, dtype=numpy.int32),
+            numpy.array(offsets, dtype=numpy.int64),
+        )
+
+    @classmethod
+    def concatenate(cls, columns: List["EncodedColumn"]) -> "EncodedColumn":
+        """Concatenates columns.
+
+        Args:
+            columns (List[EncodedColumn]).
+
+        Returns:
+            EncodedColumn.
+        """
+        tokens = numpy.concatenate([column.tokens for column in columns])
+        offsets = [numpy.zeros(1, dtype=numpy.int64)]
+        start = 0
+        for column in columns:
+            offsets.append(column.offsets[1:] + start)
+            start += len(column.tokens)
+        return cls(tokens, numpy.concatenate(offsets))
+
+    def lengths(self) -> numpy.ndarray:
+        """Computes the lengths of all the sequences in the column.
+
+        Returns:
+            numpy.ndarray.
+        """
+        return numpy.diff(self.offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx: int) -> torch.Tensor:
+        start = self.offsets[idx]
+        end = self.offsets[idx + 1]
+        return torch.from_numpy(self.tokens[start:end])
+
+
+@dataclasses.dataclass
+class Encoder:
+    """Encodes samples as sequences of indices."""
+
+    index: indexes.Index  # Usually copied from the DataModule.
+    parser: tsv.TsvParser  # Ditto.
 
     def _encode(
         self,
         symbols: List[str],
         symbol_map: indexes.SymbolMap,
-    ) -> torch.Tensor:
-        """Encodes a sequence as a tensor of indices with string boundary IDs.
+    ) -> List[int]:
+        """Encodes a sequence as a list of indices.
 
         Args:
             symbols (List[str]): symbols to be encoded.
             symbol_map (indexes.SymbolMap): symbol map to encode with.
 
         Returns:
-            torch.Tensor: the encoded tensor.
-        """
-        return torch.tensor(
-            [
-                symbol_map.index(symbol, self.index.unk_idx)
-                for symbol in symbols
-            ],
-            dtype=torch.long,
-        )
+            List[int]: the encoded sequence.
+        """
+        unk_idx = self.index.unk_idx
+        return [symbol_map.index(symbol, unk_idx) for symbol in symbols]
 
-    def encode_source(self, symbols: List[str]) -> torch.Tensor:
+    def encode_source(self, symbols: List[str]) -> List[int]:
         """Encodes a source string, padding with start and end tags.
 
         Args:
             symbols (List[str]).
 
         Returns:
-            torch.Tensor.
+            List[int].
         """
         wrapped = [special.START]
         wrapped.extend(symbols)
         wrapped.append(special.END)
         return self._encode(wrapped, self.index.source_map)
 
-    def encode_features(self, symbols: List[str]) -> torch.Tensor:
+    def encode_features(self, symbols: List[str]) -> List[int]:
         """Encodes a features string.
 
         Args:
             symbols (List[str]).
 
         Returns:
-            torch.Tensor.
+            List[int].
         """
         return self._encode(symbols, self.index.features_map)
 
-    def encode_target(self, symbols: List[str]) -> torch.Tensor:
-        """Encodes a features string, padding with end tags.
+    def encode_target(self, symbols: List[str]) -> List[int]:
+        """Encodes a target string, padding with end tags.
 
         Args:
             symbols (List[str]).
 
         Returns:
-            torch.Tensor.
+            List[int].
         """
         wrapped = symbols.copy()
         wrapped.append(special.END)
         return self._encode(wrapped, self.index.target_map)
 
+    def encode_sample(
+        self, sample: Any
+    ) -> Tuple[List[int], Optional[List[int]], Optional[List[int]]]:
+        """Encodes a sample, as yielded by the parser.
+
+        Args:
+            sample (Any).
+
+        Returns:
+            Tuple[List[int], Optional[List[int]], Optional[List[int]]]:
+                source, features, and target; features and target are None
+                unless the parser provides them.
+        """
+        features = None
+        target = None
+        if self.parser.has_features:
+            if self.parser.has_target:
+                source_symbols, features_symbols, target_symbols = sample
+                target = self.encode_target(target_symbols)
+            else:
+                source_symbols, features_symbols = sample
+            features = self.encode_features(features_symbols)
+        elif self.parser.has_target:
+            source_symbols, target_symbols = sample
+            target = self.encode_target(target_symbols)
+        else:
+            source_symbols = sample
+        return self.encode_source(source_symbols), features, target
+
+    def encode_item(self, sample: Any) -> Item:
+        """Encodes a sample, as yielded by the parser, as an item.
+
+        Args:
+            sample (Any).
+
+        Returns:
+            Item.
+        """
+        return Item(
+            *(
+                (
+                    torch.tensor(encoded, dtype=torch.int32)
+                    if encoded is not None
+                    else None
+                )
+                for encoded in self.encode_sample(sample)
+            )
+        )
+
+    def encode_samples(
+        self, samples: Iterable[Any]
+    ) -> Dict[str, EncodedColumn]:
+        """Encodes samples, as yielded by the parser, into columns.
+
+        Args:
+            samples (Iterable[Any]).
+
+        Returns:
+            Dict[str, EncodedColumn]: columns keyed by name; features and
+                target are only present if the parser provides them.
+        """
+        source = []
+        features = []
+        target = []
+        for sample in samples:
+            encoded_source, encoded_features, encoded_target = (
+                self.encode_sample(sample)
+            )
+            source.append(encoded_source)
+            features.append(encoded_features)
+            target.append(encoded_target)
+        columns = {"source": EncodedColumn.from_sequences(source)}
+        if self.parser.has_features:
+            columns["features"] = EncodedColumn.from_sequences(features)
+        if self.parser.has_target:
+            columns["target"] = EncodedColumn.from_sequences(target)
+        return columns
+
+
+class ProvisionalEncoder(Encoder):
+    """Encodes samples before the index is built.
+
+    While the vocabularies are being collected, each symbol is assigned a
+    provisional index in order of first occurrence. Once the index is built,
+    the provisionally encoded columns are mapped onto it, so that each file
+    need only be parsed once.
+    """
+
+    source_table: Dict[str, int]
+    features_table: Dict[str, int]
+    target_table: Dict[str, int]
+
+    def __init__(self, parser: tsv.TsvParser):
+        super().__init__(None, parser)
+        self.source_table = {}
+        self.features_table = {}
+        self.target_table = {}
+
+    @staticmethod
+    def _encode_provisional(
+        symbols: List[str], table: Dict[str, int]
+    ) -> List[int]:
+        return [table.setdefault(symbol, len(table)) for symbol in symbols]
+
+    def encode_source(self, symbols: List[str]) -> List[int]:
+        wrapped = [special.START]
+        wrapped.extend(symbols)
+        wrapped.append(special.END)
+        return self._encode_provisional(wrapped, self.source_table)
+
+    def encode_features(self, symbols: List[str]) -> List[int]:
+        return self._encode_provisional(symbols, self.features_table)
+
+    def encode_target(self, symbols: List[str]) -> List[int]:
+        wrapped = symbols.copy()
+        wrapped.append(special.END)
+        return self._encode_provisional(wrapped, self.target_table)
+
+    @staticmethod
+    def _vocabulary(table: Dict[str, int]) -> List[str]:
+        return sorted(
+            symbol for symbol in table if symbol not in special.SPECIAL
+        )
+
+    @property
+    def source_vocabulary(self) -> List[str]:
+        return self._vocabulary(self.source_table)
+
+    @property
+    def features_vocabulary(self) -> List[str]:
+        return self._vocabulary(self.features_table)
+
+    @property
+    def target_vocabulary(self) -> List[str]:
+        return self._vocabulary(self.target_table)
+
+    @property
+    def tables(self) -> Dict[str, Dict[str, int]]:
+        return {
+            "source": self.source_table,
+            "features": self.features_table,
+            "target": self.target_table,
+        }
+
+    @staticmethod
+    def _remap(
+        columns: Dict[str, EncodedColumn], lookups: Dict[str, numpy.ndarray]
+    ) -> Dict[str, EncodedColumn]:
+        return {
+            name: EncodedColumn(lookups[name][column.tokens], column.offsets)
+            for name, column in columns.items()
+        }
+
+    def absorb(
+        self, other: "ProvisionalEncoder", columns: Dict[str, EncodedColumn]
+    ) -> Dict[str, EncodedColumn]:
+        """Maps columns encoded by another provisional encoder onto this one.
+
+        This is used to merge the results of encoding in parallel.
+
+        Args:
+            other (ProvisionalEncoder).
+            columns (Dict[str, EncodedColumn]): columns provisionally encoded
+                by the other encoder.
+
+        Returns:
+            Dict[str, EncodedColumn].
+        """
+        lookups = {}
+        for name, table in self.tables.items():
+            lookups[name] = numpy.array(
+                [
+                    table.setdefault(symbol, len(table))
+                    for symbol in other.tables[name]
+                ],
+                dtype=numpy.int32,
+            )
+        return self._remap(columns, lookups)
+
+    def finalize(
+        self, columns: Dict[str, EncodedColumn], index: indexes.Index
+    ) -> Dict[str, EncodedColumn]:
+        """Maps provisionally encoded columns onto the index.
+
+        Args:
+            columns (Dict[str, EncodedColumn]): provisionally encoded
+                columns, as returned by encode_samples.
+            index (indexes.Index).
+
+        Returns:
+            Dict[str, EncodedColumn].
+        """
+        unk_idx = index.unk_idx
+        symbol_maps = {
+            "source": index.source_map,
+            "features": index.features_map,
+            "target": index.target_map,
+        }
+        lookups = {}
+        for name in columns:
+            lookups[name] = numpy.array(
+                [
+                    symbol_maps[name].index(symbol, unk_idx)
+                    for symbol in self.tables[name]
+                ],
+                dtype=numpy.int32,
+            )
+        return self._remap(columns, lookups)
+
+
+@dataclasses.dataclass
+class BaseDataset:
+    """Base class for datasets, providing decoding."""
+
+    index: indexes.Index  # Usually copied from the DataModule.
+    parser: tsv.TsvParser  # Ditto.
+
+    @property
+    def has_features(self) -> bool:
+        return self.parser.has_features
+
+    @property
+    def has_target(self) -> bool:
+        return self.parser.has_target
+
     # Decoding.
 
     def _decode(
@@ -133,6 +411,9 @@ class Dataset(data.Dataset):
     ) -> Iterator[List[str]]:
         """Decodes the tensor of indices into lists of symbols.
 
+        Decoding stops at the first END symbol, and other special symbols are
+        skipped.
+
         Args:
             indices (torch.Tensor): 2d tensor of indices.
             symbol_map (indexes.SymbolMap).
@@ -140,12 +421,15 @@ class Dataset(data.Dataset):
         Yields:
             List[str]: Decoded symbols.
         """
-        for idx in indices.cpu().numpy():
-            yield [
-                symbol_map.symbol(c)
-                for c in idx
-                if c not in self.index.special_idx
-            ]
+        indices = indices.cpu().numpy()
+        special_mask = numpy.zeros(len(symbol_map), dtype=bool)
+        special_mask[list(self.index.special_idx)] = True
+        # Masks the END symbol and everything after it.
+        ended = numpy.cumsum(indices == self.index.end_idx, axis=1) > 0
+        keep = ~(ended | special_mask[indices])
+        symbols = numpy.take(symbol_map.symbol_array, indices)
+        for row_symbols, row_keep in zip(symbols, keep):
+            yield row_symbols[row_keep].tolist()
 
     def decode_source(
         self,
@@ -174,8 +458,8 @@ class Dataset(data.Dataset):
         Yields:
             str: Decoded features strings.
         """
-        for symbols in self._decode(indices, self.index.target_map):
-            yield self.parser.feature_string(symbols)
+        for symbols in self._decode(indices, self.index.features_map):
+            yield self.parser.features_string(symbols)
 
     def decode_target(
         self,
@@ -192,10 +476,37 @@ class Dataset(data.Dataset):
         for symbols in self._decode(indices, self.index.target_map):
             yield self.parser.target_string(symbols)
 
+
+@dataclasses.dataclass
+class Dataset(BaseDataset, data.Dataset):
+    """Datatset class.
+
+    Samples are stored pre-encoded, one EncodedColumn per column, so that
+    retrieving an item does no per-symbol work."""
+
+    source: EncodedColumn
+    features: Optional[EncodedColumn] = None
+    target: Optional[EncodedColumn] = None
+
+    # The samplers consult these on every sort, so they are computed once.
+
+    @functools.cached_property
+    def source_lengths(self) -> numpy.ndarray:
+        """Lengths of the sources, including any features."""
+        lengths = self.source.lengths()
+        if self.has_features:
+            lengths = lengths + self.features.lengths()
+        return lengths
+
+    @functools.cached_property
+    def target_lengths(self) -> Optional[numpy.ndarray]:
+        """Lengths of the targets, if present."""
+        return self.target.lengths() if self.has_target else None
+
     # Required API.
 
     def __len__(self) -> int:
-        return len(self.samples)
+        return len(self.source)
 
     def __getitem__(self, idx: int) -> Item:
         """Retrieves item by index.
@@ -206,26 +517,66 @@ class Dataset(data.Dataset):
         Returns:
             Item.
         """
-        if self.has_features:
-            if self.has_target:
-                source, features, target = self.samples[idx]
-                return Item(
-                    source=self.encode_source(source),
-                    features=self.encode_features(features),
-                    target=self.encode_target(target),
-                )
-            else:
-                source, features = self.samples[idx]
-                return Item(
-                    source=self.encode_source(source),
-                    features=self.encode_features(features),
-                )
-        elif self.has_target:
-            source, target = self.samples[idx]
-            return Item(
-                source=self.encode_source(source),
-                target=self.encode_target(target),
-            )
+        return Item(
+            source=self.source[idx],
+            features=self.features[idx] if self.has_features else None,
+            target=self.target[idx] if self.has_target else None,
+        )
+
+
+@dataclasses.dataclass
+class IterableDataset(BaseDataset, data.IterableDataset):
+    """Streaming dataset class.
+
+    Samples are parsed and encoded as they are read, so memory use does not
+    grow with the size of the file. Each DataLoader worker reads a disjoint
+    byte range of the file. If shuffle_buffer_size is greater than 1, items
+    are shuffled approximately, by drawing them at random from a buffer of
+    that size."""
+
+    path: str
+    shuffle_buffer_size: int = 0
+
+    def _shuffle(self, items: Iterator[Item]) -> Iterator[Item]:
+        """Shuffles items using a bounded buffer.
+
+        Args:
+            items (Iterator[Item]).
+
+        Yields:
+            Item.
+        """
+        # Draws the seed from the torch RNG, which the Trainer seeds and the
+        # DataLoader reseeds for each worker and each epoch.
+        rng = random.Random(
+            torch.empty((), dtype=torch.int64).random_().item()
+        )
+        buffer = []
+        for item in items:
+            if len(buffer) < self.shuffle_buffer_size:
+                buffer.append(item)
+                continue
+            i = rng.randrange(self.shuffle_buffer_size)
+            yield buffer[i]
+            buffer[i] = item
+        rng.shuffle(buffer)
+        yield from buffer
+
+    # Required API.
+
+    def __iter__(self) -> Iterator[Item]:
+        worker_info = data.get_worker_info()
+        if worker_info is None:
+            shard, num_shards = 0, 1
         else:
-            source = self.samples[idx]
-            return Item(source=self.encode_source(source))
+            shard, num_shards = worker_info.id, worker_info.num_workers
+        encoder = Encoder(self.index, self.parser)
+        items = (
+            encoder.encode_item(sample)
+            for sample in self.parser.shard_samples(
+                self.path, shard, num_shards
+            )
+        )
+        if self.shuffle_buffer_size > 1:
+            items = self._shuffle(items)
+        yield from items
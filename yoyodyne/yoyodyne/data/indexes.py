@@ -1,11 +1,33 @@
-"""Symbol index."""
+"""Symbol index.
 
+Indices are serialized in a compact binary format: a header consisting of
+MAGIC and a little-endian uint32 FORMAT_VERSION, followed by the source,
+features, and target symbol tables. Each table is an int32 count (-1 if the
+table is absent) followed by that many symbols, each a uint32 byte length
+followed by the UTF-8 encoding of the symbol. Pickled indices, as written by
+earlier versions, can still be read.
+"""
+
+import hashlib
 import os
 import pickle
-from typing import Dict, List, Optional, Set
+import struct
+from typing import BinaryIO, Dict, List, Optional, Set
+
+import numpy
 
 from .. import special
 
+MAGIC = b"YOYOIDX\0"
+# Increment this whenever the on-disk layout changes.
+FORMAT_VERSION = 1
+
+
+class Error(Exception):
+    """Module-specific exception."""
+
+    pass
+
 
 class SymbolMap:
     """Tracks mapping from index to symbol and symbol to index."""
@@ -16,7 +38,56 @@ class SymbolMap:
     def __init__(self, vocabulary: List[str]):
         # Keeps special.SPECIAL first to maintain overlap with features.
         self._index2symbol = special.SPECIAL + vocabulary
-        self._symbol2index = {c: i for i, c in enumerate(self._index2symbol)}
+        self._symbol2index_cache = None
+        self._symbol_array_cache = None
+
+    @classmethod
+    def from_symbols(cls, index2symbol: List[str]) -> "SymbolMap":
+        """Builds the map from a complete list of symbols.
+
+        Args:
+            index2symbol (List[str]): all symbols, including special ones,
+                in index order.
+
+        Returns:
+            SymbolMap.
+        """
+        symbol_map = cls.__new__(cls)
+        symbol_map._index2symbol = index2symbol
+        symbol_map._symbol2index_cache = None
+        symbol_map._symbol_array_cache = None
+        return symbol_map
+
+    @property
+    def _symbol2index(self) -> Dict[str, int]:
+        # This is built on first use, since decoding does not need it.
+        if self._symbol2index_cache is None:
+            self._symbol2index_cache = dict(
+                zip(self._index2symbol, range(len(self._index2symbol)))
+            )
+        return self._symbol2index_cache
+
+    @property
+    def symbol_array(self) -> numpy.ndarray:
+        """The symbols as an array, for vectorized lookup by index.
+
+        Returns:
+            numpy.ndarray.
+        """
+        if self._symbol_array_cache is None:
+            self._symbol_array_cache = numpy.array(
+                self._index2symbol, dtype=object
+            )
+        return self._symbol_array_cache
+
+    def __getstate__(self) -> Dict[str, List[str]]:
+        return {"_index2symbol": self._index2symbol}
+
+    def __setstate__(self, state: Dict[str, object]) -> None:
+        # Pickles written by earlier versions also store the reverse map.
+        self._index2symbol = state["_index2symbol"]
+        self._symbol2index_cache = state.get("_symbol2index")
+        self._symbol_array_cache = None
 
     def __len__(self) -> int:
         return len(self._index2symbol)
@@ -88,6 +159,9 @@ class Index:
     def read(cls, model_dir: str, experiment: str) -> "Index":
         """Loads index.
 
+        If there is no index in the binary format, this falls back to a
+        pickled index, as written by earlier versions.
+
         Args:
             model_dir (str).
             experiment (str).
@@ -95,18 +169,77 @@ class Index:
         Returns:
             Index.
         """
+        path = cls.index_path(model_dir, experiment)
+        if not os.path.exists(path):
+            legacy_path = cls.legacy_index_path(model_dir, experiment)
+            if os.path.exists(legacy_path):
+                return cls._read_pickle(legacy_path)
+        with open(path, "rb") as source:
+            return cls._read_binary(source)
+
+    @classmethod
+    def _read_pickle(cls, path: str) -> "Index":
         index = cls.__new__(cls)
-        path = index.index_path(model_dir, experiment)
         with open(path, "rb") as source:
             dictionary = pickle.load(source)
         for key, value in dictionary.items():
             setattr(index, key, value)
         return index
 
+    @staticmethod
+    def _read_struct(source: BinaryIO, fmt: str) -> int:
+        size = struct.calcsize(fmt)
+        buffer = source.read(size)
+        if len(buffer) != size:
+            raise Error("Truncated index file")
+        (value,) = struct.unpack(fmt, buffer)
+        return value
+
+    @classmethod
+    def _read_binary(cls, source: BinaryIO) -> "Index":
+        if source.read(len(MAGIC)) != MAGIC:
+            raise Error("Not an index file")
+        version = cls._read_struct(source, "<I")
+        if version > FORMAT_VERSION:
+            raise Error(
+                f"Index format version {version} is newer than supported "
+                f"version {FORMAT_VERSION}"
+            )
+        symbol_maps = []
+        for _ in range(3):
+            count = cls._read_struct(source, "<i")
+            if count < 0:
+                symbol_maps.append(None)
+                continue
+            symbols = []
+            for _ in range(count):
+                length = cls._read_struct(source, "<I")
+                buffer = source.read(length)
+                if len(buffer) != length:
+                    raise Error("Truncated index file")
+                symbols.append(buffer.decode("utf-8"))
+            symbol_maps.append(SymbolMap.from_symbols(symbols))
+        index = cls.__new__(cls)
+        index.source_map, index.features_map, index.target_map = symbol_maps
+        return index
+
     @staticmethod
     def index_path(model_dir: str, experiment: str) -> str:
         """Computes path for the index file.
 
+        Args:
+            model_dir (str).
+            experiment (str).
+
+        Returns:
+            str.
+        """
+        return f"{model_dir}/{experiment}/index.bin"
+
+    @staticmethod
+    def legacy_index_path(model_dir: str, experiment: str) -> str:
+        """Computes path for the pickled index file of earlier versions.
+
         Args:
             model_dir (str).
             experiment (str).
@@ -126,10 +259,45 @@ class Index:
         path = self.index_path(model_dir, experiment)
         os.makedirs(os.path.dirname(path), exist_ok=True)
         with open(path, "wb") as sink:
-            pickle.dump(vars(self), sink)
+            sink.write(MAGIC)
+            sink.write(struct.pack("<I", FORMAT_VERSION))
+            for symbol_map in [
+                self.source_map,
+                self.features_map,
+                self.target_map,
+            ]:
+                if symbol_map is None:
+                    sink.write(struct.pack("<i", -1))
+                    continue
+                sink.write(struct.pack("<i", len(symbol_map)))
+                for symbol in symbol_map._index2symbol:
+                    encoded = symbol.encode("utf-8")
+                    sink.write(struct.pack("<I", len(encoded)))
+                    sink.write(encoded)
 
     # Properties.
 
+    @property
+    def checksum(self) -> str:
+        """Computes a digest of the symbol tables.
+
+        Two indices with the same checksum encode all strings identically.
+
+        Returns:
+            str: hexadecimal digest.
+        """
+        hasher = hashlib.sha256()
+        for symbol_map in [
+            self.source_map,
+            self.features_map,
+            self.target_map,
+        ]:
+            symbols = (
+                symbol_map._index2symbol if symbol_map is not None else None
+            )
+            hasher.update(f"{symbols!r}\n".encode("utf-8"))
+        return hasher.hexdigest()
+
     @property
     def source_vocab_size(self) -> int:
         return len(self.source_map)
@@ -0,0 +1,64 @@
+"""Parallel encoding.
+
+A TSV file is split into byte ranges aligned to line boundaries (see
+tsv.TsvParser.shard_samples), which are parsed and encoded in a process pool.
+Each process returns encoded arrays rather than lists of symbols, and these
+are merged in order.
+"""
+
+import concurrent.futures
+from typing import Dict, Optional, Tuple
+
+from . import datasets
+
+
+def _encode_shard(
+    encoder: datasets.Encoder, path: str, shard: int, num_shards: int
+) -> Tuple[
+    Dict[str, datasets.EncodedColumn], Optional[datasets.ProvisionalEncoder]
+]:
+    columns = encoder.encode_samples(
+        encoder.parser.shard_samples(path, shard, num_shards)
+    )
+    # Provisional indices are only meaningful with the encoder's tables.
+    if isinstance(encoder, datasets.ProvisionalEncoder):
+        return columns, encoder
+    return columns, None
+
+
+def encode_samples(
+    encoder: datasets.Encoder, path: str, processes: int = 1
+) -> Dict[str, datasets.EncodedColumn]:
+    """Encodes a TSV file, in parallel if more than one process is requested.
+
+    This gives the same result as
+    `encoder.encode_samples(encoder.parser.samples(path))`. If the encoder is
+    a datasets.ProvisionalEncoder, its tables are updated too.
+
+    Args:
+        encoder (datasets.Encoder).
+        path (str).
+        processes (int): number of processes, and of shards.
+
+    Returns:
+        Dict[str, datasets.EncodedColumn].
+    """
+    if processes <= 1:
+        return encoder.encode_samples(encoder.parser.samples(path))
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        futures = [
+            pool.submit(_encode_shard, encoder, path, shard, processes)
+            for shard in range(processes)
+        ]
+        results = [future.result() for future in futures]
+    shards = []
+    for columns, shard_encoder in results:
+        if shard_encoder is not None:
+            columns = encoder.absorb(shard_encoder, columns)
+        shards.append(columns)
+    return {
+        name: datasets.EncodedColumn.concatenate(
+            [columns[name] for columns in shards]
+        )
+        for name in shards[0]
+    }
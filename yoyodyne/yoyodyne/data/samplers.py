@@ -0,0 +1,150 @@
+"""Batch samplers.
+
+These are passed to the DataLoader as `batch_sampler`, and yield lists of
+dataset indices, one list per batch. They follow the API of
+torch.utils.data.BatchSampler, since the Trainer may re-instantiate them
+(e.g., when predicting) as `cls(sampler, batch_size=..., drop_last=...)`.
+"""
+
+from typing import Iterator, List, Optional
+
+import numpy
+import torch
+from torch.utils import data
+
+
+class LengthBucketingBatchSampler(data.BatchSampler):
+    """Batches together items of similar length.
+
+    The indices drawn from the underlying sampler are stably sorted by source
+    length and then by target length and cut into batches, so each batch
+    needs little padding. If the underlying sampler is random, ties in length
+    are thus broken randomly, and the order of the batches is shuffled too.
+
+    The underlying sampler must draw from a datasets.Dataset.
+
+    Args:
+        sampler (data.Sampler).
+        batch_size (int).
+        drop_last (bool, optional).
+    """
+
+    def __init__(
+        self,
+        sampler: data.Sampler,
+        batch_size: int,
+        drop_last: bool = False,
+    ):
+        super().__init__(sampler, batch_size, drop_last)
+
+    @property
+    def shuffle(self) -> bool:
+        return isinstance(self.sampler, data.RandomSampler)
+
+    def _sort(self, order: numpy.ndarray) -> numpy.ndarray:
+        """Stably sorts indices by source length, then target length.
+
+        Args:
+            order (numpy.ndarray): indices in the order drawn.
+
+        Returns:
+            numpy.ndarray.
+        """
+        dataset = self.sampler.data_source
+        # numpy.lexsort is stable and sorts by the last key first, so ties are
+        # left in the order drawn.
+        keys = [dataset.source_lengths[order]]
+        if dataset.has_target:
+            keys.insert(0, dataset.target_lengths[order])
+        return order[numpy.lexsort(keys)]
+
+    def _batches(self, indices: numpy.ndarray) -> List[List[int]]:
+        indices = indices.tolist()
+        batches = [
+            indices[start : start + self.batch_size]  # noqa: E203
+            for start in range(0, len(indices), self.batch_size)
+        ]
+        if self.drop_last and batches and len(batches[-1]) < self.batch_size:
+            batches.pop()
+        return batches
+
+    def __iter__(self) -> Iterator[List[int]]:
+        order = numpy.fromiter(self.sampler, dtype=numpy.int64)
+        batches = self._batches(self._sort(order))
+        if self.shuffle:
+            # Uses the torch RNG so that seeding the trainer seeds this too.
+            for i in torch.randperm(len(batches)).tolist():
+                yield batches[i]
+        else:
+            yield from batches
+
+
+class TokenBudgetBatchSampler(LengthBucketingBatchSampler):
+    """Batches together items of similar length under a token budget.
+
+    Here `batch_size` is instead the maximum number of padded tokens, i.e.,
+    the number of items times the sum of the longest source and the longest
+    target, per batch. Items are sorted as in the LengthBucketingBatchSampler
+    and then greedily packed, so batches of short strings hold more items
+    than batches of long ones. An item which on its own exceeds the budget is
+    placed in a batch by itself. `drop_last` has no effect.
+
+    Lengths are those of the encoded strings, which include the start and end
+    symbols added to the source and the end symbol added to the target, so
+    they are the lengths which are actually padded.
+
+    Args:
+        sampler (data.Sampler).
+        batch_size (int): maximum number of padded tokens per batch.
+        drop_last (bool, optional).
+    """
+
+    _len: Optional[int]
+
+    def __init__(
+        self,
+        sampler: data.Sampler,
+        batch_size: int,
+        drop_last: bool = False,
+    ):
+        super().__init__(sampler, batch_size, drop_last)
+        self._len = None
+
+    def _batches(self, indices: numpy.ndarray) -> List[List[int]]:
+        dataset = self.sampler.data_source
+        source_lengths = dataset.source_lengths
+        target_lengths = (
+            dataset.target_lengths
+            if dataset.has_target
+            else numpy.zeros_like(source_lengths)
+        )
+        batches = []
+        batch = []
+        max_source_length = 0
+        max_target_length = 0
+        for index in indices.tolist():
+            source_length = max(max_source_length, source_lengths[index])
+            target_length = max(max_target_length, target_lengths[index])
+            if (
+                batch
+                and (len(batch) + 1) * (source_length + target_length)
+                > self.batch_size
+            ):
+                batches.append(batch)
+                batch = []
+                source_length = source_lengths[index]
+                target_length = target_lengths[index]
+            batch.append(index)
+            max_source_length = source_length
+            max_target_length = target_length
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def __len__(self) -> int:
+        # Items of equal length are interchangeable, so the number of batches
+        # does not depend on the order drawn, and is computed only once.
+        if self._len is None:
+            order = numpy.arange(len(self.sampler))
+            self._len = len(self._batches(self._sort(order)))
+        return self._len
@@ -6,7 +6,8 @@ separators.
 
 import csv
 import dataclasses
-from typing import Iterator, List, Tuple, Union
+import os
+from typing import Iterable, Iterator, List, Tuple, Union
 
 from .. import defaults
 
@@ -60,6 +61,48 @@ class TsvParser:
         with open(path, "r") as tsv:
             yield from csv.reader(tsv, delimiter="\t")
 
+    @staticmethod
+    def _byte_range(path: str, shard: int, num_shards: int) -> Tuple[int, int]:
+        """Computes the byte range for a shard of a file.
+
+        Args:
+            path (str).
+            shard (int): 0-based index of the shard.
+            num_shards (int).
+
+        Returns:
+            Tuple[int, int]: start and end offsets.
+        """
+        size = os.path.getsize(path)
+        return (
+            size * shard // num_shards,
+            size * (shard + 1) // num_shards,
+        )
+
+    @staticmethod
+    def _lines(path: str, start: int, end: int) -> Iterator[str]:
+        """Yields the lines which begin within a byte range.
+
+        Args:
+            path (str).
+            start (int): start offset.
+            end (int): end offset.
+
+        Yields:
+            str.
+        """
+        with open(path, "rb") as source:
+            if start > 0:
+                # Skips the line straddling the start of the range, unless it
+                # begins exactly there; that belongs to the previous range.
+                source.seek(start - 1)
+                source.readline()
+            while source.tell() < end:
+                line = source.readline()
+                if not line:
+                    break
+                yield line.decode("utf-8")
+
     @staticmethod
     def _get_string(row: List[str], col: int) -> str:
         """Returns a string from a row by index.
@@ -88,7 +131,41 @@ class TsvParser:
         ]
     ]:
         """Yields source, and features and/or target if available."""
-        for row in self._tsv_reader(path):
+        return self._samples(self._tsv_reader(path))
+
+    def shard_samples(
+        self, path: str, shard: int, num_shards: int
+    ) -> Iterator[
+        Union[
+            List[str],
+            Tuple[List[str], List[str]],
+            Tuple[List[str], List[str], List[str]],
+        ]
+    ]:
+        """Yields samples from one of several shards of a file.
+
+        The file is split into byte ranges of equal size, and a shard
+        consists of the lines beginning within its range, so the shards
+        are disjoint and jointly cover the file, and reading one requires no
+        pass over the others.
+
+        Args:
+            path (str).
+            shard (int): 0-based index of the shard.
+            num_shards (int).
+        """
+        start, end = self._byte_range(path, shard, num_shards)
+        rows = csv.reader(self._lines(path, start, end), delimiter="\t")
+        return self._samples(rows)
+
+    def _samples(self, rows: Iterable[List[str]]) -> Iterator[
+        Union[
+            List[str],
+            Tuple[List[str], List[str]],
+            Tuple[List[str], List[str], List[str]],
+        ]
+    ]:
+        for row in rows:
             source = self.source_symbols(
                 self._get_string(row, self.source_col)
             )
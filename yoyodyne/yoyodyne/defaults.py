@@ -10,6 +10,13 @@ SOURCE_SEP = ""
 TARGET_SEP = ""
 FEATURES_SEP = ";"
 TIED_VOCABULARY = True
+CACHE_ENCODED = False
+STREAMING = False
+SHUFFLE_BUFFER_SIZE = 10000
+PARSE_PROCESSES = 1
+MAX_AUTO_NUM_WORKERS = 8
+PERSISTENT_WORKERS = True
+PREFETCH_FACTOR = 2
 
 # Architecture arguments.
 ARCH = "attentive_lstm"
@@ -20,18 +27,23 @@ DECODER_LAYERS = 1
 EMBEDDING_SIZE = 128
 ENCODER_LAYERS = 1
 HIDDEN_SIZE = 512
+HMM_BAND_WIDTH = None
 MAX_SOURCE_LENGTH = 128
 MAX_TARGET_LENGTH = 128
 
 # Training arguments.
 BATCH_SIZE = 32
+BUCKET_BY_LENGTH = False
 BETA1 = 0.9
 BETA2 = 0.999
 DROPOUT = 0.2
 LABEL_SMOOTHING = 0.0
 LEARNING_RATE = 0.001
 ORACLE_EM_EPOCHS = 5
+ORACLE_EM_PROCESSES = 1
+ORACLE_ROLLOUT_PROCESSES = 1
 ORACLE_FACTOR = 1
+CACHE_SED_PARAMS = True
 OPTIMIZER = "adam"
 SAVE_TOP_K = 1
 LOG_WANDB = False
@@ -49,3 +61,6 @@ REDUCEONPLATEAU_PATIENCE = 10
 
 # Decoding arguments.
 BEAM_WIDTH = 1
+NBEST = 1
+LENGTH_NORMALIZATION = False
+COMPACT_DECODING = False
@@ -4,7 +4,6 @@ from __future__ import annotations
 import dataclasses
 
 import torch
-from torch.nn import functional
 
 
 class Error(Exception):
@@ -88,20 +87,27 @@ class Evaluator:
         golds: torch.Tensor,
         pad_idx: int,
     ) -> EvalItem:
-        if predictions.size(1) > golds.size(1):
-            predictions = predictions[:, : golds.size(1)]
-        elif predictions.size(1) < golds.size(1):
-            num_pads = (0, golds.size(1) - predictions.size(1))
-            predictions = functional.pad(
-                predictions, num_pads, "constant", pad_idx
-            )
-        # Gets the count of exactly matching tensors in the batch.
-        # -> B x max_seq_len.
-        corr_count = torch.where(
-            (predictions.to(golds.device) == golds).all(dim=1)
-        )[0].size()[0]
+        """Counts the predictions which exactly match the golds.
+
+        Predictions are truncated to, or treated as padded to, the length of
+        the golds.
+
+        Args:
+            predictions (torch.Tensor): B x seq_len.
+            golds (torch.Tensor): B x seq_len.
+            pad_idx (int): padding index.
+
+        Returns:
+            EvalItem.
+        """
+        length = min(predictions.size(1), golds.size(1))
+        predictions = predictions.to(golds.device)
+        # -> B.
+        correct = (predictions[:, :length] == golds[:, :length]).all(dim=1)
+        # Any gold symbols past the end of the predictions must be padding.
+        correct &= (golds[:, length:] == pad_idx).all(dim=1)
         return EvalItem(
-            num_correct=corr_count, num_predicted=predictions.size(0)
+            num_correct=int(correct.sum()), num_predicted=predictions.size(0)
         )
 
     @staticmethod
@@ -112,9 +118,9 @@ class Evaluator:
     ) -> torch.Tensor:
         """Finalizes predictions.
 
-        Cuts off tensors at the first end_idx, and replaces the rest of the
-        predictions with pad_idx, as these are erroneously decoded while the
-        rest of the batch is finishing decoding.
+        Replaces everything after the first end_idx with pad_idx, as these
+        are erroneously decoded while the rest of the batch is finishing
+        decoding.
 
         Args:
             predictions (torch.Tensor): prediction tensor.
@@ -124,34 +130,16 @@ class Evaluator:
         Returns:
             torch.Tensor: finalized predictions.
         """
-        # Not necessary if batch size is 1.
-        if predictions.size(0) == 1:
-            return predictions
-        for i, prediction in enumerate(predictions):
-            # Gets first instance of EOS.
-            eos = (prediction == end_idx).nonzero(as_tuple=False)
-            if len(eos) > 0 and eos[0].item() < len(prediction):
-                # If an EOS was decoded and it is not the last one in the
-                # sequence.
-                eos = eos[0]
-            else:
-                # Leaves predictions[i] alone.
-                continue
-            # Hack in case the first prediction is EOS. In this case
-            # torch.split will result in an error, so we change these 0's to
-            # 1's, which will make the entire sequence EOS as intended.
-            eos[eos == 0] = 1
-            symbols, *_ = torch.split(prediction, eos)
-            # Replaces everything after with PAD, to replace erroneous decoding
-            # While waiting on the entire batch to finish.
-            pads = (
-                torch.ones(
-                    len(prediction) - len(symbols), device=symbols.device
-                )
-                * pad_idx
-            )
-            pads[0] = end_idx
-            # Makes an in-place update to an inference tensor.
-            with torch.inference_mode():
-                predictions[i] = torch.cat((symbols, pads))
-        return predictions
+        is_end = predictions == end_idx
+        # argmax returns the first maximal index, i.e., that of the first EOS;
+        # rows without an EOS are left alone.
+        # -> B x 1.
+        first_end = torch.where(
+            is_end.any(dim=1),
+            is_end.to(torch.uint8).argmax(dim=1),
+            predictions.size(1),
+        ).unsqueeze(1)
+        positions = torch.arange(
+            predictions.size(1), device=predictions.device
+        )
+        return predictions.masked_fill(positions > first_end, pad_idx)
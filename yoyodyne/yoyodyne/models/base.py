@@ -4,7 +4,7 @@ This also includes init_embeddings, which has to go somewhere.
 """
 
 import argparse
-from typing import Callable, Dict, Optional
+from typing import Callable, Dict, Optional, Tuple, Union
 
 import pytorch_lightning as pl
 import torch
@@ -40,6 +40,9 @@ class BaseEncoderDecoder(pl.LightningModule):
     teacher_forcing: bool
     # Decoding arguments.
     beam_width: int
+    nbest: int
+    length_normalization: bool
+    compact_decoding: bool
     max_source_length: int
     max_target_length: int
     # Model arguments.
@@ -75,6 +78,9 @@ class BaseEncoderDecoder(pl.LightningModule):
         label_smoothing=defaults.LABEL_SMOOTHING,
         teacher_forcing=defaults.TEACHER_FORCING,
         beam_width=defaults.BEAM_WIDTH,
+        nbest=defaults.NBEST,
+        length_normalization=defaults.LENGTH_NORMALIZATION,
+        compact_decoding=defaults.COMPACT_DECODING,
         max_source_length=defaults.MAX_SOURCE_LENGTH,
         max_target_length=defaults.MAX_TARGET_LENGTH,
         encoder_layers=defaults.ENCODER_LAYERS,
@@ -103,6 +109,14 @@ class BaseEncoderDecoder(pl.LightningModule):
         self.label_smoothing = label_smoothing
         self.teacher_forcing = teacher_forcing
         self.beam_width = beam_width
+        if not 1 <= nbest <= beam_width:
+            raise Error(
+                f"Cannot return {nbest} hypotheses from a beam of "
+                f"{beam_width}"
+            )
+        self.nbest = nbest
+        self.length_normalization = length_normalization
+        self.compact_decoding = compact_decoding
         self.max_source_length = max_source_length
         self.max_target_length = max_target_length
         self.decoder_layers = decoder_layers
@@ -322,7 +336,7 @@ class BaseEncoderDecoder(pl.LightningModule):
         self,
         batch: data.PaddedBatch,
         batch_idx: int,
-    ) -> torch.Tensor:
+    ) -> Union[torch.Tensor, Tuple[torch.Tensor, torch.Tensor]]:
         """Runs one predict step.
 
         This is called by the PL Trainer.
@@ -332,13 +346,71 @@ class BaseEncoderDecoder(pl.LightningModule):
             batch_idx (int).
 
         Returns:
-            torch.Tensor: indices of the argmax at each timestep.
+            Union[torch.Tensor, Tuple[torch.Tensor, torch.Tensor]]: indices
+                of the argmax at each timestep, or of the best hypothesis if
+                decoding with beam search. If self.nbest > 1, the
+                self.nbest best hypotheses, of shape B x n x seq_len, and
+                their scores, of shape B x n, instead.
         """
+        if self.beam_width > 1:
+            predictions, scores = self.beam_search(batch, self.nbest)
+            if self.nbest > 1:
+                return predictions, scores
+            # -> B x seq_len.
+            return predictions[:, 0]
+        if self.compact_decoding:
+            # -> B x seq_len.
+            return self(batch, compact=True)
         predictions = self(batch)
         # -> B x seq_len x 1.
         greedy_predictions = self._get_predicted(predictions)
         return greedy_predictions
 
+    def beam_search(
+        self, batch: data.PaddedBatch, n: int = 1
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Decodes the batch with beam search.
+
+        Args:
+            batch (data.PaddedBatch).
+            n (int, optional): number of hypotheses to return.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: predictions of shape
+                B x n x seq_len and their scores of shape B x n, best first.
+
+        Raises:
+            NotImplementedError: beam search is not implemented for this
+                model.
+        """
+        raise NotImplementedError(
+            f"Beam search is not implemented for {self.name} models"
+        )
+
+    def _padding_symbols(
+        self, batch_size: int, num_steps: int
+    ) -> torch.Tensor:
+        """Allocates predictions for compacted greedy decoding.
+
+        Compacted decoding is only done when predicting, since the losses
+        computed during training and validation need scores for every step.
+        It therefore keeps only the symbol chosen at each step; steps not
+        decoded because the sequence had already finished are padding.
+
+        Args:
+            batch_size (int).
+            num_steps (int).
+
+        Returns:
+            torch.Tensor: tensor of shape B x seq_len.
+        """
+        return torch.full(
+            (batch_size, num_steps),
+            self.pad_idx,
+            dtype=torch.long,
+            device=self.device,
+        )
+
     def _get_predicted(self, predictions: torch.Tensor) -> torch.Tensor:
         """Picks the best index from the vocabulary.
 
@@ -488,7 +560,6 @@ class BaseEncoderDecoder(pl.LightningModule):
             default=defaults.LABEL_SMOOTHING,
             help="Coefficient for label smoothing. Default: %(default)s.",
         )
-        # TODO: add --beam_width.
         # Model arguments.
         parser.add_argument(
             "--decoder_layers",
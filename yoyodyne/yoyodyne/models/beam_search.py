@@ -0,0 +1,164 @@
+"""Batched beam search.
+
+The search is model-agnostic: the model supplies a step function, which
+scores the next symbol for every hypothesis given the last symbol and the
+decoder state, and a reorder function, which selects decoder states for the
+surviving hypotheses. All batch_size x beam_width hypotheses are advanced with
+a single call to the step function per timestep.
+"""
+
+from typing import Any, Callable, Tuple
+
+import torch
+
+
+class Error(Exception):
+    pass
+
+
+def expand(tensor: torch.Tensor, beam_width: int) -> torch.Tensor:
+    """Repeats each batch element once per hypothesis.
+
+    This is used to expand the encoder outputs and masks once, before
+    decoding, so that they line up with the flattened hypotheses.
+
+    Args:
+        tensor (torch.Tensor): tensor with the batch as its first dimension.
+        beam_width (int).
+
+    Returns:
+        torch.Tensor: tensor with batch_size x beam_width as its first
+            dimension.
+    """
+    return tensor.repeat_interleave(beam_width, dim=0)
+
+
+def search(
+    step: Callable[[torch.Tensor, Any], Tuple[torch.Tensor, Any]],
+    reorder: Callable[[Any, torch.Tensor], Any],
+    state: Any,
+    *,
+    batch_size: int,
+    beam_width: int,
+    start_idx: int,
+    end_idx: int,
+    pad_idx: int,
+    max_length: int,
+    device: torch.device,
+    n: int = 1,
+    length_normalization: bool = False,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Decodes with beam search.
+
+    Finished hypotheses are carried along, extended only with padding at no
+    cost, so that they compete with unfinished ones for the beam.
+
+    Args:
+        step (Callable[[torch.Tensor, Any], Tuple[torch.Tensor, Any]]):
+            given the last symbol of each hypothesis, of shape
+            (batch_size * beam_width), and the decoder state, returns the
+            log-probabilities of the next symbol, of shape
+            (batch_size * beam_width) x target_vocab_size, and the new
+            decoder state.
+        reorder (Callable[[Any, torch.Tensor], Any]): given the decoder state
+            and a tensor of hypothesis indices, of shape
+            (batch_size * beam_width), returns the state of those hypotheses.
+        state (Any): initial decoder state for the
+            (batch_size * beam_width) hypotheses.
+        batch_size (int).
+        beam_width (int).
+        start_idx (int).
+        end_idx (int).
+        pad_idx (int).
+        max_length (int): maximum number of symbols to decode.
+        device (torch.device).
+        n (int, optional): number of hypotheses to return per batch element.
+        length_normalization (bool, optional): if true, hypotheses are
+            compared by their log-likelihood divided by their length, both
+            when pruning the beam at each step and when ranking the final
+            hypotheses.
+
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor]: hypotheses of shape
+            batch_size x n x seq_len, padded after the end symbol, and their
+            scores, of shape batch_size x n, best first.
+
+    Raises:
+        Error: n is greater than the beam width.
+    """
+    if n > beam_width:
+        raise Error(
+            f"Cannot return {n} hypotheses from a beam of {beam_width}"
+        )
+    # Only the first hypothesis for each batch element is live at the start;
+    # otherwise the beam would fill with copies of the same hypothesis.
+    scores = torch.full((batch_size, beam_width), -torch.inf, device=device)
+    scores[:, 0] = 0.0
+    lengths = torch.zeros(
+        (batch_size, beam_width), dtype=torch.long, device=device
+    )
+    finished = torch.zeros(
+        (batch_size, beam_width), dtype=torch.bool, device=device
+    )
+    offsets = torch.arange(batch_size, device=device).unsqueeze(1) * beam_width
+    symbols = torch.full(
+        (batch_size * beam_width,), start_idx, dtype=torch.long, device=device
+    )
+    # Symbols and backpointers at each step, each batch_size x beam_width.
+    history = []
+    backpointers = []
+    for _ in range(max_length):
+        log_probs, state = step(symbols, state)
+        vocab_size = log_probs.size(-1)
+        # -> B x beam_width x target_vocab_size.
+        log_probs = log_probs.view(batch_size, beam_width, vocab_size)
+        # Finished hypotheses may only be extended with padding, at no cost.
+        finished_log_probs = torch.full_like(log_probs[0, 0], -torch.inf)
+        finished_log_probs[pad_idx] = 0.0
+        log_probs = torch.where(
+            finished.unsqueeze(2), finished_log_probs, log_probs
+        )
+        # -> B x (beam_width * target_vocab_size).
+        candidates = (scores.unsqueeze(2) + log_probs).view(batch_size, -1)
+        if length_normalization:
+            # Unfinished hypotheses are extended by one symbol.
+            candidate_lengths = (
+                (lengths + ~finished)
+                .unsqueeze(2)
+                .expand_as(log_probs)
+                .reshape(batch_size, -1)
+            )
+            _, indices = (candidates / candidate_lengths).topk(
+                beam_width, dim=1
+            )
+            scores = candidates.gather(1, indices)
+        else:
+            scores, indices = candidates.topk(beam_width, dim=1)
+        beams = torch.div(indices, vocab_size, rounding_mode="floor")
+        next_symbols = indices % vocab_size
+        finished = finished.gather(1, beams)
+        lengths = lengths.gather(1, beams) + ~finished
+        history.append(next_symbols)
+        backpointers.append(beams)
+        finished = finished | (next_symbols == end_idx)
+        state = reorder(state, (beams + offsets).view(-1))
+        symbols = next_symbols.view(-1)
+        if finished.all():
+            break
+    # Follows the backpointers to recover the hypotheses.
+    beams = torch.arange(beam_width, device=device).expand(batch_size, -1)
+    hypotheses = []
+    for next_symbols, pointers in zip(
+        reversed(history), reversed(backpointers)
+    ):
+        hypotheses.append(next_symbols.gather(1, beams))
+        beams = pointers.gather(1, beams)
+    # -> B x beam_width x seq_len.
+    hypotheses = torch.stack(hypotheses[::-1], dim=2)
+    if length_normalization:
+        scores = scores / lengths.clamp(min=1)
+    scores, order = scores.topk(n, dim=1)
+    hypotheses = hypotheses.gather(
+        1, order.unsqueeze(2).expand(-1, -1, hypotheses.size(2))
+    )
+    return hypotheses, scores
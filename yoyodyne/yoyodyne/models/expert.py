@@ -9,14 +9,30 @@ Class stores valid edit actions for given dataset.
 
 import abc
 import argparse
+import concurrent.futures
 import dataclasses
-from typing import Any, Dict, Iterable, Iterator, List, Sequence, Set, Tuple
+import hashlib
+import os
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
 import numpy
+import torch
 from maxwell import actions, sed
 from torch.utils import data
 
-from .. import defaults
+from .. import defaults, util
+
+# Increment this whenever the fitting procedure changes.
+SED_CACHE_VERSION = 1
 
 
 class Error(Exception):
@@ -24,13 +40,23 @@ class Error(Exception):
 
 
 class ActionVocabulary:
-    """Manages encoding of action vocabulary for transducer training."""
+    """Manages encoding of action vocabulary for transducer training.
+
+    Once the vocabulary is built, it should be frozen; the partitions of the
+    vocabulary into substitutions and insertions are then computed only
+    once.
+    """
 
     # TODO: Port more of the logic to the dataset class.
     i2w: Dict[Any, int]
     w2i: Dict[Any, int]
     start_vocab_idx: int
     target_characters: Set[Any]
+    beg_idx: int
+    end_idx: int
+    del_idx: int
+    copy_idx: int
+    _partitions: Optional[Tuple[torch.Tensor, torch.Tensor]]
 
     def __init__(self, unk_idx: int, i2w=None):
         self.i2w = [
@@ -43,9 +69,42 @@ class ActionVocabulary:
         if i2w:
             self.i2w.extend(i2w)
         self.w2i = {w: i for i, w in enumerate(self.i2w)}
+        self._index_special_actions()
+        self._partitions = None
         self.target_characters = set()
         self.encode_actions([unk_idx])  # Sets unknown character decoding.
 
+    def _index_special_actions(self) -> None:
+        self.beg_idx = self.w2i[actions.Start()]
+        self.end_idx = self.w2i[actions.End()]
+        self.del_idx = self.w2i[actions.ConditionalDel()]
+        self.copy_idx = self.w2i[actions.ConditionalCopy()]
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        # Vocabularies pickled by earlier versions are complete but were
+        # never frozen.
+        if "_partitions" not in state:
+            self._index_special_actions()
+            self._partitions = None
+            self.freeze()
+
+    def freeze(self) -> None:
+        """Prevents further actions from being encoded.
+
+        This also computes the substitution and insertion partitions.
+        """
+        if self.frozen:
+            return
+        self._partitions = (
+            self._partition(actions.ConditionalSub),
+            self._partition(actions.ConditionalIns),
+        )
+
+    @property
+    def frozen(self) -> bool:
+        return self._partitions is not None
+
     def encode(self, symb: actions.Edit) -> int:
         """Returns index referencing symbol in encoding table.
 
@@ -56,9 +115,14 @@ class ActionVocabulary:
 
         Returns:
             int: index of symbol in encoding table.
+
+        Raises:
+            Error: the symbol is not encoded and the vocabulary is frozen.
         """
         if symb in self.w2i:
             idx = self.w2i[symb]
+        elif self.frozen:
+            raise Error(f"Cannot encode {symb} in a frozen vocabulary")
         else:
             idx = len(self.i2w)
             self.i2w.append(symb)
@@ -108,37 +172,33 @@ class ActionVocabulary:
     def to_i2w(self) -> List[Any]:
         return self.i2w[len(self.start_vocab_idx) :]  # noqa: E203
 
-    @property
-    def substitutions(self) -> List[Tuple[int, actions.ConditionalEdit]]:
-        return [
-            i
-            for i, a in enumerate(self.i2w)
-            if isinstance(a, actions.ConditionalSub)
-        ]
-
-    @property
-    def insertions(self) -> List[Tuple[int, actions.ConditionalEdit]]:
-        return [
-            i
-            for i, a in enumerate(self.i2w)
-            if isinstance(a, actions.ConditionalIns)
-        ]
+    def _partition(self, action_cls: type) -> torch.Tensor:
+        return torch.tensor(
+            [i for i, a in enumerate(self.i2w) if isinstance(a, action_cls)],
+            dtype=torch.int64,
+        )
 
     @property
-    def beg_idx(self) -> int:
-        return self.i2w.index(actions.Start())
+    def substitutions(self) -> torch.Tensor:
+        """Encodings of all substitutions.
 
-    @property
-    def end_idx(self) -> int:
-        return self.i2w.index(actions.End())
+        Returns:
+            torch.Tensor.
+        """
+        if self.frozen:
+            return self._partitions[0]
+        return self._partition(actions.ConditionalSub)
 
     @property
-    def del_idx(self) -> int:
-        return self.i2w.index(actions.ConditionalDel())
+    def insertions(self) -> torch.Tensor:
+        """Encodings of all insertions.
 
-    @property
-    def copy_idx(self) -> int:
-        return self.i2w.index(actions.ConditionalCopy())
+        Returns:
+            torch.Tensor.
+        """
+        if self.frozen:
+            return self._partitions[1]
+        return self._partition(actions.ConditionalIns)
 
 
 @dataclasses.dataclass
@@ -169,6 +229,60 @@ class ActionPrefix:
     prefix: Prefix
 
 
+def _symbol_array(symbols: Sequence[Any], size: int) -> numpy.ndarray:
+    """Stores symbols in an object array, padded with None.
+
+    Args:
+        symbols (Sequence[Any]).
+        size (int): length of the array.
+
+    Returns:
+        numpy.ndarray.
+    """
+    array = numpy.full(size, None, dtype=object)
+    for i, symbol in enumerate(symbols):
+        array[i] = symbol
+    return array
+
+
+def _edit_distance_step(
+    previous: numpy.ndarray,
+    mismatch: numpy.ndarray,
+    del_cost: float,
+    ins_cost: float,
+    sub_cost: float,
+) -> numpy.ndarray:
+    """Computes the next row of edit distance matrices.
+
+    The deletion and substitution terms depend only on the previous row.
+    The insertion term is a running minimum along the row, which is
+    computed with numpy.minimum.accumulate after removing the insertion cost
+    of each column.
+
+    Args:
+        previous (numpy.ndarray): previous rows, of shape ... x y_size.
+        mismatch (numpy.ndarray): whether the current source symbol differs
+            from each target symbol, of shape ... x (y_size - 1).
+        del_cost (float): weight to deletion actions.
+        ins_cost (float): weight to insertion actions.
+        sub_cost (float): weight to substitution actions.
+
+    Returns:
+        numpy.ndarray: next rows, of shape ... x y_size.
+    """
+    candidates = previous + del_cost
+    numpy.minimum(
+        candidates[..., 1:],
+        previous[..., :-1] + mismatch * sub_cost,
+        out=candidates[..., 1:],
+    )
+    insertions = numpy.arange(previous.shape[-1], dtype=previous.dtype)
+    insertions *= ins_cost
+    return numpy.minimum.accumulate(candidates - insertions, axis=-1) + (
+        insertions
+    )
+
+
 def edit_distance(
     x: Sequence[Any],
     y: Sequence[Any],
@@ -192,34 +306,129 @@ def edit_distance(
     Returns:
         numpy.ndarray: edit sequence matrix.
     """
-    x_size = len(x) - x_offset + 1
-    y_size = len(y) - y_offset + 1
-    prefix_matrix = numpy.full(
-        (x_size, y_size), numpy.inf, dtype=numpy.float32
+    return batch_edit_distance(
+        [x[x_offset:]],
+        [y[y_offset:]],
+        del_cost=del_cost,
+        ins_cost=ins_cost,
+        sub_cost=sub_cost,
+    )[0]
+
+
+def batch_edit_distance(
+    xs: Sequence[Sequence[Any]],
+    ys: Sequence[Sequence[Any]],
+    del_cost=1.0,
+    ins_cost=1.0,
+    sub_cost=1.0,
+) -> numpy.ndarray:
+    """Generates edit distance matrices for pairs of sequences.
+
+    All pairs are padded to the longest source and target and computed
+    together, one row at a time.
+
+    Args:
+        xs (Sequence[Sequence[Any]]): source sequences.
+        ys (Sequence[Sequence[Any]]): target sequences.
+        del_cost (float): weight to deletion actions.
+        ins_cost (float): weight to insertion actions.
+        sub_cost (float): weight to substitution actions.
+
+    Returns:
+        numpy.ndarray: edit sequence matrices, of shape
+            B x (max_x_len + 1) x (max_y_len + 1); the matrix for the ith
+            pair is the upper left (len(xs[i]) + 1) x (len(ys[i]) + 1) block.
+    """
+    x_size = max((len(x) for x in xs), default=0)
+    y_size = max((len(y) for y in ys), default=0)
+    x_symbols = numpy.stack([_symbol_array(x, x_size) for x in xs])
+    y_symbols = numpy.stack([_symbol_array(y, y_size) for y in ys])
+    # B x x_size x y_size.
+    mismatches = x_symbols[:, :, None] != y_symbols[:, None, :]
+    prefix_matrix = numpy.empty(
+        (len(xs), x_size + 1, y_size + 1), dtype=numpy.float32
     )
+    prefix_matrix[:, 0] = numpy.arange(y_size + 1) * ins_cost
     for i in range(x_size):
-        prefix_matrix[i, 0] = i * del_cost
-    for j in range(y_size):
-        prefix_matrix[0, j] = j * ins_cost
-    for i in range(1, x_size):
-        for j in range(1, y_size):
-            if x[i - 1 + x_offset] == y[j - 1 + y_offset]:
-                substitution = 0.0
-            else:
-                substitution = sub_cost
-            prefix_matrix[i, j] = min(
-                prefix_matrix[i - 1, j] + del_cost,
-                prefix_matrix[i, j - 1] + ins_cost,
-                prefix_matrix[i - 1, j - 1] + substitution,
-            )
+        prefix_matrix[:, i + 1] = _edit_distance_step(
+            prefix_matrix[:, i],
+            mismatches[:, i],
+            del_cost,
+            ins_cost,
+            sub_cost,
+        )
     return prefix_matrix
 
 
+class PrefixRows:
+    """Tracks the prefixes of targets matching growing predictions.
+
+    This holds the last rows of the edit distance matrices from each
+    prediction in a batch to its target (see batch_edit_distance). Since
+    the predictions only grow by one symbol at a time, the rows are extended
+    rather than recomputed.
+    """
+
+    predictions: List[List[Any]]
+    targets: Sequence[Sequence[Any]]
+    rows: numpy.ndarray
+
+    def __init__(self, targets: Sequence[Sequence[Any]]):
+        self.predictions = [[] for _ in targets]
+        self.targets = targets
+        y_size = max((len(target) for target in targets), default=0)
+        self._target_symbols = numpy.stack(
+            [_symbol_array(target, y_size) for target in targets]
+        )
+        self.rows = numpy.tile(
+            numpy.arange(y_size + 1, dtype=numpy.float32), (len(targets), 1)
+        )
+
+    def append(self, symbols: Sequence[Any], emitted: Sequence[bool]) -> None:
+        """Extends the predictions which emitted a symbol.
+
+        Args:
+            symbols (Sequence[Any]): new symbol for each item.
+            emitted (Sequence[bool]): whether each item emitted its symbol.
+        """
+        emitted = numpy.asarray(emitted, dtype=bool)
+        if not emitted.any():
+            return
+        mismatch = (
+            _symbol_array(symbols, len(symbols))[:, None]
+            != self._target_symbols
+        )
+        self.rows = numpy.where(
+            emitted[:, None],
+            _edit_distance_step(self.rows, mismatch, 1.0, 1.0, 1.0),
+            self.rows,
+        )
+        for i in numpy.flatnonzero(emitted):
+            self.predictions[i].append(symbols[i])
+
+    def prefixes(self, i: int) -> List[Prefix]:
+        """Creates prefix objects for the ith prediction and target.
+
+        Args:
+            i (int): index of the item.
+
+        Returns:
+            List[Prefix]: prefix objects that index overlap between
+               prediction and target with minimal edit distance.
+        """
+        row = self.rows[i, : len(self.targets[i]) + 1]
+        return [
+            Prefix(self.predictions[i], self.targets[i], j)
+            for j in numpy.where(row == row.min())[0]
+        ]
+
+
 class Expert(abc.ABC):
     actions: ActionVocabulary
     aligner: sed.StochasticEditDistance
     oracle_factor: int
     roll_in: int
+    _sequence_costs: Dict[Tuple[Tuple[Any, ...], Tuple[Any, ...]], Dict]
 
     def __init__(self, actions, aligner, oracle_factor=defaults.ORACLE_FACTOR):
         """Oracle scores possible edit actions between prediction and target.
@@ -235,6 +444,36 @@ class Expert(abc.ABC):
         self.oracle_factor = oracle_factor
         self.roll_in = 1
         self.aligner = aligner
+        self._sequence_costs = {}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # The cost cache is not worth saving with the model.
+        state = self.__dict__.copy()
+        state["_sequence_costs"] = {}
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        # Experts pickled by earlier versions have no cache.
+        self._sequence_costs = {}
+
+    def sequence_costs(
+        self, source: Sequence[Any], target: Sequence[Any]
+    ) -> Dict[Tuple[int, int], float]:
+        """Gets the cache of suffix alignment costs for a source and target.
+
+        Args:
+            source (Sequence[any]): source string.
+            target (Sequence[any]): target string.
+
+        Returns:
+            Dict[Tuple[int, int], float]: mapping from source and target
+                offsets to the cost of aligning the suffixes at those
+                offsets, filled as costs are computed.
+        """
+        return self._sequence_costs.setdefault(
+            (tuple(source), tuple(target)), {}
+        )
 
     def find_valid_actions(
         self,
@@ -316,6 +555,7 @@ class Expert(abc.ABC):
             Dict[Edit, float]: edit actions and their respective scores.
         """
         costs_to_go = {}
+        sequence_costs = self.sequence_costs(source, target)
         for action_prefix in action_prefixes:
             suffix_begin = action_prefix.prefix.alignment
             for action in action_prefix.action:
@@ -333,9 +573,13 @@ class Expert(abc.ABC):
                     t_offset = suffix_begin
                 else:
                     raise Error(f"Unknown action: {action}")
-                sequence_cost = self.aligner.action_sequence_cost(
-                    source, target, s_offset, t_offset
-                )
+                try:
+                    sequence_cost = sequence_costs[s_offset, t_offset]
+                except KeyError:
+                    sequence_cost = self.aligner.action_sequence_cost(
+                        source, target, s_offset, t_offset
+                    )
+                    sequence_costs[s_offset, t_offset] = sequence_cost
                 action_cost = self.aligner.action_cost(action)
                 cost = action_cost + sequence_cost
                 if action not in costs_to_go or costs_to_go[action] > cost:
@@ -349,6 +593,7 @@ class Expert(abc.ABC):
         alignment: int,
         prediction: Sequence[Any],
         max_action_seq_len=150,
+        prefixes: Optional[List[Prefix]] = None,
     ) -> Dict[actions.Edit, float]:
         """Provides potential actions given source, target, and prediction.
 
@@ -357,11 +602,15 @@ class Expert(abc.ABC):
             target (Sequence[any]): target string for edit actions.
             alignment (int): index for current symbol to edit in source string.
             prediction (Sequence[Any]): current prediction from previous edits.
+            prefixes (List[Prefix], optional): if provided, the prefixes of
+                the target matching the prediction (e.g., as tracked by
+                PrefixRows), which are then not recomputed.
 
         Returns:
             Dict[Edit, float]: edit actions and their respective scores.
         """
-        prefixes = self.find_prefixes(prediction, target)
+        if prefixes is None:
+            prefixes = self.find_prefixes(prediction, target)
         valid_actions = (
             self.find_valid_actions(source, alignment, prefixes)
             if len(prediction) <= max_action_seq_len
@@ -372,6 +621,81 @@ class Expert(abc.ABC):
         )
         return valid_action_scores
 
+    # TODO: Merge action classes to remove need for this method.
+    @staticmethod
+    def remap_actions(
+        action_scores: Dict[actions.Edit, float],
+    ) -> Dict[actions.Edit, float]:
+        """Maps generative oracle's edit to conditional counterpart.
+
+        Oracle edits are a distinct subclass from edits learned from samples.
+
+        This will eventually be removed.
+
+        Args:
+            action_scores (Dict[actions.Edit, float]): weights for each action.
+
+        Returns:
+            Dict[actions.Edit, float]: edit action-weight pairs.
+
+        Raises:
+            Error: unknown action.
+        """
+        remapped_action_scores = {}
+        for action, score in action_scores.items():
+            if isinstance(action, actions.GenerativeEdit):
+                remapped_action = action.conditional_counterpart()
+            elif isinstance(action, actions.Edit):
+                remapped_action = action
+            else:
+                raise Error(
+                    f"Unknown action: {action}, {score}, "
+                    f"action_scores: {action_scores}"
+                )
+            remapped_action_scores[remapped_action] = score
+        return remapped_action_scores
+
+    def optimal_actions(
+        self,
+        source: Sequence[Any],
+        target: Sequence[Any],
+        alignment: int,
+        prediction: Sequence[Any],
+        max_action_seq_len=150,
+        prefixes: Optional[List[Prefix]] = None,
+    ) -> List[int]:
+        """Finds the optimal actions given source, target, and prediction.
+
+        Args:
+            source (Sequence[any]): source string to perform edit actions over.
+            target (Sequence[any]): target string for edit actions.
+            alignment (int): index for current symbol to edit in source string.
+            prediction (Sequence[Any]): current prediction from previous edits.
+            prefixes (List[Prefix], optional): if provided, the prefixes of
+                the target matching the prediction.
+
+        Returns:
+            List[int]: optimal action encodings, sorted.
+        """
+        action_scores = self.remap_actions(
+            self.score(
+                source,
+                target,
+                alignment,
+                prediction,
+                max_action_seq_len=max_action_seq_len,
+                prefixes=prefixes,
+            )
+        )
+        optimal_value = min(action_scores.values())
+        return sorted(
+            [
+                self.actions.encode_unseen_action(action)
+                for action, value in action_scores.items()
+                if value == optimal_value
+            ]
+        )
+
     @staticmethod
     def find_prefixes(
         prediction: Sequence[Any], target: Sequence[Any]
@@ -394,80 +718,196 @@ class Expert(abc.ABC):
         ]
 
 
+def _expectation(
+    params: sed.ParamDict,
+    sources: List[List[int]],
+    targets: List[List[int]],
+) -> sed.ParamDict:
+    """Accumulates SED soft counts over a shard of the data.
+
+    Args:
+        params (sed.ParamDict): current SED parameters.
+        sources (List[List[int]]).
+        targets (List[List[int]]).
+
+    Returns:
+        sed.ParamDict: unnormalized log counts for the shard.
+    """
+    aligner = sed.StochasticEditDistance(params)
+    counts = sed.ParamDict(
+        delta_sub=dict.fromkeys(params.delta_sub, -numpy.inf),
+        delta_del=dict.fromkeys(params.delta_del, -numpy.inf),
+        delta_ins=dict.fromkeys(params.delta_ins, -numpy.inf),
+        delta_eos=-numpy.inf,
+    )
+    for source, target in zip(sources, targets):
+        aligner.e_step(source, target, counts)
+    return counts
+
+
+def _accumulate(gammas: sed.ParamDict, counts: sed.ParamDict) -> None:
+    """Adds log counts to the SED weights, in place.
+
+    Args:
+        gammas (sed.ParamDict).
+        counts (sed.ParamDict).
+    """
+    for weights, shard_weights in (
+        (gammas.delta_sub, counts.delta_sub),
+        (gammas.delta_del, counts.delta_del),
+        (gammas.delta_ins, counts.delta_ins),
+    ):
+        for key, value in shard_weights.items():
+            weights[key] = numpy.logaddexp(weights[key], value)
+    gammas.delta_eos = numpy.logaddexp(gammas.delta_eos, counts.delta_eos)
+
+
+def fit_sed(
+    sources: List[List[int]],
+    targets: List[List[int]],
+    epochs: int = defaults.ORACLE_EM_EPOCHS,
+    processes: int = defaults.ORACLE_EM_PROCESSES,
+) -> sed.StochasticEditDistance:
+    """Fits a SED aligner with EM, in parallel if requested.
+
+    With more than one process, the data is split into that many shards and
+    the expectation step of each epoch is computed for each shard in a
+    process pool; the soft counts are then summed before the maximization
+    step. This gives the same parameters as
+    `sed.StochasticEditDistance.fit_from_data` up to floating point error.
+
+    Args:
+        sources (List[List[int]]).
+        targets (List[List[int]]).
+        epochs (int): number of EM epochs.
+        processes (int): number of processes, and of shards.
+
+    Returns:
+        sed.StochasticEditDistance.
+    """
+    if processes <= 1:
+        return sed.StochasticEditDistance.fit_from_data(
+            zip(sources, targets), epochs=epochs
+        )
+    aligner = sed.StochasticEditDistance.build_sed(
+        {symbol for source in sources for symbol in source},
+        {symbol for target in targets for symbol in target},
+        copy_probability=None,
+    )
+    # As in sed.StochasticEditDistance.em, the weights carry over between
+    # epochs.
+    gammas = sed.ParamDict.from_params(aligner.params)
+    shard_size = -(-len(sources) // processes)  # Ceiling division.
+    shards = [
+        (
+            sources[start : start + shard_size],  # noqa: E203
+            targets[start : start + shard_size],  # noqa: E203
+        )
+        for start in range(0, len(sources), shard_size)
+    ]
+    util.log_info(
+        f"Performing {epochs} epochs of EM over {len(shards)} shards"
+    )
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        for _ in range(epochs):
+            futures = [
+                pool.submit(_expectation, aligner.params, *shard)
+                for shard in shards
+            ]
+            for future in futures:
+                _accumulate(gammas, future.result())
+            aligner.m_step(gammas)
+            aligner.params.update_params(gammas)
+    return aligner
+
+
+def sed_cache_path(model_dir: str) -> str:
+    """Computes path for the directory of cached SED parameters.
+
+    This is shared by all experiments in the model directory.
+
+    Args:
+        model_dir (str).
+
+    Returns:
+        str.
+    """
+    return f"{model_dir}/sed"
+
+
+def _sed_cache_key(
+    sources: List[List[int]], targets: List[List[int]], epochs: int
+) -> str:
+    hasher = hashlib.sha256()
+    hasher.update(f"{SED_CACHE_VERSION}\n{epochs}\n".encode("utf-8"))
+    for source, target in zip(sources, targets):
+        hasher.update(f"{source!r}\t{target!r}\n".encode("utf-8"))
+    return hasher.hexdigest()
+
+
 def get_expert(
     train_data: data.Dataset,
     epochs: int = defaults.ORACLE_EM_EPOCHS,
     oracle_factor: int = defaults.ORACLE_FACTOR,
-    sed_params_path: str = None,
+    sed_params_path: Optional[str] = None,
+    sed_cache_dir: Optional[str] = None,
+    processes: int = defaults.ORACLE_EM_PROCESSES,
 ) -> Expert:
     """Generates expert object for training transducer.
 
+    Unless parameters are given, the SED aligner is fit to the data. If a
+    cache directory is given, fitted parameters are stored there, keyed by
+    a digest of the data and the number of EM epochs, and are reused by
+    later runs on the same data.
+
     Args:
         data (data.Dataset): dataset for generating expert vocabulary.
         epochs (int): number of EM epochs.
         sched_factor (float): scaling factor to determine rate of
             expert rollout sampling.
+        sed_params_path (str, optional): path to input SED parameters.
+        sed_cache_dir (str, optional): directory for cached SED parameters.
+        processes (int): number of processes for EM.
 
     Returns:
         expert.Expert.
     """
-
-    # TODO: Figure out a way to avoid these functions.
-
-    def _generate_data_and_encode_vocabulary(
-        data: data.Dataset, actions: ActionVocabulary
-    ) -> Iterator[Tuple[List[int], List[int]]]:
-        """Function to manage data encoding while aligning SED."
-
-        SED training over the default data sampling is expensive.
-        Training is quicker if tensors are converted to lists.
-        For efficiency, we encode action vocabulary simultaneously.
-
-        Args:
-            data (data.Dataset): Dataset to iterate over.
-            actions (ActionVocabulary): Vocabulary object
-                to encode actions for expert.
-        Returns:
-            Iterator[Tuple[List[int], List[int]]]: Iterator that
-                yields list version of source and target entries
-                in dataset.
-        """
-        for item in data:
-            # Dataset encodes BOW and EOW symbols for source. EOW
-            # for target. Removes these for SED training.
-            source = item.source.tolist()[1:-1]
-            target = item.target.tolist()[:-1]
-            actions.encode_actions(target)
-            yield source, target
-
-    def _encode_action_vocabulary(
-        data: data.Dataset, actions: ActionVocabulary
-    ) -> None:
-        """Encodes action vocabulary for expert oracle.
-
-        For instantiating SED objects from file.
-
-        Args:
-            data (data.Dataset): Dataset to iterate over.
-            actions (ActionVocabulary): Vocabulary object
-                to encode actions for expert.
-        """
-        for item in data:
-            # Ignores last symbol since EOW.
-            target = item.target.tolist()[:-1]
-            actions.encode_actions(target)
-
     actions = ActionVocabulary(unk_idx=train_data.index.unk_idx)
+    # SED training over the default data sampling is expensive. Training is
+    # quicker if tensors are converted to lists. For efficiency, we encode
+    # the action vocabulary in the same pass.
+    sources = []
+    targets = []
+    for item in train_data:
+        # Dataset encodes BOW and EOW symbols for source. EOW
+        # for target. Removes these for SED training.
+        target = item.target.tolist()[:-1]
+        actions.encode_actions(target)
+        sources.append(item.source.tolist()[1:-1])
+        targets.append(target)
     if sed_params_path:
         sed_params = sed.ParamDict.read_params(sed_params_path)
         sed_aligner = sed.StochasticEditDistance(sed_params)
-        # Loads vocabulary into action vocabulary.
-        _encode_action_vocabulary(train_data, actions)
-    else:
-        sed_aligner = sed.StochasticEditDistance.fit_from_data(
-            _generate_data_and_encode_vocabulary(train_data, actions),
-            epochs=epochs,
+    elif sed_cache_dir is not None:
+        path = os.path.join(
+            sed_cache_dir,
+            f"{_sed_cache_key(sources, targets, epochs)}.pkl",
         )
+        if os.path.exists(path):
+            sed_aligner = sed.StochasticEditDistance(
+                sed.ParamDict.read_params(path)
+            )
+        else:
+            sed_aligner = fit_sed(sources, targets, epochs, processes)
+            os.makedirs(sed_cache_dir, exist_ok=True)
+            # Writes to a temporary file and then renames it, so that
+            # concurrent runs never read partial parameters.
+            temporary = f"{path}.{os.getpid()}.tmp"
+            sed_aligner.params.write_params(temporary)
+            os.replace(temporary, path)
+    else:
+        sed_aligner = fit_sed(sources, targets, epochs, processes)
+    actions.freeze()
     return Expert(actions, sed_aligner, oracle_factor=oracle_factor)
 
 
@@ -493,6 +933,35 @@ def add_argparse_args(parser: argparse.ArgumentParser) -> None:
         help="Roll-in schedule parameter "
         "(transducer architecture only). Default: %(default)s.",
     )
+    parser.add_argument(
+        "--oracle_em_processes",
+        type=int,
+        default=defaults.ORACLE_EM_PROCESSES,
+        help="Number of processes used for EM "
+        "(transducer architecture only). Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--oracle_rollout_processes",
+        type=int,
+        default=defaults.ORACLE_ROLLOUT_PROCESSES,
+        help="Number of processes used for expert rollouts during training; "
+        "with more than one, rollouts run in a persistent process pool, "
+        "overlapping with the decoder "
+        "(transducer architecture only). Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--cache_sed_params",
+        action="store_true",
+        default=defaults.CACHE_SED_PARAMS,
+        help="Caches fitted SED parameters in the model directory, keyed by "
+        "the training data and number of EM epochs, and reuses them when "
+        "these match (transducer architecture only). Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--no_cache_sed_params",
+        action="store_false",
+        dest="cache_sed_params",
+    )
     parser.add_argument(
         "--sed_params",
         type=str,
@@ -1,190 +1,302 @@
-"""Hard monotonic neural-hmm models. Wu and Cotterell 2019.
-Original implementation: https://github.com/shijie-wu/neural-transducer"""
+"""Hard monotonic neural HMM model class."""
 
 import argparse
-import heapq
-from typing import List, Optional, Tuple, Union, Callable, Dict
+from typing import Callable, Dict, Optional, Tuple
 
 import torch
 from torch import nn
 
 from .. import data, defaults
-from . import base, modules, lstm
+from . import base, lstm, modules
 
 
 class HardMonotonicHmm(lstm.LSTMEncoderDecoder):
-    def __init__(self, *args, **kwargs):
+    """Hard monotonic neural HMM with an LSTM backend.
+
+    After:
+        Wu, S., and Cotterell, R. 2019. Exact hard monotonic attention for
+        character-level transduction. In Proceedings of the 57th Annual
+        Meeting of the Association for Computational Linguistics, pages
+        1530–1537.
+
+    Each target symbol is emitted from a single source position, and these
+    alignments never move backwards. The likelihood of the target marginalizes
+    over all alignments using the forward algorithm. Original implementation:
+    https://github.com/shijie-wu/neural-transducer.
+
+    If a band width w is given, each alignment may move at most w - 1
+    positions, and the forward algorithm costs O(T·S·w) rather than O(T·S²).
+    """
+
+    hmm_band_width: Optional[int]
+
+    def __init__(
+        self,
+        *args,
+        hmm_band_width=defaults.HMM_BAND_WIDTH,
+        **kwargs,
+    ):
+        """Initializes the HMM.
+
+        Args:
+            *args: passed to superclass.
+            hmm_band_width (int, optional): number of source positions a
+                transition may move to, counting the current one; if None,
+                transitions are unlimited.
+            **kwargs: passed to superclass.
+        """
+        # This is needed by get_decoder, called by the superclass.
+        self.hmm_band_width = hmm_band_width
         super().__init__(*args, **kwargs)
+        # Emissions are computed by the decoder.
+        del self.classifier
 
     def get_decoder(self) -> modules.lstm.HMMLSTMDecoder:
         return modules.lstm.HMMLSTMDecoder(
             pad_idx=self.pad_idx,
             start_idx=self.start_idx,
             end_idx=self.end_idx,
-            decoder_input_size=self.source_encoder.output_size,  # Only pass target embedding to decoder
+            decoder_input_size=self.source_encoder.output_size,
             num_embeddings=self.target_vocab_size,
             dropout=self.dropout,
             bidirectional=False,
             embedding_size=self.embedding_size,
             layers=self.decoder_layers,
             hidden_size=self.hidden_size,
+            band_width=self.hmm_band_width,
         )
 
     def _get_loss_func(
         self,
     ) -> Callable[[torch.Tensor, torch.Tensor], torch.Tensor]:
-        """Returns the actual function used to compute loss.
+        # Prevents base construction of unused loss function.
+        return None
+
+    @staticmethod
+    def _incoming(transitions: torch.Tensor) -> torch.Tensor:
+        """Indexes banded transitions by the position they move to.
+
+        Args:
+            transitions (torch.Tensor): log-probabilities of shape
+                ... x source_len x w, in which [..., i, k] is that of moving
+                from i to i + k.
 
         Returns:
-                Callable[[torch.Tensor, torch.Tensor], torch.Tensor]: configured
-                        loss function.
+            torch.Tensor: log-probabilities of shape ... x source_len x w,
+                in which [..., j, m] is that of moving from j - w + 1 + m to
+                j.
         """
-        return None
+        source_length, width = transitions.shape[-2:]
+        # -> ... x (source_len + w - 1) x w.
+        padded = nn.functional.pad(
+            transitions.flip(-1),
+            (0, 0, width - 1, 0),
+            value=modules.lstm.LOG_ZERO,
+        )
+        index = torch.arange(
+            source_length, device=transitions.device
+        ).unsqueeze(1) + torch.arange(width, device=transitions.device)
+        return padded.gather(-2, index.expand(transitions.size()))
+
+    @staticmethod
+    def _forward_step(
+        alpha: torch.Tensor, incoming: torch.Tensor
+    ) -> torch.Tensor:
+        """Applies one step of transitions to the forward probabilities.
+
+        Args:
+            alpha (torch.Tensor): forward log-probabilities of shape
+                B x source_len.
+            incoming (torch.Tensor): transition log-probabilities of shape
+                B x source_len x w, as returned by _incoming.
+
+        Returns:
+            torch.Tensor: log-probabilities of shape B x source_len.
+        """
+        width = incoming.size(-1)
+        # -> B x source_len x w, in which [:, j, m] is alpha at j - w + 1 + m.
+        previous = nn.functional.pad(
+            alpha, (width - 1, 0), value=modules.lstm.LOG_ZERO
+        ).unfold(-1, width, 1)
+        return torch.logsumexp(previous + incoming, dim=-1)
+
+    def _initial_alpha(
+        self, batch_size: int, source_length: int
+    ) -> torch.Tensor:
+        """Aligns every sequence to the start of the source.
+
+        Args:
+            batch_size (int).
+            source_length (int).
+
+        Returns:
+            torch.Tensor: forward log-probabilities of shape B x source_len.
+        """
+        alpha = torch.full(
+            (batch_size, source_length),
+            modules.lstm.LOG_ZERO,
+            device=self.device,
+        )
+        alpha[:, 0] = 0.0
+        return alpha
+
+    def score_likelihood(
+        self,
+        encoder_out: torch.Tensor,
+        encoder_mask: torch.Tensor,
+        target: torch.Tensor,
+    ) -> torch.Tensor:
+        """Scores the target with the forward algorithm.
+
+        The decoder runs over the whole target at once.
+
+        Args:
+            encoder_out (torch.Tensor): batch of encoded input symbols.
+            encoder_mask (torch.Tensor): mask for the batch of encoded
+                input symbols.
+            target (torch.Tensor): target symbols of shape B x seq_len.
+
+        Returns:
+            torch.Tensor: log-likelihoods of shape B.
+        """
+        batch_size, source_length = encoder_mask.size()
+        # -> B x seq_len.
+        symbols = torch.cat(
+            (
+                torch.full(
+                    (batch_size, 1), self.start_idx, device=self.device
+                ),
+                target[:, :-1],
+            ),
+            dim=1,
+        )
+        decoded = self.decoder(
+            symbols,
+            self.init_hiddens(batch_size, self.decoder_layers),
+            encoder_out,
+            encoder_mask,
+        )
+        incoming = self._incoming(decoded.transitions)
+        # -> B x seq_len x source_len.
+        emissions = decoded.emissions.gather(
+            -1,
+            target.view(batch_size, -1, 1, 1).expand(-1, -1, source_length, 1),
+        ).squeeze(-1)
+        # Padding steps leave the forward probabilities unchanged.
+        # -> B x seq_len x 1.
+        unpadded = (target != self.pad_idx).unsqueeze(-1)
+        alpha = self._initial_alpha(batch_size, source_length)
+        for t in range(target.size(1)):
+            alpha = torch.where(
+                unpadded[:, t],
+                self._forward_step(alpha, incoming[:, t]) + emissions[:, t],
+                alpha,
+            )
+        return torch.logsumexp(alpha, dim=-1)
+
+    def decode_step(
+        self,
+        alpha: torch.Tensor,
+        transitions: torch.Tensor,
+        emissions: torch.Tensor,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Greedily chooses the next symbol and updates the forward algorithm.
+
+        Args:
+            alpha (torch.Tensor): forward log-probabilities of shape
+                B x source_len.
+            transitions (torch.Tensor): transition log-probabilities of
+                shape B x source_len x w.
+            emissions (torch.Tensor): emission log-probabilities of shape
+                B x source_len x target_vocab_size.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: forward log-probabilities of
+                shape B x source_len, and the chosen symbols of shape B.
+        """
+        alpha = self._forward_step(alpha, self._incoming(transitions))
+        # -> B x target_vocab_size.
+        scores = torch.logsumexp(alpha.unsqueeze(-1) + emissions, dim=1)
+        symbol = scores.argmax(dim=-1)
+        emitted = emissions.gather(
+            -1, symbol.view(-1, 1, 1).expand(-1, alpha.size(1), 1)
+        ).squeeze(-1)
+        return alpha + emitted, symbol
 
     def decode(
         self,
         encoder_out: torch.Tensor,
         encoder_mask: torch.Tensor,
-        teacher_forcing: bool,
-        target: Optional[torch.Tensor] = None,
     ) -> torch.Tensor:
-        """Decodes a sequence given the encoded input.
+        """Decodes greedily.
 
-        Decodes until all sequences in a batch have reached [EOS] up to
-        a specified length depending on the `target` args.
+        Decodes until all sequences in a batch have reached [EOS] or
+        `self.max_target_length` symbols have been decoded.
 
         Args:
-                encoder_out (torch.Tensor): batch of encoded input symbols.
-                encoder_mask (torch.Tensor): mask for the batch of encoded
-                        input symbols.
-                teacher_forcing (bool): Whether or not to decode
-                        with teacher forcing.
-                target (torch.Tensor, optional): target symbols;  we
-                        decode up to `len(target)` symbols. If it is None, then we
-                        decode up to `self.max_target_length` symbols.
+            encoder_out (torch.Tensor): batch of encoded input symbols.
+            encoder_mask (torch.Tensor): mask for the batch of encoded
+                input symbols.
 
         Returns:
-                predictions (torch.Tensor): tensor of predictions of shape
-                        seq_len x batch_size x target_vocab_size.
+            torch.Tensor: predictions of shape B x seq_len.
         """
-        batch_size, src_seq_len = encoder_mask.shape
-        # Initializes hidden states for decoder LSTM.
+        batch_size, source_length = encoder_mask.size()
         decoder_hiddens = self.init_hiddens(batch_size, self.decoder_layers)
-        # Feed in the first decoder input, as a start tag.
         # -> B x 1.
-        predictions = (
-            torch.tensor(
-                [self.start_idx], device=self.device, dtype=torch.long
-            )
-            .repeat(batch_size)
-            .unsqueeze(1)
+        decoder_input = torch.full(
+            (batch_size, 1), self.start_idx, device=self.device
         )
-        if self.training:
-            predictions = target  # torch.cat((predictions, target), dim=1)
-        # Tracks when each sequence has decoded an EOS.
-        likelihoods = None
+        alpha = self._initial_alpha(batch_size, source_length)
+        predictions = []
         finished = torch.zeros(
-            batch_size, device=self.device, requires_grad=False
-        ).bool()
-        num_steps = target.size(1) if self.training else self.max_target_length
-        for t in range(num_steps):
-            tgt_symbol = predictions[:, t].unsqueeze(-1)
+            batch_size, dtype=torch.bool, device=self.device
+        )
+        for _ in range(self.max_target_length):
             decoded = self.decoder(
-                tgt_symbol,
-                decoder_hiddens,
-                encoder_out,
-                encoder_mask,
+                decoder_input, decoder_hiddens, encoder_out, encoder_mask
             )
-            transmissions_prob, emissions_prob, decoder_hiddens = (
-                decoded.transitions,
-                decoded.emissions,
-                decoded.hiddens,
+            decoder_hiddens = decoded.hiddens
+            alpha, symbol = self.decode_step(
+                alpha, decoded.transitions[:, 0], decoded.emissions[:, 0]
             )
-            if self.training:
-                likelihoods = self.score_likelihood(
-                    tgt_symbol,
-                    transmissions_prob,
-                    emissions_prob,
-                    likelihoods=likelihoods,
-                )
-            else:
-                likelihoods, word = self.decode_step(
-                    tgt_symbol,
-                    transmissions_prob,
-                    emissions_prob,
-                    likelihoods=likelihoods,
-                )
-                with torch.no_grad():
-                    finished |= word == self.end_idx
-                    if finished.all().item():
-                        break
-                    word = word.where(
-                        ~finished,
-                        torch.tensor(self.pad_idx, device=self.device),
-                    )
-                    predictions = torch.cat(
-                        (predictions, word.unsqueeze(-1)), dim=1
-                    )
-
-        return predictions, likelihoods
+            predictions.append(symbol)
+            finished |= symbol == self.end_idx
+            if finished.all():
+                break
+            decoder_input = symbol.unsqueeze(1)
+        return torch.stack(predictions, dim=1)
 
-    def score_likelihood(
-        self, tgt_symbol, transmissions, emissions, likelihoods=None
-    ) -> Union[torch.Tensor, torch.Tensor]:
-        if likelihoods is None:
-            return transmissions[:, 0].unsqueeze(1) + self._get_token_prob(
-                emissions, tgt_symbol
-            )
-        # decoder output: B x 1 x dec_hidden.
-        # Make transition probs for each state
-        likelihoods = likelihoods + transmissions.transpose(1, 2)
-        likelihoods = likelihoods.logsumexp(dim=-1, keepdim=True).transpose(
-            1, 2
-        )
-        likelihoods = likelihoods + self._get_token_prob(emissions, tgt_symbol)
-        return likelihoods
+    def forward(self, batch: data.PaddedBatch) -> torch.Tensor:
+        """Runs the encoder-decoder model with greedy decoding.
 
-    def decode_step(
-        self, tgt_symbol, transmissions, emissions, likelihoods=None
-    ) -> Union[torch.Tensor, torch.Tensor]:
-        if likelihoods is None:
-            likelihoods = transmissions[:, 0].unsqueeze(1)
-        else:
-            likelihoods = likelihoods + transmissions.transpose(1, 2)
-            likelihoods = likelihoods.logsumexp(
-                dim=-1, keepdim=True
-            ).transpose(1, 2)
-
-        log_probs = likelihoods + emissions.transpose(1, 2)
-        log_probs = log_probs.logsumexp(dim=-1)
-
-        word = torch.max(log_probs, dim=1)[1]
-        likelihoods = likelihoods + self._get_token_prob(emissions, word)
-
-        return likelihoods, word
-
-    def _get_token_prob(self, probs, symb):
-        bs, seq_len, _ = probs.shape
-        symb = symb.view(bs, 1).expand(bs, seq_len)
-        emiss = torch.gather(probs, -1, symb.unsqueeze(-1))
-        mask = (symb != self.pad_idx).unsqueeze(-1).float()
-        return (emiss * mask).view(bs, 1, seq_len)
-
-    def training_step(self, batch: data.PaddedBatch, batch_idx: int) -> Dict:
+        Args:
+            batch (data.PaddedBatch).
+
+        Returns:
+            torch.Tensor: predictions of shape B x seq_len.
+        """
+        encoder_out = self.source_encoder(batch.source).output
+        return self.decode(encoder_out, batch.source.mask)
+
+    def training_step(
+        self, batch: data.PaddedBatch, batch_idx: int
+    ) -> torch.Tensor:
         """Runs one step of training.
 
         This is called by the PL Trainer.
 
         Args:
-                batch (data.PaddedBatch)
-                batch_idx (int).
+            batch (data.PaddedBatch)
+            batch_idx (int).
 
         Returns:
-                torch.Tensor: loss.
+            torch.Tensor: loss.
         """
-        # Forward pass produces loss by default.
-        _, likelihood = self(batch)
-        loss = -torch.logsumexp(likelihood, dim=-1).mean()
+        encoder_out = self.source_encoder(batch.source).output
+        loss = -self.score_likelihood(
+            encoder_out, batch.source.mask, batch.target.padded
+        ).mean()
         self.log(
             "train_loss",
             loss,
@@ -195,36 +307,50 @@ class HardMonotonicHmm(lstm.LSTMEncoderDecoder):
         return loss
 
     def validation_step(self, batch: data.PaddedBatch, batch_idx: int) -> Dict:
-        predictions, likelihood = self(batch)
-        loss = -torch.logsumexp(likelihood, dim=-1).mean()
-        # Processes for accuracy calculation.
+        encoder_out = self.source_encoder(batch.source).output
+        loss = -self.score_likelihood(
+            encoder_out, batch.source.mask, batch.target.padded
+        ).mean()
         predictions = self.evaluator.finalize_predictions(
-            predictions, self.end_idx, self.pad_idx
+            self.decode(encoder_out, batch.source.mask),
+            self.end_idx,
+            self.pad_idx,
         )
         val_eval_item = self.evaluator.get_eval_item(
             predictions, batch.target.padded, self.pad_idx
         )
         return {"val_eval_item": val_eval_item, "val_loss": loss}
 
-    def forward(
-        self,
-        batch: data.PaddedBatch,
+    # The LSTM beam search does not apply to this model, so this raises
+    # NotImplementedError instead.
+    beam_search = base.BaseEncoderDecoder.beam_search
+
+    def predict_step(
+        self, batch: data.PaddedBatch, batch_idx: int
     ) -> torch.Tensor:
-        """Runs the encoder-decoder model.
+        if self.beam_width > 1:
+            predictions, _ = self.beam_search(batch)
+            return predictions[:, 0]
+        return self(batch)
 
-        Args:
-                batch (data.PaddedBatch).
+    @property
+    def name(self) -> str:
+        return "hard monotonic HMM"
 
-        Returns:
-                predictions (torch.Tensor): tensor of predictions of shape
-                        (seq_len, batch_size, target_vocab_size).
+    @staticmethod
+    def add_argparse_args(parser: argparse.ArgumentParser) -> None:
+        """Adds HMM configuration options to the argument parser.
+
+        These are only needed at training time.
+
+        Args:
+            parser (argparse.ArgumentParser).
         """
-        encoder_out = self.source_encoder(batch.source).output
-        predictions, likelihoods = self.decode(
-            encoder_out,
-            batch.source.mask,
-            self.teacher_forcing if self.training else False,
-            batch.target.padded if batch.target else None,
+        parser.add_argument(
+            "--hmm_band_width",
+            type=int,
+            default=defaults.HMM_BAND_WIDTH,
+            help="Number of source positions each alignment may move to, "
+            "counting the current one; at least 2, or unlimited if not "
+            "set (HMM only). Default: %(default)s.",
         )
-        # -> B x seq_len x target_vocab_size.
-        return predictions, likelihoods
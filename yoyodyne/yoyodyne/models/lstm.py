@@ -1,14 +1,13 @@
 """LSTM model classes."""
 
 import argparse
-import heapq
-from typing import List, Optional, Tuple, Union
+from typing import Optional, Tuple
 
 import torch
 from torch import nn
 
 from .. import data, defaults
-from . import base, modules
+from . import base, beam_search, modules
 
 
 class LSTMEncoderDecoder(base.BaseEncoderDecoder):
@@ -91,9 +90,10 @@ class LSTMEncoderDecoder(base.BaseEncoderDecoder):
                 input symbols.
             teacher_forcing (bool): Whether or not to decode
                 with teacher forcing.
-            target (torch.Tensor, optional): target symbols;  we
-                decode up to `len(target)` symbols. If it is None, then we
-                decode up to `self.max_target_length` symbols.
+            target (torch.Tensor, optional): target symbols. With teacher
+                forcing, we decode `len(target)` symbols. Otherwise, we
+                decode up to `self.max_target_length` symbols, and if a
+                target is given, do not stop before `len(target)` symbols.
 
         Returns:
             predictions (torch.Tensor): tensor of predictions of shape
@@ -112,8 +112,10 @@ class LSTMEncoderDecoder(base.BaseEncoderDecoder):
             .unsqueeze(1)
         )
         predictions = []
+        # Without teacher forcing, the number of steps does not depend on the
+        # target, so predictions do not depend on how items are batched.
         num_steps = (
-            target.size(1) if target is not None else self.max_target_length
+            target.size(1) if teacher_forcing else self.max_target_length
         )
         # Tracks when each sequence has decoded an EOS.
         finished = torch.zeros(batch_size, device=self.device)
@@ -142,165 +144,177 @@ class LSTMEncoderDecoder(base.BaseEncoderDecoder):
                 # when we have decoded at least the the same number of steps as
                 # the target length.
                 if finished.all():
-                    if target is None or decoder_input.size(-1) >= target.size(
-                        -1
-                    ):
+                    if target is None or t + 1 >= target.size(1):
                         break
         predictions = torch.stack(predictions)
         return predictions
 
+    def decode_compact(
+        self,
+        encoder_out: torch.Tensor,
+        encoder_mask: torch.Tensor,
+        num_steps: int,
+    ) -> torch.Tensor:
+        """Decodes greedily, dropping sequences from the batch as they finish.
+
+        Hidden states, encoder outputs, and masks are compacted to the
+        sequences which have not yet decoded an EOS, so finished sequences
+        cost nothing; their remaining steps are padding. Only the chosen
+        symbols are kept, not their scores.
+
+        Args:
+            encoder_out (torch.Tensor): batch of encoded input symbols.
+            encoder_mask (torch.Tensor): mask for the batch of encoded
+                input symbols.
+            num_steps (int): maximum number of symbols to decode.
+
+        Returns:
+            predictions (torch.Tensor): predicted symbols of shape
+                B x seq_len.
+        """
+        batch_size = encoder_mask.size(0)
+        decoder_hiddens = self.init_hiddens(batch_size, self.decoder_layers)
+        # -> B x 1.
+        decoder_input = torch.full(
+            (batch_size, 1), self.start_idx, device=self.device
+        )
+        predictions = self._padding_symbols(batch_size, num_steps)
+        # Batch indices of the sequences still being decoded.
+        active = torch.arange(batch_size, device=self.device)
+        for t in range(num_steps):
+            decoded = self.decoder(
+                decoder_input, decoder_hiddens, encoder_out, encoder_mask
+            )
+            logits = self.classifier(decoded.output)
+            decoder_input = self._get_predicted(logits)
+            predictions[active, t] = decoder_input.squeeze(1)
+            decoder_hiddens = decoded.hiddens
+            unfinished = decoder_input.squeeze(1) != self.end_idx
+            if not unfinished.all():
+                if not unfinished.any():
+                    return predictions[:, : t + 1]
+                keep = unfinished.nonzero().squeeze(1)
+                active = active[keep]
+                decoder_input = decoder_input[keep]
+                decoder_hiddens = self._reorder_hiddens(decoder_hiddens, keep)
+                encoder_out = encoder_out[keep]
+                encoder_mask = encoder_mask[keep]
+        return predictions
+
     def beam_decode(
         self,
         encoder_out: torch.Tensor,
         encoder_mask: torch.Tensor,
         beam_width: int,
         n: int = 1,
-        return_confidences: bool = False,
-    ) -> Union[Tuple[List, List], List]:
-        """Beam search with beam_width.
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Decodes a sequence given the encoded input with beam search.
 
-        Note that we assume batch size is 1.
+        All batch_size x beam_width hypotheses are decoded together.
 
         Args:
-            encoder_out (torch.Tensor): encoded inputs.
-            encoder_mask (torch.Tensor).
+            encoder_out (torch.Tensor): batch of encoded input symbols.
+            encoder_mask (torch.Tensor): mask for the batch of encoded
+                input symbols.
             beam_width (int): size of the beam.
-            n (int): number of hypotheses to return.
-            return_confidences (bool, optional): additionally return the
-                likelihood of each hypothesis.
+            n (int, optional): number of hypotheses to return.
 
         Returns:
-            Union[Tuple[List, List], List]: _description_
+            Tuple[torch.Tensor, torch.Tensor]: predictions of shape
+                B x n x seq_len and their log-likelihoods of shape B x n.
         """
-        # TODO: only implemented for batch size of 1. Implement batch mode.
-        batch_size = encoder_mask.shape[0]
-        if batch_size != 1:
-            raise NotImplementedError(
-                "Beam search is not implemented for batch_size > 1"
+        batch_size = encoder_mask.size(0)
+        # Encoder outputs are the same for all hypotheses, so these are
+        # expanded once, up front.
+        encoder_out = beam_search.expand(encoder_out, beam_width)
+        encoder_mask = beam_search.expand(encoder_mask, beam_width)
+
+        def step(
+            symbols: torch.Tensor, hiddens: Tuple[torch.Tensor, torch.Tensor]
+        ) -> Tuple[torch.Tensor, Tuple[torch.Tensor, torch.Tensor]]:
+            decoded = self.decoder(
+                symbols.unsqueeze(1), hiddens, encoder_out, encoder_mask
             )
-        # Initializes hidden states for decoder LSTM.
-        decoder_hiddens = self.init_hiddens(
-            encoder_out.size(0), self.decoder_layers
+            logits = self.classifier(decoded.output).squeeze(1)
+            return nn.functional.log_softmax(logits, dim=-1), decoded.hiddens
+
+        return beam_search.search(
+            step,
+            self._reorder_hiddens,
+            self.init_hiddens(batch_size * beam_width, self.decoder_layers),
+            batch_size=batch_size,
+            beam_width=beam_width,
+            start_idx=self.start_idx,
+            end_idx=self.end_idx,
+            pad_idx=self.pad_idx,
+            max_length=self.max_target_length,
+            device=self.device,
+            n=n,
+            length_normalization=self.length_normalization,
+        )
+
+    @staticmethod
+    def _reorder_hiddens(
+        hiddens: Tuple[torch.Tensor, torch.Tensor], indices: torch.Tensor
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Selects the hidden states of the given beam search hypotheses.
+
+        Args:
+            hiddens (Tuple[torch.Tensor, torch.Tensor]): hidden states of
+                shape layers x (B * beam_width) x hidden_size.
+            indices (torch.Tensor): hypothesis indices.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor].
+        """
+        return tuple(hidden.index_select(1, indices) for hidden in hiddens)
+
+    def beam_search(
+        self, batch: data.PaddedBatch, n: int = 1
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Runs the encoder-decoder model with beam search.
+
+        Args:
+            batch (data.PaddedBatch).
+            n (int, optional): number of hypotheses to return.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: predictions of shape
+                B x n x seq_len and their scores of shape B x n.
+        """
+        encoder_out = self.source_encoder(batch.source).output
+        return self.beam_decode(
+            encoder_out, batch.source.mask, self.beam_width, n
         )
-        # log likelihood, last decoded idx, all likelihoods,  hiddens tensor.
-        histories = [[0.0, [self.start_idx], [0.0], decoder_hiddens]]
-        for t in range(self.max_target_length):
-            # List that stores the heap of the top beam_width elements from all
-            # beam_width x target_vocab_size possibilities
-            likelihoods = []
-            hypotheses = []
-            # First accumulates all beam_width predictions.
-            for (
-                beam_likelihood,
-                beam_idxs,
-                char_likelihoods,
-                decoder_hiddens,
-            ) in histories:
-                # Does not keep decoding a path that has hit EOS.
-                if len(beam_idxs) > 1 and beam_idxs[-1] == self.end_idx:
-                    fields = [
-                        beam_likelihood,
-                        beam_idxs,
-                        char_likelihoods,
-                        decoder_hiddens,
-                    ]
-                    # TODO: Beam search with beam_width.
-                    # TODO: Replace heapq with torch.max or similar?
-                    heapq.heappush(hypotheses, fields)
-                    continue
-                # Feeds in the first decoder input, as a start tag.
-                # -> batch_size x 1
-                decoder_input = torch.tensor(
-                    [beam_idxs[-1]], device=self.device, dtype=torch.long
-                ).unsqueeze(1)
-                decoded = self.decoder(
-                    decoder_input, decoder_hiddens, encoder_out, encoder_mask
-                )
-                logits = self.classifier(decoded.output)
-                likelihoods.append(
-                    (
-                        logits,
-                        beam_likelihood,
-                        beam_idxs,
-                        char_likelihoods,
-                        decoded.hiddens,
-                    )
-                )
-            # Constrains the next step to beamsize.
-            for (
-                predictions,
-                beam_likelihood,
-                beam_idxs,
-                char_likelihoods,
-                decoder_hiddens,
-            ) in likelihoods:
-                # This is 1 x 1 x target_vocab_size since we fixed batch size
-                # to 1. We squeeze off the first 2 dimensions to get a tensor
-                # of target_vocab_size.
-                predictions = predictions.squeeze(0).squeeze(0)
-                for j, prob in enumerate(predictions):
-                    if return_confidences:
-                        cl = char_likelihoods + [prob]
-                    else:
-                        cl = char_likelihoods
-                    if len(hypotheses) < beam_width:
-                        fields = [
-                            beam_likelihood + prob,
-                            beam_idxs + [j],
-                            cl,
-                            decoder_hiddens,
-                        ]
-                        heapq.heappush(hypotheses, fields)
-                    else:
-                        fields = [
-                            beam_likelihood + prob,
-                            beam_idxs + [j],
-                            cl,
-                            decoder_hiddens,
-                        ]
-                        heapq.heappushpop(hypotheses, fields)
-            # Takes the top beam hypotheses from the heap.
-            histories = heapq.nlargest(beam_width, hypotheses)
-            # If the top n hypotheses are full sequences, break.
-            if all([h[1][-1] == self.end_idx for h in histories]):
-                break
-        # Returns the top-n hypotheses.
-        histories = heapq.nlargest(n, hypotheses)
-        predictions = torch.tensor([h[1] for h in histories], self.device)
-        # Converts shape to that of `decode`: seq_len x B x target_vocab_size.
-        predictions = predictions.unsqueeze(0).transpose(0, 2)
-        if return_confidences:
-            return (predictions, torch.tensor([h[2] for h in histories]))
-        else:
-            return predictions
 
     def forward(
         self,
         batch: data.PaddedBatch,
+        compact: bool = False,
     ) -> torch.Tensor:
         """Runs the encoder-decoder model.
 
         Args:
             batch (data.PaddedBatch).
+            compact (bool, optional): if true, decodes greedily with
+                decode_compact, returning only the predicted symbols.
 
         Returns:
             predictions (torch.Tensor): tensor of predictions of shape
-                (seq_len, batch_size, target_vocab_size).
+                (batch_size, seq_len, target_vocab_size), or of predicted
+                symbols of shape (batch_size, seq_len) if compact.
         """
         encoder_out = self.source_encoder(batch.source).output
-        if self.beam_width is not None and self.beam_width > 1:
-            predictions = self.beam_decode(
-                encoder_out,
-                batch.source.mask,
-                beam_width=self.beam_width,
-            )
-        else:
-            predictions = self.decode(
-                encoder_out,
-                batch.source.mask,
-                self.teacher_forcing if self.training else False,
-                batch.target.padded if batch.target else None,
+        if compact:
+            return self.decode_compact(
+                encoder_out, batch.source.mask, self.max_target_length
             )
+        predictions = self.decode(
+            encoder_out,
+            batch.source.mask,
+            self.teacher_forcing if self.training else False,
+            batch.target.padded if batch.target else None,
+        )
         # -> B x seq_len x target_vocab_size.
         predictions = predictions.transpose(0, 1)
         return predictions
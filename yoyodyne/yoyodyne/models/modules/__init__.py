@@ -2,7 +2,12 @@ import argparse
 
 from .base import BaseModule
 from .linear import LinearEncoder
-from .lstm import LSTMAttentiveDecoder, LSTMDecoder, LSTMEncoder  # noqa: F401
+from .lstm import (  # noqa: F401
+    HMMLSTMDecoder,
+    LSTMAttentiveDecoder,
+    LSTMDecoder,
+    LSTMEncoder,
+)
 from .transformer import TransformerDecoder  # noqa F401
 from .transformer import FeatureInvariantTransformerEncoder, TransformerEncoder
 
@@ -41,6 +46,7 @@ def get_encoder_cls(
     }
     model_to_encoder_fac = {
         "attentive_lstm": LSTMEncoder,
+        "hmm": LSTMEncoder,
         "lstm": LSTMEncoder,
         "pointer_generator_lstm": LSTMEncoder,
         "pointer_generator_transformer": TransformerEncoder,
@@ -20,6 +20,7 @@ class ModuleOutput:
     output: torch.Tensor
     hiddens: Optional[Tuple[torch.Tensor, torch.Tensor]] = None
     embeddings: Optional[torch.Tensor] = None
+    attention: Optional[torch.Tensor] = None
 
     @property
     def has_hiddens(self) -> bool:
@@ -29,6 +30,10 @@ class ModuleOutput:
     def has_embeddings(self) -> bool:
         return self.embeddings is not None
 
+    @property
+    def has_attention(self) -> bool:
+        return self.attention is not None
+
 
 class BaseModule(pl.LightningModule):
     # Indices.
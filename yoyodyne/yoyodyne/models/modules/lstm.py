@@ -1,6 +1,7 @@
 """LSTM model classes."""
 
-from typing import Tuple
+import dataclasses
+from typing import Optional, Tuple
 
 import torch
 from torch import nn
@@ -8,6 +9,10 @@ from torch import nn
 from ... import data, defaults
 from . import attention, base
 
+# Stands in for the log of zero probability. It is finite so that rows with
+# no valid transitions, and sums over unreachable states, do not give NaNs.
+LOG_ZERO = -1e7
+
 
 class LSTMModule(base.BaseModule):
     """Base encoder for LSTM."""
@@ -223,3 +228,183 @@ class LSTMAttentiveDecoder(LSTMDecoder):
     @property
     def name(self) -> str:
         return "attentive LSTM"
+
+
+@dataclasses.dataclass
+class HMMModuleOutput(base.ModuleOutput):
+    """Adds the HMM transition and emission log-probabilities."""
+
+    transitions: Optional[torch.Tensor] = None
+    emissions: Optional[torch.Tensor] = None
+
+
+class HMMLSTMDecoder(LSTMDecoder):
+    """LSTM decoder for the hard monotonic neural HMM.
+
+    The LSTM reads only the target symbols, so all steps can be decoded at
+    once under teacher forcing. From each hidden state it computes, for every
+    source position, the distribution over the next aligned position and over
+    the emitted target symbol.
+
+    Transitions are monotonic and, given a band width w, limited to the next
+    w positions; they are returned as a B x seq_len x source_len x w tensor
+    in which [..., i, k] is the log-probability of moving from source
+    position i to i + k.
+    """
+
+    band_width: Optional[int]
+    # Constructed inside __init__.
+    transition: nn.Linear
+    emission_hidden: nn.Linear
+    emission_encoded: nn.Linear
+    classifier: nn.Linear
+
+    def __init__(self, *args, band_width=None, **kwargs):
+        """Initializes the HMM decoder.
+
+        Args:
+            *args: passed to superclass.
+            band_width (int, optional): number of source positions a
+                transition may move to, counting the current one; if None,
+                transitions are unlimited.
+            **kwargs: passed to superclass.
+
+        Raises:
+            ValueError: the band width is less than 2.
+        """
+        # A band of 1 cannot leave the start symbol, and a smaller one leaves
+        # no transitions at all.
+        if band_width is not None and band_width < 2:
+            raise ValueError(
+                f"HMM band width must be at least 2; got {band_width}"
+            )
+        super().__init__(*args, **kwargs)
+        self.band_width = band_width
+        self.transition = nn.Linear(
+            self.decoder_input_size, self.hidden_size, bias=False
+        )
+        self.emission_hidden = nn.Linear(self.hidden_size, self.hidden_size)
+        self.emission_encoded = nn.Linear(
+            self.decoder_input_size, self.hidden_size, bias=False
+        )
+        self.classifier = nn.Linear(self.hidden_size, self.num_embeddings)
+
+    def forward(
+        self,
+        symbols: torch.Tensor,
+        last_hiddens: Tuple[torch.Tensor, torch.Tensor],
+        encoder_out: torch.Tensor,
+        encoder_mask: torch.Tensor,
+    ) -> HMMModuleOutput:
+        """Decodes one or more steps.
+
+        Args:
+            symbols (torch.Tensor): previous target symbols of shape
+                B x seq_len.
+            last_hiddens (Tuple[torch.Tensor, torch.Tensor]): last hidden
+                states from the decoder of shape
+                (1 x B x decoder_dim, 1 x B x decoder_dim).
+            encoder_out (torch.Tensor): encoded input sequence of shape
+                B x source_len x encoder_dim.
+            encoder_mask (torch.Tensor): mask for the encoded input batch of
+                shape B x source_len.
+
+        Returns:
+            HMMModuleOutput: decoder output, hidden states, transition
+                log-probabilities of shape B x seq_len x source_len x w,
+                and emission log-probabilities of shape
+                B x seq_len x source_len x target_vocab_size.
+        """
+        embedded = self.embed(symbols)
+        output, hiddens = self.module(embedded, last_hiddens)
+        output = self.dropout_layer(output)
+        return HMMModuleOutput(
+            output,
+            hiddens=hiddens,
+            transitions=self.transition_log_probs(
+                output, encoder_out, encoder_mask
+            ),
+            emissions=self.emission_log_probs(output, encoder_out),
+        )
+
+    def width(self, source_length: int) -> int:
+        """Gets the band width for a source length.
+
+        Args:
+            source_length (int).
+
+        Returns:
+            int.
+        """
+        if self.band_width is None:
+            return source_length
+        return min(self.band_width, source_length)
+
+    def transition_log_probs(
+        self,
+        output: torch.Tensor,
+        encoder_out: torch.Tensor,
+        encoder_mask: torch.Tensor,
+    ) -> torch.Tensor:
+        """Computes banded monotonic transition log-probabilities.
+
+        Args:
+            output (torch.Tensor): decoder output of shape
+                B x seq_len x decoder_dim.
+            encoder_out (torch.Tensor): encoded input sequence of shape
+                B x source_len x encoder_dim.
+            encoder_mask (torch.Tensor): mask for the encoded input batch of
+                shape B x source_len.
+
+        Returns:
+            torch.Tensor: log-probabilities of shape
+                B x seq_len x source_len x w.
+        """
+        # -> B x seq_len x source_len.
+        scores = torch.bmm(
+            output, self.transition(encoder_out).transpose(1, 2)
+        )
+        scores = scores.masked_fill(encoder_mask.unsqueeze(1), LOG_ZERO)
+        width = self.width(encoder_mask.size(1))
+        # Pads so that every band is full, then takes the band starting at
+        # each position.
+        # -> B x seq_len x source_len x w.
+        scores = nn.functional.pad(scores, (0, width - 1), value=LOG_ZERO)
+        scores = scores.unfold(-1, width, 1)
+        return nn.functional.log_softmax(scores, dim=-1)
+
+    def emission_log_probs(
+        self, output: torch.Tensor, encoder_out: torch.Tensor
+    ) -> torch.Tensor:
+        """Computes emission log-probabilities for each source position.
+
+        Args:
+            output (torch.Tensor): decoder output of shape
+                B x seq_len x decoder_dim.
+            encoder_out (torch.Tensor): encoded input sequence of shape
+                B x source_len x encoder_dim.
+
+        Returns:
+            torch.Tensor: log-probabilities of shape
+                B x seq_len x source_len x target_vocab_size.
+        """
+        # -> B x seq_len x source_len x decoder_dim.
+        hidden = torch.tanh(
+            self.emission_hidden(output).unsqueeze(2)
+            + self.emission_encoded(encoder_out).unsqueeze(1)
+        )
+        return nn.functional.log_softmax(self.classifier(hidden), dim=-1)
+
+    def get_module(self) -> nn.LSTM:
+        return nn.LSTM(
+            self.embedding_size,
+            self.hidden_size,
+            num_layers=self.layers,
+            dropout=self.dropout,
+            batch_first=True,
+            bidirectional=self.bidirectional,
+        )
+
+    @property
+    def name(self) -> str:
+        return "HMM LSTM"
@@ -1,5 +1,6 @@
 """Transformer model classes."""
 
+import dataclasses
 import math
 from typing import List, Optional, Tuple
 
@@ -113,6 +114,59 @@ class AttentionOutput:
         self.outputs.clear()
 
 
+@dataclasses.dataclass
+class DecoderCache:
+    """Tracks attention keys and values for incremental decoding.
+
+    Keys and values are stored per layer, each of shape
+    B x heads x seq_len x head_size. The self-attention keys and values grow
+    by one position per decoding step, whereas those for the encoder memory
+    are computed once, up front.
+    """
+
+    memory_keys: List[torch.Tensor]
+    memory_values: List[torch.Tensor]
+    # B x 1 x 1 x source_seq_len; true for padding.
+    memory_mask: torch.Tensor
+    keys: List[torch.Tensor]
+    values: List[torch.Tensor]
+    position: int = 0
+    # Keys and values for separately encoded features, if any.
+    features_keys: Optional[List[torch.Tensor]] = None
+    features_values: Optional[List[torch.Tensor]] = None
+    features_mask: Optional[torch.Tensor] = None
+
+    def index_select(self, indices: torch.Tensor) -> "DecoderCache":
+        """Selects the batch elements at the given indices.
+
+        Args:
+            indices (torch.Tensor).
+
+        Returns:
+            DecoderCache.
+        """
+
+        def select(tensors):
+            if tensors is None:
+                return None
+            elif isinstance(tensors, list):
+                return [tensor.index_select(0, indices) for tensor in tensors]
+            else:
+                return tensors.index_select(0, indices)
+
+        return DecoderCache(
+            select(self.memory_keys),
+            select(self.memory_values),
+            select(self.memory_mask),
+            select(self.keys),
+            select(self.values),
+            self.position,
+            select(self.features_keys),
+            select(self.features_values),
+            select(self.features_mask),
+        )
+
+
 class TransformerModule(base.BaseModule):
     """Base module for Transformer."""
 
@@ -565,6 +619,247 @@ class TransformerDecoder(TransformerModule):
         )
         return base.ModuleOutput(output, embeddings=target_embedding)
 
+    # Incremental decoding.
+
+    @staticmethod
+    def _project(
+        attention: nn.MultiheadAttention, x: torch.Tensor, part: int
+    ) -> torch.Tensor:
+        """Applies the query, key, or value projection of an attention.
+
+        Args:
+            attention (nn.MultiheadAttention).
+            x (torch.Tensor): input of shape B x seq_len x d_model.
+            part (int): 0 for queries, 1 for keys, and 2 for values.
+
+        Returns:
+            torch.Tensor: projection of shape
+                B x heads x seq_len x head_size.
+        """
+        size = attention.embed_dim
+        start = part * size
+        weight = attention.in_proj_weight[start : start + size]  # noqa: E203
+        bias = (
+            attention.in_proj_bias[start : start + size]  # noqa: E203
+            if attention.in_proj_bias is not None
+            else None
+        )
+        projected = nn.functional.linear(x, weight, bias)
+        return projected.view(
+            x.size(0), x.size(1), attention.num_heads, attention.head_dim
+        ).transpose(1, 2)
+
+    @staticmethod
+    def _attend(
+        attention: nn.MultiheadAttention,
+        queries: torch.Tensor,
+        keys: torch.Tensor,
+        values: torch.Tensor,
+        mask: Optional[torch.Tensor] = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Computes attention from projected queries, keys, and values.
+
+        Args:
+            attention (nn.MultiheadAttention).
+            queries (torch.Tensor): B x heads x 1 x head_size.
+            keys (torch.Tensor): B x heads x seq_len x head_size.
+            values (torch.Tensor): B x heads x seq_len x head_size.
+            mask (torch.Tensor, optional): mask broadcastable to
+                B x heads x 1 x seq_len, true for positions not to attend to.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: output of shape
+                B x 1 x d_model and attention weights of shape
+                B x heads x 1 x seq_len.
+        """
+        scores = torch.matmul(queries, keys.transpose(2, 3)) / math.sqrt(
+            attention.head_dim
+        )
+        if mask is not None:
+            scores = scores.masked_fill(mask, -math.inf)
+        weights = nn.functional.softmax(scores, dim=-1)
+        output = torch.matmul(
+            nn.functional.dropout(
+                weights, p=attention.dropout, training=attention.training
+            ),
+            values,
+        )
+        # -> B x 1 x d_model.
+        output = output.transpose(1, 2).reshape(
+            queries.size(0), 1, attention.embed_dim
+        )
+        return attention.out_proj(output), weights
+
+    def init_cache(
+        self, encoder_hidden: torch.Tensor, source_mask: torch.Tensor
+    ) -> DecoderCache:
+        """Initializes the cache for incremental decoding.
+
+        This computes the keys and values for the encoder memory, for every
+        layer, once.
+
+        Args:
+            encoder_hidden (torch.Tensor): source encoder hidden state, of
+                shape B x seq_len x hidden_size.
+            source_mask (torch.Tensor): encoder hidden state mask.
+
+        Returns:
+            DecoderCache.
+        """
+        batch_size = encoder_hidden.size(0)
+        memory_keys = []
+        memory_values = []
+        keys = []
+        values = []
+        for layer in self.module.layers:
+            attention = layer.multihead_attn
+            memory_keys.append(self._project(attention, encoder_hidden, 1))
+            memory_values.append(self._project(attention, encoder_hidden, 2))
+            empty = encoder_hidden.new_empty(
+                batch_size,
+                layer.self_attn.num_heads,
+                0,
+                layer.self_attn.head_dim,
+            )
+            keys.append(empty)
+            values.append(empty)
+        return DecoderCache(
+            memory_keys,
+            memory_values,
+            source_mask.view(batch_size, 1, 1, -1),
+            keys,
+            values,
+        )
+
+    def embed_step(self, symbol: torch.Tensor, position: int) -> torch.Tensor:
+        """Embeds symbols at a single position.
+
+        This matches embed, which numbers positions from 0.
+
+        Args:
+            symbol (torch.Tensor): symbols of shape B x 1.
+            position (int).
+
+        Returns:
+            torch.Tensor: embedded tensor of shape B x 1 x embed_dim.
+        """
+        word_embedding = self.esq * self.embeddings(symbol)
+        positional_embedding = self.positional_encoding.positional_encoding[
+            :, position : position + 1  # noqa: E203
+        ] * symbol.ne(self.pad_idx).unsqueeze(2)
+        return self.dropout_layer(word_embedding + positional_embedding)
+
+    def _self_attention_step(
+        self,
+        layer: nn.TransformerDecoderLayer,
+        x: torch.Tensor,
+        cache: DecoderCache,
+        i: int,
+    ) -> torch.Tensor:
+        """Runs a layer's self-attention block over the newest position.
+
+        Args:
+            layer (nn.TransformerDecoderLayer).
+            x (torch.Tensor): input of shape B x 1 x d_model.
+            cache (DecoderCache): updated in place.
+            i (int): layer index.
+
+        Returns:
+            torch.Tensor: output of shape B x 1 x d_model.
+        """
+        attention = layer.self_attn
+        cache.keys[i] = torch.cat(
+            (cache.keys[i], self._project(attention, x, 1)), dim=2
+        )
+        cache.values[i] = torch.cat(
+            (cache.values[i], self._project(attention, x, 2)), dim=2
+        )
+        # Earlier positions are all visible, so no causal mask is needed.
+        output, _ = self._attend(
+            attention,
+            self._project(attention, x, 0),
+            cache.keys[i],
+            cache.values[i],
+        )
+        return layer.dropout1(output)
+
+    def _layer_step(
+        self,
+        layer: nn.TransformerDecoderLayer,
+        x: torch.Tensor,
+        cache: DecoderCache,
+        i: int,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Runs one decoder layer over the newest position.
+
+        Args:
+            layer (nn.TransformerDecoderLayer).
+            x (torch.Tensor): input of shape B x 1 x d_model.
+            cache (DecoderCache): updated in place.
+            i (int): layer index.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: output of shape
+                B x 1 x d_model and cross-attention weights of shape
+                B x heads x 1 x source_seq_len.
+        """
+
+        def cross_attention(
+            x: torch.Tensor,
+        ) -> Tuple[torch.Tensor, torch.Tensor]:
+            attention = layer.multihead_attn
+            output, weights = self._attend(
+                attention,
+                self._project(attention, x, 0),
+                cache.memory_keys[i],
+                cache.memory_values[i],
+                cache.memory_mask,
+            )
+            return layer.dropout2(output), weights
+
+        if layer.norm_first:
+            x = x + self._self_attention_step(layer, layer.norm1(x), cache, i)
+            output, weights = cross_attention(layer.norm2(x))
+            x = x + output
+            x = x + layer._ff_block(layer.norm3(x))
+        else:
+            x = layer.norm1(x + self._self_attention_step(layer, x, cache, i))
+            output, weights = cross_attention(x)
+            x = layer.norm2(x + output)
+            x = layer.norm3(x + layer._ff_block(x))
+        return x, weights
+
+    def forward_step(
+        self, symbol: torch.Tensor, cache: DecoderCache
+    ) -> base.ModuleOutput:
+        """Decodes a single position, using and updating the cache.
+
+        This is equivalent to running forward over the entire prefix and
+        keeping the last position, but only the newest symbol is processed.
+
+        Args:
+            symbol (torch.Tensor): previously decoded symbols of shape B x 1.
+            cache (DecoderCache): updated in place.
+
+        Returns:
+            base.ModuleOutput: decoder output of shape B x 1 x d_model,
+                with the embedded symbols and the last layer's
+                cross-attention weights, of shape B x 1 x source_seq_len.
+        """
+        target_embedding = self.embed_step(symbol, cache.position)
+        output = target_embedding
+        for i, layer in enumerate(self.module.layers):
+            output, weights = self._layer_step(layer, output, cache, i)
+        if self.module.norm is not None:
+            output = self.module.norm(output)
+        cache.position += 1
+        return base.ModuleOutput(
+            output,
+            embeddings=target_embedding,
+            # Averages the last layer's attention weights over heads.
+            attention=weights.mean(dim=1),
+        )
+
     def get_module(self) -> nn.TransformerDecoder:
         decoder_layer = nn.TransformerDecoderLayer(
             d_model=self.decoder_input_size,
@@ -607,7 +902,8 @@ class TransformerPointerDecoder(TransformerDecoder):
 
     `attention_output` tracks the output of multiheaded attention from each
     decoder step wrt the encoded input. This is achieved with a hook into the
-    forward pass. We additionally expect separately decoded features, which
+    forward pass; forward_step instead returns the newest step's attention
+    directly. We additionally expect separately decoded features, which
     are passed through `features_attention_heads` multiheaded attentions from
     each decoder step wrt the encoded features.
 
@@ -685,6 +981,114 @@ class TransformerPointerDecoder(TransformerDecoder):
             )
         return base.ModuleOutput(output, embeddings=target_embedding)
 
+    def init_cache(
+        self,
+        encoder_hidden: torch.Tensor,
+        source_mask: torch.Tensor,
+        features_memory: Optional[torch.Tensor] = None,
+        features_memory_mask: Optional[torch.Tensor] = None,
+    ) -> DecoderCache:
+        """Initializes the cache for incremental decoding.
+
+        This computes the keys and values for the encoder memory and, if
+        present, the encoded features, for every layer, once.
+
+        Args:
+            encoder_hidden (torch.Tensor): source encoder hidden state, of
+                shape B x seq_len x hidden_size.
+            source_mask (torch.Tensor): encoder hidden state mask.
+            features_memory (Optional[torch.Tensor]): Encoded features.
+            features_memory_mask (Optional[torch.Tensor]): Mask for encoded
+                features.
+
+        Returns:
+            DecoderCache.
+        """
+        cache = super().init_cache(encoder_hidden, source_mask)
+        if self.separate_features:
+            cache.features_keys = []
+            cache.features_values = []
+            for layer in self.module.layers:
+                attention = layer.feature_multihead_attn
+                cache.features_keys.append(
+                    self._project(attention, features_memory, 1)
+                )
+                cache.features_values.append(
+                    self._project(attention, features_memory, 2)
+                )
+            if features_memory_mask is not None:
+                cache.features_mask = features_memory_mask.view(
+                    features_memory_mask.size(0), 1, 1, -1
+                )
+        return cache
+
+    def _layer_step(
+        self,
+        layer: nn.TransformerDecoderLayer,
+        x: torch.Tensor,
+        cache: DecoderCache,
+        i: int,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Runs one decoder layer over the newest position.
+
+        With separate features, this mirrors
+        TransformerDecoderLayerSeparateFeatures.forward.
+
+        Args:
+            layer (nn.TransformerDecoderLayer).
+            x (torch.Tensor): input of shape B x 1 x d_model.
+            cache (DecoderCache): updated in place.
+            i (int): layer index.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: output of shape
+                B x 1 x d_model and cross-attention weights of shape
+                B x heads x 1 x source_seq_len.
+        """
+        if not self.separate_features:
+            return super()._layer_step(layer, x, cache, i)
+
+        def cross_attention(
+            x: torch.Tensor,
+        ) -> Tuple[torch.Tensor, torch.Tensor]:
+            attention = layer.multihead_attn
+            symbol_attention, weights = self._attend(
+                attention,
+                self._project(attention, x, 0),
+                cache.memory_keys[i],
+                cache.memory_values[i],
+                cache.memory_mask,
+            )
+            symbol_attention = layer.symbols_linear(
+                layer.dropout2(symbol_attention)
+            )
+            attention = layer.feature_multihead_attn
+            feature_attention, _ = self._attend(
+                attention,
+                self._project(attention, x, 0),
+                cache.features_keys[i],
+                cache.features_values[i],
+                cache.features_mask,
+            )
+            feature_attention = layer.features_linear(
+                layer.dropout2(feature_attention)
+            )
+            return (
+                torch.cat([symbol_attention, feature_attention], dim=2),
+                weights,
+            )
+
+        if layer.norm_first:
+            x = x + self._self_attention_step(layer, layer.norm1(x), cache, i)
+            x, weights = cross_attention(layer.norm2(x))
+            x = x + layer._ff_block(layer.norm3(x))
+        else:
+            x = layer.norm1(x + self._self_attention_step(layer, x, cache, i))
+            output, weights = cross_attention(x)
+            x = layer.norm2(x + output)
+            x = layer.norm3(x + layer._ff_block(x))
+        return x, weights
+
     def get_module(self) -> nn.TransformerDecoder:
         if self.separate_features:
             decoder_layer = TransformerDecoderLayerSeparateFeatures(
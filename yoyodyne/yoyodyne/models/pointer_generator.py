@@ -7,7 +7,7 @@ import torch
 from torch import nn
 
 from .. import data
-from . import lstm, modules, transformer
+from . import beam_search, lstm, modules, transformer
 
 
 class Error(Exception):
@@ -319,9 +319,10 @@ class PointerGeneratorLSTMEncoderDecoder(
                 symbols.
             features_mask (torch.Tensor, optional): mask for the batch of
                 encoded feature symbols.
-            target (torch.Tensor, optional): target symbols;  we
-                decode up to `len(target)` symbols. If it is None, then we
-                decode up to `self.max_target_length` symbols.
+            target (torch.Tensor, optional): target symbols. With teacher
+                forcing, we decode `len(target)` symbols. Otherwise, we
+                decode up to `self.max_target_length` symbols, and if a
+                target is given, do not stop before `len(target)` symbols.
 
         Returns:
             torch.Tensor.
@@ -337,8 +338,10 @@ class PointerGeneratorLSTMEncoderDecoder(
             .unsqueeze(1)
         )
         predictions = []
+        # Without teacher forcing, the number of steps does not depend on the
+        # target, so predictions do not depend on how items are batched.
         num_steps = (
-            target.size(1) if target is not None else self.max_target_length
+            target.size(1) if teacher_forcing else self.max_target_length
         )
         # Tracks when each sequence has decoded an EOS.
         finished = torch.zeros(batch_size, device=self.device)
@@ -371,24 +374,95 @@ class PointerGeneratorLSTMEncoderDecoder(
                 # when we have decoded at least the the same number of steps as
                 # the target length.
                 if finished.all():
-                    if target is None or decoder_input.size(-1) >= target.size(
-                        -1
-                    ):
+                    if target is None or t + 1 >= target.size(1):
                         break
         predictions = torch.stack(predictions).transpose(0, 1)
         return predictions
 
-    def forward(
+    def decode_compact(
         self,
-        batch: data.PaddedBatch,
+        source_enc: torch.Tensor,
+        source_mask: torch.Tensor,
+        source_indices: torch.Tensor,
+        decoder_hiddens: Tuple[torch.Tensor, torch.Tensor],
+        num_steps: int,
+        features_enc: Optional[torch.Tensor] = None,
+        features_mask: Optional[torch.Tensor] = None,
     ) -> torch.Tensor:
-        """Runs the encoder-decoder.
+        """Decodes greedily, dropping sequences from the batch as they finish.
+
+        The decoder state and encoded inputs are compacted to the sequences
+        which have not yet decoded an EOS; the remaining steps of finished
+        sequences are padding. Only the chosen symbols are kept, not their
+        scores.
+
+        Args:
+            source_enc (torch.Tensor): batch of encoded input symbols.
+            source_mask (torch.Tensor): mask for the batch of encoded input
+                symbols.
+            source_indices (torch.Tensor): Indices of the input for calculating
+                pointer weights.
+            decoder_hiddens (Tuple[torch.Tensor, torch.Tensor]).
+            num_steps (int): maximum number of symbols to decode.
+            features_enc (torch.Tensor, optional): batch of encoded feaure
+                symbols.
+            features_mask (torch.Tensor, optional): mask for the batch of
+                encoded feature symbols.
+
+        Returns:
+            torch.Tensor: predicted symbols of shape B x seq_len.
+        """
+        batch_size = source_enc.size(0)
+        # -> B x 1.
+        decoder_input = torch.full(
+            (batch_size, 1), self.start_idx, device=self.device
+        )
+        predictions = self._padding_symbols(batch_size, num_steps)
+        # Batch indices of the sequences still being decoded.
+        active = torch.arange(batch_size, device=self.device)
+        for t in range(num_steps):
+            output, decoder_hiddens = self.decode_step(
+                decoder_input,
+                decoder_hiddens,
+                source_indices,
+                source_enc,
+                source_mask,
+                features_enc=features_enc,
+                features_mask=features_mask,
+            )
+            decoder_input = self._get_predicted(output)
+            predictions[active, t] = decoder_input.squeeze(1)
+            unfinished = decoder_input.squeeze(1) != self.end_idx
+            if not unfinished.all():
+                if not unfinished.any():
+                    return predictions[:, : t + 1]
+                keep = unfinished.nonzero().squeeze(1)
+                active = active[keep]
+                decoder_input = decoder_input[keep]
+                decoder_hiddens = self._reorder_hiddens(decoder_hiddens, keep)
+                source_enc = source_enc[keep]
+                source_mask = source_mask[keep]
+                source_indices = source_indices[keep]
+                if features_enc is not None:
+                    features_enc = features_enc[keep]
+                if features_mask is not None:
+                    features_mask = features_mask[keep]
+        return predictions
+
+    def _encode(
+        self, batch: data.PaddedBatch
+    ) -> Tuple[
+        torch.Tensor, Tuple[torch.Tensor, torch.Tensor], Optional[torch.Tensor]
+    ]:
+        """Encodes the source and, if present, the features.
 
         Args:
             batch (data.PaddedBatch).
 
         Returns:
-            torch.Tensor.
+            Tuple[torch.Tensor, Tuple[torch.Tensor, torch.Tensor],
+                Optional[torch.Tensor]]: the encoded source, the initial
+                decoder hidden states, and the encoded features.
         """
         encoder_output = self.source_encoder(batch.source)
         source_encoded = encoder_output.output
@@ -405,46 +479,113 @@ class PointerGeneratorLSTMEncoderDecoder(
                 len(batch), self.source_encoder.layers
             )
         if not self.has_features_encoder:
-            if self.beam_width is not None and self.beam_width > 1:
-                # predictions = self.beam_decode(
-                # batch_size, x_mask, encoder_out, beam_width=self.beam_width
-                # )
-                raise NotImplementedError
-            else:
-                predictions = self.decode(
-                    source_encoded,
-                    batch.source.mask,
-                    batch.source.padded,
-                    last_hiddens,
-                    self.teacher_forcing if self.training else False,
-                    target=batch.target.padded if batch.target else None,
-                )
-        else:
-            features_encoder_output = self.features_encoder(batch.features)
-            features_encoded = features_encoder_output.output
-            if features_encoder_output.has_hiddens:
-                h_features, c_features = features_encoder_output.hiddens
-                h_features, c_features = self._reshape_hiddens(
-                    h_features,
-                    c_features,
-                    self.features_encoder.layers,
-                    self.features_encoder.num_directions,
-                )
-            else:
-                h_features, c_features = self.init_hiddens(
-                    len(batch), self.source_encoder.layers
-                )
-            predictions = self.decode(
+            return source_encoded, last_hiddens, None
+        features_encoded = self.features_encoder(batch.features).output
+        return source_encoded, last_hiddens, features_encoded
+
+    def forward(
+        self,
+        batch: data.PaddedBatch,
+        compact: bool = False,
+    ) -> torch.Tensor:
+        """Runs the encoder-decoder.
+
+        Args:
+            batch (data.PaddedBatch).
+            compact (bool, optional): if true, decodes greedily with
+                decode_compact, returning only the predicted symbols.
+
+        Returns:
+            torch.Tensor.
+        """
+        source_encoded, last_hiddens, features_encoded = self._encode(batch)
+        features_mask = (
+            batch.features.mask if self.has_features_encoder else None
+        )
+        if compact:
+            return self.decode_compact(
                 source_encoded,
                 batch.source.mask,
                 batch.source.padded,
                 last_hiddens,
-                self.teacher_forcing if self.training else False,
+                self.max_target_length,
                 features_enc=features_encoded,
-                features_mask=batch.features.mask,
-                target=batch.target.padded if batch.target else None,
+                features_mask=features_mask,
             )
-        return predictions
+        return self.decode(
+            source_encoded,
+            batch.source.mask,
+            batch.source.padded,
+            last_hiddens,
+            self.teacher_forcing if self.training else False,
+            features_enc=features_encoded,
+            features_mask=features_mask,
+            target=batch.target.padded if batch.target else None,
+        )
+
+    def beam_search(
+        self, batch: data.PaddedBatch, n: int = 1
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Decodes the output sequence with beam search.
+
+        Args:
+            batch (data.PaddedBatch).
+            n (int, optional): number of hypotheses to return.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: predictions of shape
+                B x n x seq_len and their log-likelihoods of shape B x n.
+        """
+        source_encoded, last_hiddens, features_encoded = self._encode(batch)
+        # Encoder outputs and masks are expanded once, up front.
+        source_encoded = beam_search.expand(source_encoded, self.beam_width)
+        source_mask = beam_search.expand(batch.source.mask, self.beam_width)
+        source_indices = beam_search.expand(
+            batch.source.padded, self.beam_width
+        )
+        features_mask = None
+        if self.has_features_encoder:
+            features_encoded = beam_search.expand(
+                features_encoded, self.beam_width
+            )
+            features_mask = beam_search.expand(
+                batch.features.mask, self.beam_width
+            )
+        # Hidden states are layers x B x hidden_size.
+        last_hiddens = tuple(
+            hidden.repeat_interleave(self.beam_width, dim=1)
+            for hidden in last_hiddens
+        )
+
+        def step(
+            symbols: torch.Tensor, hiddens: Tuple[torch.Tensor, torch.Tensor]
+        ) -> Tuple[torch.Tensor, Tuple[torch.Tensor, torch.Tensor]]:
+            output, hiddens = self.decode_step(
+                symbols.unsqueeze(1),
+                hiddens,
+                source_indices,
+                source_encoded,
+                source_mask,
+                features_enc=features_encoded,
+                features_mask=features_mask,
+            )
+            # The output is already a log-probability.
+            return output.squeeze(1), hiddens
+
+        return beam_search.search(
+            step,
+            self._reorder_hiddens,
+            last_hiddens,
+            batch_size=len(batch),
+            beam_width=self.beam_width,
+            start_idx=self.start_idx,
+            end_idx=self.end_idx,
+            pad_idx=self.pad_idx,
+            max_length=self.max_target_length,
+            device=self.device,
+            n=n,
+            length_normalization=self.length_normalization,
+        )
 
     @staticmethod
     def _reshape_hiddens(
@@ -572,8 +713,8 @@ class PointerGeneratorTransformerEncoderDecoder(
         )
         # Repeats the source indices for each target.
         # -> B x tgt_seq_len x src_seq_len.
-        repeated_source_indices = source_indices.unsqueeze(1).repeat(
-            1, mha_outputs.size(1), 1
+        repeated_source_indices = source_indices.unsqueeze(1).expand(
+            -1, mha_outputs.size(1), -1
         )
         # Scatters the attention weights onto the ptr_dist tensor at their
         # vocab indices in order to get outputs that match the indexing of the
@@ -590,6 +731,54 @@ class PointerGeneratorTransformerEncoderDecoder(
         scaled_output_dist = output_dist * gen_probs
         return torch.log(scaled_output_dist + scaled_ptr_dist)
 
+    def decode_step_incremental(
+        self,
+        symbol: torch.Tensor,
+        cache: modules.transformer.DecoderCache,
+        encoder_outputs: torch.Tensor,
+        source_indices: torch.Tensor,
+    ) -> torch.Tensor:
+        """Runs the decoder over the newest symbol only.
+
+        This uses and updates the decoder cache, and computes the pointer
+        distribution from the newest step's attention to the encoded source.
+
+        Args:
+            symbol (torch.Tensor): previously decoded symbols of shape B x 1.
+            cache (modules.transformer.DecoderCache): updated in place.
+            encoder_outputs (torch.Tensor): Encoded output representations.
+            source_indices (torch.Tensor): Source token vocabulary ids.
+
+        Returns:
+            torch.Tensor: Output probabilities of the shape
+                B x 1 x target_vocab_size.
+        """
+        decoder_output = self.decoder.forward_step(symbol, cache)
+        # -> B x 1 x src_seq_len.
+        attention = decoder_output.attention
+        target_embeddings = decoder_output.embeddings
+        decoder_output = decoder_output.output
+        logits = self.classifier(decoder_output)
+        output_dist = nn.functional.softmax(logits, dim=2)
+        # -> B x 1 x target_vocab_size.
+        ptr_dist = torch.zeros(
+            attention.size(0),
+            1,
+            self.target_vocab_size,
+            device=self.device,
+            dtype=attention.dtype,
+        )
+        ptr_dist.scatter_add_(2, source_indices.unsqueeze(1), attention)
+        # -> B x 1 x encoder_dim.
+        context = torch.bmm(attention, encoder_outputs)
+        # Probability of generating (from output_dist).
+        gen_probs = self.generation_probability(
+            context, decoder_output, target_embeddings
+        )
+        scaled_ptr_dist = ptr_dist * (1 - gen_probs)
+        scaled_output_dist = output_dist * gen_probs
+        return torch.log(scaled_output_dist + scaled_ptr_dist)
+
     def _decode_greedy(
         self,
         encoder_hidden: torch.Tensor,
@@ -618,37 +807,31 @@ class PointerGeneratorTransformerEncoderDecoder(
         # The output distributions to be returned.
         outputs = []
         batch_size = encoder_hidden.size(0)
-        # The predicted symbols at each iteration.
-        predictions = [
-            torch.tensor(
-                [self.start_idx for _ in range(encoder_hidden.size(0))],
-                device=self.device,
-            )
-        ]
+        # Decodes incrementally, one symbol at a time, caching the attention
+        # keys and values for the prefix and the encoder memory.
+        cache = self.decoder.init_cache(
+            encoder_hidden,
+            source_mask,
+            features_memory=features_enc,
+            features_memory_mask=features_mask,
+        )
+        # -> B x 1.
+        symbol = torch.full(
+            (batch_size, 1), self.start_idx, device=self.device
+        )
         # Tracking when each sequence has decoded an EOS.
         finished = torch.zeros(batch_size, device=self.device)
         for _ in range(self.max_target_length):
-            target_tensor = torch.stack(predictions, dim=1)
-            # Uses a dummy mask of all ones.
-            target_mask = torch.ones_like(target_tensor, dtype=torch.float)
-            target_mask = target_mask == 0
-            scores = self.decode_step(
-                encoder_hidden,
-                source_mask,
-                source_indices,
-                target_tensor,
-                target_mask,
-                features_enc=features_enc,
-                features_mask=features_mask,
+            scores = self.decode_step_incremental(
+                symbol, cache, encoder_hidden, source_indices
             )
             last_output = scores[:, -1, :]
             outputs.append(last_output)
-            # -> B x 1 x 1.
-            _, pred = torch.max(last_output, dim=1)
-            predictions.append(pred)
+            # -> B x 1.
+            symbol = torch.argmax(last_output, dim=1, keepdim=True)
             # Updates to track which sequences have decoded an EOS.
             finished = torch.logical_or(
-                finished, (predictions[-1] == self.end_idx)
+                finished, (symbol.squeeze(1) == self.end_idx)
             )
             # Breaks when all sequences have predicted an EOS symbol. If we
             # have a target (and are thus computing loss), we only break when
@@ -663,11 +846,14 @@ class PointerGeneratorTransformerEncoderDecoder(
     def forward(
         self,
         batch: data.PaddedBatch,
+        compact: bool = False,
     ) -> torch.Tensor:
         """Runs the encoder-decoder.
 
         Args:
             batch (data.PaddedBatch).
+            compact (bool, optional): if true, decodes greedily with
+                _decode_greedy_compact, returning only the predicted symbols.
 
         Returns:
             torch.Tensor.
@@ -693,36 +879,159 @@ class PointerGeneratorTransformerEncoderDecoder(
             if self.has_features_encoder:
                 features_encoder_output = self.features_encoder(batch.features)
                 features_encoded = features_encoder_output.output
-            if self.beam_width is not None and self.beam_width > 1:
-                # predictions = self.beam_decode(
-                # batch_size, x_mask, encoder_out, beam_width=self.beam_width
-                # )
-                raise NotImplementedError
-            else:
-                output = self.decode_step(
-                    source_encoded,
-                    batch.source.mask,
-                    batch.source.padded,
-                    target_padded,
-                    target_mask,
-                    features_enc=features_encoded,
-                )
-                output = output[:, :-1, :]  # Ignore EOS.
+            output = self.decode_step(
+                source_encoded,
+                batch.source.mask,
+                batch.source.padded,
+                target_padded,
+                target_mask,
+                features_enc=features_encoded,
+            )
+            output = output[:, :-1, :]  # Ignore EOS.
         else:
             features_encoded = None
             if self.has_features_encoder:
                 features_encoder_output = self.features_encoder(batch.features)
                 features_encoded = features_encoder_output.output
             # -> B x seq_len x output_size.
-            output = self._decode_greedy(
-                source_encoded,
-                batch.source.mask,
-                batch.source.padded,
-                batch.target.padded if batch.target else None,
-                features_enc=features_encoded,
-            )
+            if compact:
+                output = self._decode_greedy_compact(
+                    source_encoded,
+                    batch.source.mask,
+                    batch.source.padded,
+                    features_enc=features_encoded,
+                )
+            else:
+                output = self._decode_greedy(
+                    source_encoded,
+                    batch.source.mask,
+                    batch.source.padded,
+                    batch.target.padded if batch.target else None,
+                    features_enc=features_encoded,
+                )
         return output
 
+    def _decode_greedy_compact(
+        self,
+        encoder_hidden: torch.Tensor,
+        source_mask: torch.Tensor,
+        source_indices: torch.Tensor,
+        features_enc: Optional[torch.Tensor] = None,
+        features_mask: Optional[torch.Tensor] = None,
+    ) -> torch.Tensor:
+        """Decodes greedily, dropping sequences from the batch as they finish.
+
+        The decoder cache and encoded inputs are compacted to the sequences
+        which have not yet decoded an EOS; the remaining steps of finished
+        sequences are padding. Only the chosen symbols are kept, not their
+        scores.
+
+        Args:
+            encoder_hidden (torch.Tensor): Hidden states from the encoder.
+            source_mask (torch.Tensor): Mask for the encoded source tokens.
+            source_indices (torch.Tensor): Indices of the source symbols.
+            features_enc (Optional[torch.Tensor]): Encoded features.
+            features_mask (Optional[torch.Tensor]): Mask for encoded features.
+
+        Returns:
+            torch.Tensor: predicted symbols of shape B x seq_len.
+        """
+        batch_size = encoder_hidden.size(0)
+        cache = self.decoder.init_cache(
+            encoder_hidden,
+            source_mask,
+            features_memory=features_enc,
+            features_memory_mask=features_mask,
+        )
+        # -> B x 1.
+        symbol = torch.full(
+            (batch_size, 1), self.start_idx, device=self.device
+        )
+        outputs = self._padding_symbols(batch_size, self.max_target_length)
+        # Batch indices of the sequences still being decoded.
+        active = torch.arange(batch_size, device=self.device)
+        for t in range(self.max_target_length):
+            scores = self.decode_step_incremental(
+                symbol, cache, encoder_hidden, source_indices
+            )
+            last_output = scores[:, -1, :]
+            # -> B x 1.
+            symbol = torch.argmax(last_output, dim=1, keepdim=True)
+            outputs[active, t] = symbol.squeeze(1)
+            unfinished = symbol.squeeze(1) != self.end_idx
+            if not unfinished.all():
+                if not unfinished.any():
+                    return outputs[:, : t + 1]
+                keep = unfinished.nonzero().squeeze(1)
+                active = active[keep]
+                symbol = symbol[keep]
+                cache = cache.index_select(keep)
+                encoder_hidden = encoder_hidden[keep]
+                source_indices = source_indices[keep]
+        return outputs
+
+    def beam_search(
+        self, batch: data.PaddedBatch, n: int = 1
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Decodes the output sequence with beam search.
+
+        The decoder state of each hypothesis is its cache of attention keys
+        and values.
+
+        Args:
+            batch (data.PaddedBatch).
+            n (int, optional): number of hypotheses to return.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: predictions of shape
+                B x n x seq_len and their log-likelihoods of shape B x n.
+        """
+        batch_size = len(batch)
+        # Encoder outputs are expanded once, up front.
+        source_encoded = beam_search.expand(
+            self.source_encoder(batch.source).output, self.beam_width
+        )
+        source_mask = beam_search.expand(batch.source.mask, self.beam_width)
+        source_indices = beam_search.expand(
+            batch.source.padded, self.beam_width
+        )
+        features_encoded = None
+        if self.has_features_encoder:
+            features_encoded = beam_search.expand(
+                self.features_encoder(batch.features).output, self.beam_width
+            )
+
+        def step(
+            symbols: torch.Tensor, cache: modules.transformer.DecoderCache
+        ) -> Tuple[torch.Tensor, modules.transformer.DecoderCache]:
+            scores = self.decode_step_incremental(
+                symbols.unsqueeze(1), cache, source_encoded, source_indices
+            )
+            # The scores are already log-probabilities.
+            return scores[:, -1, :], cache
+
+        def reorder(
+            cache: modules.transformer.DecoderCache, indices: torch.Tensor
+        ) -> modules.transformer.DecoderCache:
+            return cache.index_select(indices)
+
+        return beam_search.search(
+            step,
+            reorder,
+            self.decoder.init_cache(
+                source_encoded, source_mask, features_memory=features_encoded
+            ),
+            batch_size=batch_size,
+            beam_width=self.beam_width,
+            start_idx=self.start_idx,
+            end_idx=self.end_idx,
+            pad_idx=self.pad_idx,
+            max_length=self.max_target_length,
+            device=self.device,
+            n=n,
+            length_normalization=self.length_normalization,
+        )
+
     @property
     def name(self) -> str:
         return "pointer-generator transformer"
@@ -0,0 +1,160 @@
+"""Parallel expert rollouts.
+
+Expert rollouts for a batch can be split into shards and computed in a
+persistent process pool. Each worker receives its own copy of the expert,
+including the SED aligner, once, when it starts. Workers return the optimal
+actions packed into two arrays: the concatenated action encodings, and the
+number of optimal actions for each item.
+"""
+
+import concurrent.futures
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy
+
+from . import expert
+
+# A rollout item: source, target, alignment, prediction, and the prefixes of
+# the target matching the prediction.
+Item = Tuple[
+    Sequence[Any], Sequence[Any], int, Sequence[Any], List[expert.Prefix]
+]
+
+# The expert held by each worker process.
+_expert: Optional[expert.Expert] = None
+
+
+def rollout(
+    oracle: expert.Expert, items: List[Item], max_action_seq_len: int
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Finds the optimal actions for each item.
+
+    Args:
+        oracle (expert.Expert).
+        items (List[Item]).
+        max_action_seq_len (int).
+
+    Returns:
+        Tuple[numpy.ndarray, numpy.ndarray]: the concatenated optimal action
+            encodings, and the number of optimal actions for each item.
+    """
+    optimal_actions = [
+        oracle.optimal_actions(
+            source,
+            target,
+            alignment,
+            prediction,
+            max_action_seq_len=max_action_seq_len,
+            prefixes=prefixes,
+        )
+        for source, target, alignment, prediction, prefixes in items
+    ]
+    counts = numpy.fromiter(
+        (len(actions) for actions in optimal_actions),
+        dtype=numpy.int64,
+        count=len(optimal_actions),
+    )
+    flat = numpy.fromiter(
+        (action for actions in optimal_actions for action in actions),
+        dtype=numpy.int64,
+        count=int(counts.sum()),
+    )
+    return flat, counts
+
+
+def _initialize(oracle: expert.Expert) -> None:
+    global _expert
+    _expert = oracle
+
+
+def _rollout(
+    items: List[Item], max_action_seq_len: int
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    return rollout(_expert, items, max_action_seq_len)
+
+
+class Rollouts:
+    """Optimal actions for a batch, which may still be being computed.
+
+    Args:
+        futures (List[concurrent.futures.Future]): one per shard, in order.
+    """
+
+    futures: List[concurrent.futures.Future]
+
+    def __init__(self, futures: List[concurrent.futures.Future]):
+        self.futures = futures
+
+    @classmethod
+    def from_result(
+        cls, result: Tuple[numpy.ndarray, numpy.ndarray]
+    ) -> "Rollouts":
+        """Wraps optimal actions which have already been computed.
+
+        Args:
+            result (Tuple[numpy.ndarray, numpy.ndarray]).
+
+        Returns:
+            Rollouts.
+        """
+        future = concurrent.futures.Future()
+        future.set_result(result)
+        return cls([future])
+
+    def result(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """Waits for and merges the shards.
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray]: the concatenated optimal
+                action encodings, and the number of optimal actions for each
+                item.
+        """
+        results = [future.result() for future in self.futures]
+        if len(results) == 1:
+            return results[0]
+        flats, counts = zip(*results)
+        return numpy.concatenate(flats), numpy.concatenate(counts)
+
+
+class RolloutPool:
+    """A persistent pool of processes for expert rollouts.
+
+    Args:
+        oracle (expert.Expert): copied to each worker when it starts.
+        processes (int): number of processes, and of shards per batch.
+    """
+
+    processes: int
+    pool: concurrent.futures.ProcessPoolExecutor
+
+    def __init__(self, oracle: expert.Expert, processes: int):
+        self.processes = processes
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            processes, initializer=_initialize, initargs=(oracle,)
+        )
+
+    def submit(self, items: List[Item], max_action_seq_len: int) -> Rollouts:
+        """Starts rollouts for a batch, returning without waiting for them.
+
+        Args:
+            items (List[Item]).
+            max_action_seq_len (int).
+
+        Returns:
+            Rollouts.
+        """
+        shard_size = max(-(-len(items) // self.processes), 1)
+        return Rollouts(
+            [
+                self.pool.submit(
+                    _rollout,
+                    items[start : start + shard_size],  # noqa: E203
+                    max_action_seq_len,
+                )
+                for start in range(0, max(len(items), 1), shard_size)
+            ]
+        )
+
+    def shutdown(self) -> None:
+        """Stops the worker processes."""
+        self.pool.shutdown()
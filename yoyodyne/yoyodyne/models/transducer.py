@@ -7,8 +7,8 @@ import torch
 from maxwell import actions
 from torch import nn
 
-from .. import data
-from . import expert, lstm, modules
+from .. import data, defaults
+from . import base, expert, lstm, modules, rollouts
 
 
 class ActionError(Exception):
@@ -28,11 +28,14 @@ class TransducerEncoderDecoder(lstm.LSTMEncoderDecoder):
     """
 
     expert: expert.Expert
+    oracle_rollout_processes: int
+    _rollout_pool: Optional[rollouts.RolloutPool]
 
     def __init__(
         self,
         expert,
         *args,
+        oracle_rollout_processes=defaults.ORACLE_ROLLOUT_PROCESSES,
         **kwargs,
     ):
         """Initializes transducer model.
@@ -40,6 +43,9 @@ class TransducerEncoderDecoder(lstm.LSTMEncoderDecoder):
         Args:
             expert (expert.Expert): oracle that guides training for transducer.
             *args: passed to superclass.
+            oracle_rollout_processes (int, optional): number of processes for
+                expert rollouts; with more than one, these run in a process
+                pool, started on first use.
             **kwargs: passed to superclass.
         """
         # Alternate outputs than dataset targets.
@@ -48,8 +54,91 @@ class TransducerEncoderDecoder(lstm.LSTMEncoderDecoder):
         # Model specific variables.
         self.expert = expert  # Oracle to train model.
         self.actions = self.expert.actions
-        self.substitutions = self.actions.substitutions
-        self.insertions = self.actions.insertions
+        self.oracle_rollout_processes = oracle_rollout_processes
+        self._rollout_pool = None
+        # Additive masks over the valid actions; these are not saved with
+        # the model since they are determined by the action vocabulary.
+        end = torch.tensor([self.actions.end_idx])
+        end_of_input_actions = torch.cat((end, self.actions.insertions))
+        self.register_buffer(
+            "end_of_input_mask",
+            self._action_mask(end_of_input_actions),
+            persistent=False,
+        )
+        self.register_buffer(
+            "valid_action_mask",
+            self._action_mask(
+                torch.cat(
+                    (
+                        end_of_input_actions,
+                        torch.tensor(
+                            [self.actions.copy_idx, self.actions.del_idx]
+                        ),
+                        self.actions.substitutions,
+                    )
+                )
+            ),
+            persistent=False,
+        )
+        self.register_buffer(
+            "complete_mask", self._action_mask(end), persistent=False
+        )
+        self._register_action_effects()
+
+    def _action_mask(self, valid_actions: torch.Tensor) -> torch.Tensor:
+        """Builds an additive mask permitting only the given actions.
+
+        Args:
+            valid_actions (torch.Tensor): encoded valid actions.
+
+        Returns:
+            torch.Tensor: mask of shape num_actions, with 0 for valid actions
+                and -inf otherwise.
+        """
+        mask = torch.full((len(self.actions),), -math.inf)
+        mask[valid_actions] = 0.0
+        return mask
+
+    def _register_action_effects(self) -> None:
+        """Registers lookup tables for the effect of each action.
+
+        These give, for each encoded action, how far it advances the
+        alignment, whether it emits a symbol, whether that symbol is copied
+        from the source, and otherwise which symbol it emits.
+
+        Raises:
+            ActionError: unknown action.
+        """
+        num_actions = len(self.actions)
+        alignment_deltas = torch.zeros(num_actions, dtype=torch.int64)
+        emits = torch.zeros(num_actions, dtype=torch.bool)
+        copies = torch.zeros(num_actions, dtype=torch.bool)
+        symbols = torch.full((num_actions,), self.pad_idx, dtype=torch.int64)
+        for i, a in enumerate(self.actions.i2w):
+            if isinstance(a, actions.ConditionalCopy):
+                alignment_deltas[i] = 1
+                emits[i] = True
+                copies[i] = True
+            elif isinstance(a, actions.ConditionalDel):
+                alignment_deltas[i] = 1
+            elif isinstance(a, actions.ConditionalIns):
+                emits[i] = True
+                symbols[i] = a.new
+            elif isinstance(a, actions.ConditionalSub):
+                alignment_deltas[i] = 1
+                emits[i] = True
+                symbols[i] = a.new
+            elif isinstance(a, actions.End):
+                emits[i] = True
+                symbols[i] = self.end_idx
+            elif not isinstance(a, actions.Start):  # Start is never chosen.
+                raise ActionError(f"Unknown action: {a}")
+        self.register_buffer(
+            "action_alignment_deltas", alignment_deltas, persistent=False
+        )
+        self.register_buffer("action_emits", emits, persistent=False)
+        self.register_buffer("action_copies", copies, persistent=False)
+        self.register_buffer("action_symbols", symbols, persistent=False)
 
     def get_decoder(self) -> modules.lstm.LSTMDecoder:
         return modules.lstm.LSTMDecoder(
@@ -73,14 +162,14 @@ class TransducerEncoderDecoder(lstm.LSTMEncoderDecoder):
     def forward(
         self,
         batch: data.PaddedBatch,
-    ) -> Tuple[List[List[int]], torch.Tensor]:
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
         """Runs the encoder-decoder model.
 
         Args:
             batch (data.PaddedBatch).
 
         Returns:
-            Tuple[List[List[int]], torch.Tensor] of encoded prediction values
+            Tuple[torch.Tensor, torch.Tensor] of encoded prediction values
                 and loss tensor; due to transducer setup, prediction is
                 performed during training, so these are returned.
         """
@@ -138,7 +227,7 @@ class TransducerEncoderDecoder(lstm.LSTMEncoderDecoder):
         teacher_forcing: bool,
         target: Optional[torch.Tensor] = None,
         target_mask: Optional[torch.Tensor] = None,
-    ) -> Tuple[List[List[int]], torch.Tensor]:
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
         """Decodes a sequence given the encoded input.
 
         This essentially serves as a wrapper for looping decode_step.
@@ -155,9 +244,10 @@ class TransducerEncoderDecoder(lstm.LSTMEncoderDecoder):
             target_mask (torch.Tensor, optional): mask for target input.
 
         Returns:
-            Tuple[List[List[int]], torch.Tensor]: encoded prediction values
-                and loss tensor; due to transducer setup, prediction is
-                performed during training, so these are returned.
+            Tuple[torch.Tensor, torch.Tensor]: encoded prediction values, of
+                shape B x pred_seq_len, and loss tensor; due to transducer
+                setup, prediction is performed during training, so these are
+                returned.
         """
         batch_size = source_mask.size(dim=0)
         input_length = (~source_mask).sum(dim=1)
@@ -172,12 +262,20 @@ class TransducerEncoderDecoder(lstm.LSTMEncoderDecoder):
             (batch_size,), self.actions.beg_idx, device=self.device
         )
         loss = torch.zeros(batch_size, device=self.device)
-        prediction = [[] for _ in range(batch_size)]
-        # Converting encodings for prediction.
+        # At most one symbol is emitted per step.
+        prediction = torch.full(
+            (batch_size, self.max_target_length),
+            self.pad_idx,
+            device=self.device,
+        )
+        prediction_length = torch.zeros(
+            batch_size, device=self.device, dtype=torch.int64
+        )
+        # Converting encodings for the expert.
         if target is not None:
             # Target and source need to be integers for SED values.
             # Clips EOW (idx = -1) for source and target.
-            source = [
+            source_list = [
                 s[~smask].tolist()[:-1]
                 for s, smask in zip(source, source_mask)
             ]
@@ -185,11 +283,19 @@ class TransducerEncoderDecoder(lstm.LSTMEncoderDecoder):
                 t[~tmask].tolist()[:-1]
                 for t, tmask in zip(target, target_mask)
             ]
+            # The expert's view of each prediction, extended as it grows.
+            prefix_rows = expert.PrefixRows(target)
         for _ in range(self.max_target_length):
             # Checks if completed all sequences.
             not_complete = last_action != self.actions.end_idx
-            if not any(not_complete):
+            if not not_complete.any():
                 break
+            # If given targets, asks expert for optimal actions; with a
+            # rollout pool, this runs while decoding.
+            if target is not None:
+                pending = self.batch_expert_rollout(
+                    source_list, target, alignment, prefix_rows, not_complete
+                )
             # Proceeds to make new edit; new action for all current decoding.
             action_count = torch.where(
                 not_complete.to(self.device), action_count + 1, action_count
@@ -207,11 +313,8 @@ class TransducerEncoderDecoder(lstm.LSTMEncoderDecoder):
                 decoder_output.hiddens,
             )
             logits = self.classifier(decoded).squeeze(dim=1)
-            # If given targets, asks expert for optimal actions.
             optim_actions = (
-                self.batch_expert_rollout(
-                    source, target, alignment, prediction, not_complete
-                )
+                self.optimal_action_mask(pending.result(), not_complete)
                 if target is not None
                 else None
             )
@@ -222,14 +325,24 @@ class TransducerEncoderDecoder(lstm.LSTMEncoderDecoder):
                 not_complete,
                 optim_actions=optim_actions if teacher_forcing else None,
             )
-            alignment = self.update_prediction(
-                last_action, source, alignment, prediction
+            emitted_at = prediction_length
+            alignment, prediction_length = self.update_prediction(
+                last_action, source, alignment, prediction, prediction_length
             )
             # If target, validation or training step loss required.
             if target is not None:
+                emitted = prediction.gather(
+                    1,
+                    emitted_at.clamp(max=prediction.size(1) - 1).unsqueeze(1),
+                ).squeeze(1)
+                prefix_rows.append(
+                    emitted.tolist(),
+                    ((prediction_length > emitted_at) & not_complete).tolist(),
+                )
                 log_sum_loss = self.log_sum_softmax_loss(logits, optim_actions)
                 loss = torch.where(not_complete, log_sum_loss + loss, loss)
         avg_loss = torch.mean(loss / action_count)
+        prediction = prediction[:, : int(prediction_length.max())]
         return prediction, -avg_loss
 
     def decode_action_step(
@@ -261,39 +374,42 @@ class TransducerEncoderDecoder(lstm.LSTMEncoderDecoder):
         """
         # Finds valid actions given remaining input length.
         end_of_input = (input_length - alignment) <= 1  # 1 -> Last char.
-        valid_actions = [
-            self.compute_valid_actions(eoi) if nc else [self.actions.end_idx]
-            for eoi, nc in zip(end_of_input, not_complete)
-        ]
         # Masks invalid actions.
-        logits = self.action_probability_mask(logits, valid_actions)
+        logits = self.action_probability_mask(
+            logits, end_of_input, not_complete
+        )
         return self.choose_action(logits, not_complete, optim_actions)
 
-    def compute_valid_actions(self, end_of_input: bool) -> List[int]:
-        """Gives all possible actions for remaining length of edits.
+    def action_probability_mask(
+        self,
+        logits: torch.Tensor,
+        end_of_input: torch.Tensor,
+        not_complete: torch.Tensor,
+    ) -> torch.Tensor:
+        """Masks non-valid actions in logits.
+
+        If the input is exhausted, only insertions and the end action are
+        valid; completed items may only end.
 
         Args:
-            end_of_input (bool): indicates if this is the last input from
-                string; if true, only insertions are available.
+            logits (torch.Tensor): logits of shape B x num_actions.
+            end_of_input (torch.Tensor): boolean tensor of batch length to
+                indicate if each item in batch is at its last input symbol.
+            not_complete (torch.Tensor): boolean tensor of batch length to
+                indicate if each item in batch is complete.
 
         Returns:
-            List[actions.Edit]: actions known by transducer.
+            torch.Tensor: masked logits.
         """
-        valid_actions = [self.actions.end_idx]
-        valid_actions.extend(self.insertions)
-        if not end_of_input:
-            valid_actions.extend([self.actions.copy_idx, self.actions.del_idx])
-            valid_actions.extend(self.substitutions)
-        return valid_actions
-
-    def action_probability_mask(
-        self, logits: torch.Tensor, valid_actions: List[int]
-    ) -> torch.Tensor:
-        """Masks non-valid actions in logits."""
         with torch.no_grad():
-            mask = torch.full(logits.shape, -math.inf, device=self.device)
-            for row, action in zip(mask, valid_actions):
-                row[action] = 0.0
+            mask = torch.where(
+                end_of_input.unsqueeze(1),
+                self.end_of_input_mask,
+                self.valid_action_mask,
+            )
+            mask = torch.where(
+                not_complete.unsqueeze(1), mask, self.complete_mask
+            )
             logits = mask + logits
         return logits
 
@@ -301,7 +417,7 @@ class TransducerEncoderDecoder(lstm.LSTMEncoderDecoder):
         self,
         logits: torch.Tensor,
         not_complete: torch.Tensor,
-        optim_actions: Optional[List[List[int]]] = None,
+        optim_actions: Optional[torch.Tensor] = None,
     ) -> torch.Tensor:
         """Chooses transducer action from log_prob distribution.
 
@@ -311,175 +427,150 @@ class TransducerEncoderDecoder(lstm.LSTMEncoderDecoder):
             log_probs (torch.Tensor): probability distribution of actions.
             not_complete (torch.Tensor): boolean tensor of batch length to
                 indicate if each item in batch is complete.
-            optim_actions (Optional[List[List[int]]]): optional encoded actions
-                to use for action selection.
+            optim_actions (torch.Tensor, optional): optional boolean mask of
+                shape B x num_actions, marking the optimal actions to use for
+                action selection.
 
         Returns:
             torch.Tensor: action encodings.
         """
-        # TODO: Merge logic into PyTorch methods.
         log_probs = nn.functional.log_softmax(logits, dim=1)
-        if optim_actions is None:
-            # Argmax decoding.
-            next_action = [
-                torch.argmax(probs, dim=0) if nc else self.actions.end_idx
-                for probs, nc in zip(log_probs, not_complete)
-            ]
-        else:
-            # Training with dynamic oracle; chooses from optimal actions.
-            with torch.no_grad():
-                if self.expert.explore():
-                    # Action is picked by random exploration.
-                    next_action = [
-                        self.sample(probs) if nc else self.actions.end_idx
-                        for probs, nc in zip(log_probs, not_complete)
-                    ]
-                else:
-                    # Action is picked from optim_actions.
-                    next_action = []
-                    for action, probs, nc in zip(
-                        optim_actions, log_probs, not_complete
-                    ):
-                        if nc:
-                            optim_logs = probs[action]
-                            idx = int(torch.argmax(optim_logs, 0))
-                            next_action.append(action[idx])
-                        else:  # Already complete, so skip.
-                            next_action.append(self.actions.end_idx)
-        return torch.tensor(next_action, device=self.device, dtype=torch.int)
-
-    # TODO: Merge action classes to remove need for this method.
-    @staticmethod
-    def remap_actions(
-        action_scores: Dict[actions.Edit, float]
-    ) -> Dict[actions.Edit, float]:
-        """Maps generative oracle's edit to conditional counterpart.
+        with torch.no_grad():
+            if optim_actions is None:
+                # Argmax decoding.
+                next_action = log_probs.argmax(dim=1)
+            elif self.expert.explore():
+                # Action is picked by random exploration.
+                next_action = torch.multinomial(log_probs.exp(), 1).squeeze(
+                    dim=1
+                )
+            else:
+                # Action is picked from optim_actions; ties go to the lowest
+                # encoding, even if all optimal actions are invalid.
+                next_action = torch.where(
+                    optim_actions,
+                    log_probs.clamp(min=torch.finfo(log_probs.dtype).min),
+                    -math.inf,
+                ).argmax(dim=1)
+            # Completed items only end.
+            return torch.where(not_complete, next_action, self.actions.end_idx)
 
-        Oracle edits are a distinct subclass from edits learned from samples.
+    def batch_expert_rollout(
+        self,
+        source: List[List[int]],
+        target: List[List[int]],
+        alignment: torch.Tensor,
+        prefix_rows: expert.PrefixRows,
+        not_complete: torch.Tensor,
+    ) -> rollouts.Rollouts:
+        """Starts expert rollout over batch.
 
-        This will eventually be removed.
+        With a rollout pool, this returns without waiting for the rollouts.
 
         Args:
-            action_scores (Dict[actions.Edit, float]): weights for each action.
+            source (List[List[int]]): source strings.
+            target (List[List[int]]): target strings.
+            alignment (torch.Tensor): index of current symbol for each item in
+                batch.
+            prefix_rows (expert.PrefixRows): current predictions and their
+                prefixes of the targets.
+            not_complete (torch.Tensor): boolean tensor of batch length to
+                indicate if each item in batch is complete.
 
         Returns:
-            Dict[actions.Edit, float]: edit action-weight pairs.
+            rollouts.Rollouts: optimal actions for the incomplete items.
         """
-        remapped_action_scores = {}
-        for action, score in action_scores.items():
-            if isinstance(action, actions.GenerativeEdit):
-                remapped_action = action.conditional_counterpart()
-            elif isinstance(action, actions.Edit):
-                remapped_action = action
-            else:
-                raise ActionError(
-                    f"Unknown action: {action}, {score}, "
-                    f"action_scores: {action_scores}"
+        items = [
+            (s, t, align, prefix_rows.predictions[i], prefix_rows.prefixes(i))
+            for i, (s, t, align, nc) in enumerate(
+                zip(source, target, alignment.tolist(), not_complete.tolist())
+            )
+            if nc
+        ]
+        if self.oracle_rollout_processes > 1:
+            if self._rollout_pool is None:
+                self._rollout_pool = rollouts.RolloutPool(
+                    self.expert, self.oracle_rollout_processes
                 )
-            remapped_action_scores[remapped_action] = score
-        return remapped_action_scores
+            return self._rollout_pool.submit(items, self.max_target_length)
+        return rollouts.Rollouts.from_result(
+            rollouts.rollout(self.expert, items, self.max_target_length)
+        )
 
-    def expert_rollout(
+    def optimal_action_mask(
         self,
-        source: List[int],
-        target: List[int],
-        alignment: int,
-        prediction: List[int],
-    ) -> List[int]:
-        """Rolls out with optimal expert policy.
+        optimal_actions: Tuple[numpy.ndarray, numpy.ndarray],
+        not_complete: torch.Tensor,
+    ) -> torch.Tensor:
+        """Unpacks optimal actions into a mask.
 
         Args:
-            source (List[int]): input string.
-            target (List[int]): target string.
-            alignment (int): position in source to edit.
-            prediction (List[str]): current prediction.
+            optimal_actions (Tuple[numpy.ndarray, numpy.ndarray]): the
+                concatenated optimal action encodings for the incomplete
+                items, and the number of optimal actions for each.
+            not_complete (torch.Tensor): boolean tensor of batch length to
+                indicate if each item in batch is complete.
 
         Returns:
-            List[int]: optimal action encodings.
+            torch.Tensor: boolean mask of shape B x num_actions; completed
+                items may only end.
         """
-        raw_action_scores = self.expert.score(
-            source,
-            target,
-            alignment,
-            prediction,
-            max_action_seq_len=self.max_target_length,
+        flat, counts = optimal_actions
+        mask = torch.zeros(
+            (len(not_complete), len(self.actions)),
+            dtype=torch.bool,
+            device=self.device,
         )
-        action_scores = self.remap_actions(raw_action_scores)
-        optimal_value = min(action_scores.values())
-        optimal_action = sorted(
-            [
-                self.actions.encode_unseen_action(action)
-                for action, value in action_scores.items()
-                if value == optimal_value
-            ]
-        )
-        return optimal_action
-
-    def batch_expert_rollout(
-        self,
-        source: List[List[int]],
-        target: List[List[int]],
-        alignment: torch.Tensor,
-        prediction: List[List[int]],
-        not_complete: torch.Tensor,
-    ) -> List[List[int]]:
-        """Performs expert rollout over batch."""
-        return [
-            (
-                self.expert_rollout(s, t, align, pred)
-                if nc
-                else self.actions.end_idx
-            )
-            for s, t, align, pred, nc in zip(
-                source, target, alignment, prediction, not_complete
-            )
-        ]
+        mask[:, self.actions.end_idx] = ~not_complete
+        rows = not_complete.nonzero().squeeze(1)
+        rows = rows.repeat_interleave(torch.from_numpy(counts).to(rows.device))
+        mask[rows, torch.from_numpy(flat).to(self.device)] = True
+        return mask
 
     def update_prediction(
         self,
-        action: List[actions.Edit],
-        source: List[int],
+        action: torch.Tensor,
+        source: torch.Tensor,
         alignment: torch.Tensor,
-        prediction: List[List[str]],
-    ) -> torch.Tensor:
+        prediction: torch.Tensor,
+        prediction_length: torch.Tensor,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
         """Batch updates prediction and alignment information given actions.
 
+        Emitted symbols are written into the prediction in place.
+
         Args:
-           action (List[actions.Edit]): valid actions, one per item in batch.
-           source (List[int]): source strings, one per item in batch.
+           action (torch.Tensor): encoded actions, one per item in batch.
+           source (torch.Tensor): encoded source strings, of shape
+               B x seq_len.
            alignment (torch.Tensor): index of current symbol for each item in
                batch.
-           prediction (List[List[str]]): current predictions for each item in
-               batch, one list of symbols per item.
+           prediction (torch.Tensor): current predictions, of shape
+               B x max_target_length.
+           prediction_length (torch.Tensor): length of the current prediction
+               for each item in batch.
 
         Return:
-            torch.Tensor: new alignments for transduction.
+            Tuple[torch.Tensor, torch.Tensor]: new alignments for transduction
+                and new prediction lengths.
         """
-        alignment_update = torch.zeros(
-            alignment.shape, device=self.device, dtype=torch.int64
+        copied = source.gather(
+            1, alignment.clamp(max=source.size(1) - 1).unsqueeze(1)
+        ).squeeze(1)
+        symbol = torch.where(
+            self.action_copies[action], copied, self.action_symbols[action]
+        )
+        emits = self.action_emits[action]
+        rows = torch.arange(len(action), device=self.device)
+        prediction[rows[emits], prediction_length[emits]] = symbol[emits]
+        return (
+            alignment + self.action_alignment_deltas[action],
+            prediction_length + emits,
         )
-        for i in range(len(source)):
-            a = self.actions.decode(action[i])
-            if isinstance(a, actions.ConditionalCopy):
-                symb = source[i][alignment[i]]
-                prediction[i].append(symb)
-                alignment_update[i] += 1
-            elif isinstance(a, actions.ConditionalDel):
-                alignment_update[i] += 1
-            elif isinstance(a, actions.ConditionalIns):
-                prediction[i].append(a.new)
-            elif isinstance(a, actions.ConditionalSub):
-                alignment_update[i] += 1
-                prediction[i].append(a.new)
-            elif isinstance(a, actions.End):
-                prediction[i].append(self.end_idx)
-            else:
-                raise ActionError(f"Unknown action: {action[i]}")
-        return alignment + alignment_update
 
     @staticmethod
     def log_sum_softmax_loss(
-        logits: torch.Tensor, optimal_actions: List[int]
+        logits: torch.Tensor, optimal_actions: torch.Tensor
     ) -> torch.Tensor:
         """Computes log loss.
 
@@ -489,12 +580,17 @@ class TransducerEncoderDecoder(lstm.LSTMEncoderDecoder):
             log-linear measures and EM training. In Proceedings of the 38th
             Annual Meeting of the Association for Computational
             Linguistics, pages 480–487.
+
+        Args:
+            logits (torch.Tensor): logits of shape B x num_actions.
+            optimal_actions (torch.Tensor): boolean mask of shape
+                B x num_actions, marking the optimal actions.
+
+        Returns:
+            torch.Tensor: log loss for each item in batch.
         """
-        opt_act = [
-            log[actions] for log, actions in zip(logits, optimal_actions)
-        ]
-        log_sum_exp_terms = torch.stack(
-            [torch.logsumexp(act, dim=-1) for act in opt_act]
+        log_sum_exp_terms = torch.logsumexp(
+            logits.masked_fill(~optimal_actions, -math.inf), -1
         )
         normalization_term = torch.logsumexp(logits, -1)
         return log_sum_exp_terms - normalization_term
@@ -530,8 +626,6 @@ class TransducerEncoderDecoder(lstm.LSTMEncoderDecoder):
 
     def validation_step(self, batch: data.PaddedBatch, batch_idx: int) -> Dict:
         predictions, loss = self(batch)
-        # Evaluation requires prediction as a tensor.
-        predictions = self.convert_prediction(predictions)
         # Processes for accuracy calculation.
         predictions = self.evaluator.finalize_predictions(
             predictions, self.end_idx, self.pad_idx
@@ -541,36 +635,28 @@ class TransducerEncoderDecoder(lstm.LSTMEncoderDecoder):
         )
         return {"val_eval_item": val_eval_item, "val_loss": loss}
 
+    # The LSTM beam search does not apply to this model, so this raises
+    # NotImplementedError instead.
+    beam_search = base.BaseEncoderDecoder.beam_search
+
     def predict_step(self, batch: Tuple[torch.tensor], batch_idx: int) -> Dict:
+        if self.beam_width > 1:
+            predictions, _ = self.beam_search(batch)
+            return predictions[:, 0]
         predictions, _ = self.forward(
             batch,
         )
-        # Evaluation requires prediction tensor.
-        return self.convert_prediction(predictions)
-
-    def convert_prediction(self, prediction: List[List[int]]) -> torch.Tensor:
-        """Converts prediction values to tensor for evaluator compatibility."""
-        max_len = len(max(prediction, key=len))
-        for i, pred in enumerate(prediction):
-            pad = [self.actions.end_idx] * (max_len - len(pred))
-            pred.extend(pad)
-            prediction[i] = torch.tensor(pred, dtype=torch.int)
-        return torch.stack(prediction)
+        return predictions
 
     def on_train_epoch_start(self) -> None:
         """Scheduler for oracle."""
         self.expert.roll_in_schedule(self.current_epoch)
 
-    @staticmethod
-    def sample(log_probs: torch.Tensor) -> torch.Tensor:
-        """Samples an action from a log-probability distribution."""
-        dist = torch.exp(log_probs)
-        rand = numpy.random.rand()
-        for action, p in enumerate(dist):
-            rand -= p
-            if rand <= 0:
-                break
-        return action
+    def on_fit_end(self) -> None:
+        """Stops the rollout pool, if any."""
+        if self._rollout_pool is not None:
+            self._rollout_pool.shutdown()
+            self._rollout_pool = None
 
     @property
     def name(self) -> str:
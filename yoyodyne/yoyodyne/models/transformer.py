@@ -1,13 +1,13 @@
 """Transformer model classes."""
 
 import argparse
-from typing import Optional
+from typing import Optional, Tuple
 
 import torch
 from torch import nn
 
 from .. import data, defaults
-from . import base, modules
+from . import base, beam_search, modules
 
 
 class TransformerEncoderDecoder(base.BaseEncoderDecoder):
@@ -77,32 +77,24 @@ class TransformerEncoderDecoder(base.BaseEncoderDecoder):
         # The output distributions to be returned.
         outputs = []
         batch_size = encoder_hidden.size(0)
-        # The predicted symbols at each iteration.
-        predictions = [
-            torch.tensor(
-                [self.start_idx for _ in range(encoder_hidden.size(0))],
-                device=self.device,
-            )
-        ]
+        # Decodes incrementally, one symbol at a time, caching the attention
+        # keys and values for the prefix and the encoder memory.
+        cache = self.decoder.init_cache(encoder_hidden, source_mask)
+        # -> B x 1.
+        symbol = torch.full(
+            (batch_size, 1), self.start_idx, device=self.device
+        )
         # Tracking when each sequence has decoded an EOS.
         finished = torch.zeros(batch_size, device=self.device)
         for _ in range(self.max_target_length):
-            target_tensor = torch.stack(predictions, dim=1)
-            # Uses a dummy mask of all ones.
-            target_mask = torch.ones_like(target_tensor, dtype=torch.float)
-            target_mask = target_mask == 0
-            decoder_output = self.decoder(
-                encoder_hidden, source_mask, target_tensor, target_mask
-            ).output
-            logits = self.classifier(decoder_output)
-            last_output = logits[:, -1, :]  # Ignores EOS.
+            decoder_output = self.decoder.forward_step(symbol, cache).output
+            last_output = self.classifier(decoder_output[:, -1, :])
             outputs.append(last_output)
-            # -> B x 1 x 1
-            _, pred = torch.max(last_output, dim=1)
-            predictions.append(pred)
+            # -> B x 1.
+            symbol = torch.argmax(last_output, dim=1, keepdim=True)
             # Updates to track which sequences have decoded an EOS.
             finished = torch.logical_or(
-                finished, (predictions[-1] == self.end_idx)
+                finished, (symbol.squeeze(1) == self.end_idx)
             )
             # Breaks when all sequences have predicted an EOS symbol. If we
             # have a target (and are thus computing loss), we only break when
@@ -114,14 +106,111 @@ class TransformerEncoderDecoder(base.BaseEncoderDecoder):
         # -> B x seq_len x target_vocab_size.
         return torch.stack(outputs).transpose(0, 1)
 
+    def _decode_greedy_compact(
+        self, encoder_hidden: torch.Tensor, source_mask: torch.Tensor
+    ) -> torch.Tensor:
+        """Decodes greedily, dropping sequences from the batch as they finish.
+
+        The decoder cache and encoded inputs are compacted to the sequences
+        which have not yet decoded an EOS; the remaining steps of finished
+        sequences are padding. Only the chosen symbols are kept, not their
+        scores.
+
+        Args:
+            encoder_hidden (torch.Tensor): Hidden states from the encoder.
+            source_mask (torch.Tensor): Mask for the encoded source tokens.
+
+        Returns:
+            torch.Tensor: predicted symbols of shape B x seq_len.
+        """
+        batch_size = encoder_hidden.size(0)
+        cache = self.decoder.init_cache(encoder_hidden, source_mask)
+        # -> B x 1.
+        symbol = torch.full(
+            (batch_size, 1), self.start_idx, device=self.device
+        )
+        outputs = self._padding_symbols(batch_size, self.max_target_length)
+        # Batch indices of the sequences still being decoded.
+        active = torch.arange(batch_size, device=self.device)
+        for t in range(self.max_target_length):
+            decoder_output = self.decoder.forward_step(symbol, cache).output
+            last_output = self.classifier(decoder_output[:, -1, :])
+            # -> B x 1.
+            symbol = torch.argmax(last_output, dim=1, keepdim=True)
+            outputs[active, t] = symbol.squeeze(1)
+            unfinished = symbol.squeeze(1) != self.end_idx
+            if not unfinished.all():
+                if not unfinished.any():
+                    return outputs[:, : t + 1]
+                keep = unfinished.nonzero().squeeze(1)
+                active = active[keep]
+                symbol = symbol[keep]
+                cache = cache.index_select(keep)
+        return outputs
+
+    def beam_search(
+        self, batch: data.PaddedBatch, n: int = 1
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Decodes the output sequence with beam search.
+
+        The decoder state of each hypothesis is its cache of attention keys
+        and values.
+
+        Args:
+            batch (data.PaddedBatch).
+            n (int, optional): number of hypotheses to return.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: predictions of shape
+                B x n x seq_len and their log-likelihoods of shape B x n.
+        """
+        batch_size = len(batch)
+        # The encoder output is expanded once, up front.
+        encoder_output = beam_search.expand(
+            self.source_encoder(batch.source).output, self.beam_width
+        )
+        source_mask = beam_search.expand(batch.source.mask, self.beam_width)
+
+        def step(
+            symbols: torch.Tensor, cache: modules.transformer.DecoderCache
+        ) -> Tuple[torch.Tensor, modules.transformer.DecoderCache]:
+            decoder_output = self.decoder.forward_step(
+                symbols.unsqueeze(1), cache
+            ).output
+            logits = self.classifier(decoder_output[:, -1, :])
+            return nn.functional.log_softmax(logits, dim=-1), cache
+
+        def reorder(
+            cache: modules.transformer.DecoderCache, indices: torch.Tensor
+        ) -> modules.transformer.DecoderCache:
+            return cache.index_select(indices)
+
+        return beam_search.search(
+            step,
+            reorder,
+            self.decoder.init_cache(encoder_output, source_mask),
+            batch_size=batch_size,
+            beam_width=self.beam_width,
+            start_idx=self.start_idx,
+            end_idx=self.end_idx,
+            pad_idx=self.pad_idx,
+            max_length=self.max_target_length,
+            device=self.device,
+            n=n,
+            length_normalization=self.length_normalization,
+        )
+
     def forward(
         self,
         batch: data.PaddedBatch,
+        compact: bool = False,
     ) -> torch.Tensor:
         """Runs the encoder-decoder.
 
         Args:
             batch (data.PaddedBatch).
+            compact (bool, optional): if true, decodes greedily with
+                _decode_greedy_compact, returning only the predicted symbols.
 
         Returns:
             torch.Tensor.
@@ -148,6 +237,12 @@ class TransformerEncoderDecoder(base.BaseEncoderDecoder):
             ).output
             logits = self.classifier(decoder_output)
             output = logits[:, :-1, :]  # Ignore EOS.
+        elif compact:
+            encoder_output = self.source_encoder(batch.source).output
+            # -> B x seq_len x output_size.
+            output = self._decode_greedy_compact(
+                encoder_output, batch.source.mask
+            )
         else:
             encoder_output = self.source_encoder(batch.source).output
             # -> B x seq_len x output_size.
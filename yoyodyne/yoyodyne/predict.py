@@ -3,13 +3,14 @@ import csv
 
 import argparse
 import os
+from typing import List, TextIO, Tuple, Union
 import torch
 
 import pytorch_lightning as pl
 
 from torchmetrics.functional.text import char_error_rate
 
-from . import data, models, util
+from . import data, defaults, models, util
 
 
 if torch.cuda.device_count() > 1:
@@ -48,6 +49,8 @@ def get_datamodule_from_argparse_args(
     return data.DataModule(
         predict=args.predict,
         batch_size=args.batch_size,
+        bucket_by_length=args.bucket_by_length,
+        max_tokens_per_batch=args.max_tokens_per_batch,
         source_col=args.source_col,
         features_col=args.features_col,
         target_col=args.target_col,
@@ -58,6 +61,18 @@ def get_datamodule_from_argparse_args(
         max_source_length=args.max_source_length,
         max_target_length=args.max_target_length,
         index=index,
+        cache_dir=(
+            data.Cache.cache_path(args.model_dir, args.experiment)
+            if args.cache_encoded
+            else None
+        ),
+        streaming=args.streaming,
+        shuffle_buffer_size=args.shuffle_buffer_size,
+        parse_processes=args.parse_processes,
+        num_workers=args.num_workers,
+        pin_memory=args.pin_memory,
+        persistent_workers=args.persistent_workers,
+        prefetch_factor=args.prefetch_factor,
     )
 
 
@@ -73,7 +88,14 @@ def get_model_from_argparse_args(
         models.BaseEncoderDecoder.
     """
     model_cls = models.get_model_cls_from_argparse_args(args)
-    return model_cls.load_from_checkpoint(args.checkpoint)
+    # Decoding arguments override those saved in the checkpoint.
+    return model_cls.load_from_checkpoint(
+        args.checkpoint,
+        beam_width=args.beam_width,
+        nbest=args.nbest,
+        length_normalization=args.length_normalization,
+        compact_decoding=args.compact_decoding,
+    )
 
 
 def _mkdir(output: str) -> None:
@@ -87,6 +109,101 @@ def _mkdir(output: str) -> None:
         os.makedirs(dirname, exist_ok=True)
 
 
+class _PredictionWriter(pl.Callback):
+    """Writes predictions as each batch is decoded.
+
+    If the batch sampler may reorder the data (i.e., when bucketing by length
+    or batching by a token budget), predictions are instead buffered and
+    written in the input order once prediction ends.
+    """
+
+    def __init__(
+        self,
+        sink: TextIO,
+        datamodule: data.DataModule,
+        loader: torch.utils.data.DataLoader,
+    ):
+        self.sink = sink
+        self.dataset = loader.dataset
+        self.end_idx = datamodule.index.end_idx
+        self.pad_idx = datamodule.index.pad_idx
+        if datamodule.streaming or not (
+            datamodule.bucket_by_length
+            or datamodule.max_tokens_per_batch is not None
+        ):
+            self.batch_indices = None
+            self.buffer = None
+        else:
+            self.batch_indices = iter(loader.batch_sampler)
+            self.buffer = [None] * len(loader.dataset)
+
+    def _format(
+        self,
+        model: models.BaseEncoderDecoder,
+        outputs: Union[torch.Tensor, Tuple[torch.Tensor, torch.Tensor]],
+    ) -> List[str]:
+        """Decodes a batch of predictions into output lines.
+
+        Args:
+            model (models.BaseEncoderDecoder).
+            outputs (Union[torch.Tensor, Tuple[torch.Tensor, torch.Tensor]]):
+                predictions of shape B x seq_len, or n-best predictions of
+                shape B x n x seq_len and their scores of shape B x n.
+
+        Returns:
+            List[str]: one line per input; n-best hypotheses are separated
+                by tabs, each followed by its log-likelihood.
+        """
+        if isinstance(outputs, torch.Tensor):
+            return list(
+                self.dataset.decode_target(
+                    model.evaluator.finalize_predictions(
+                        outputs, self.end_idx, self.pad_idx
+                    )
+                )
+            )
+        predictions, scores = outputs
+        # -> (B * n) x seq_len.
+        predictions = model.evaluator.finalize_predictions(
+            predictions.flatten(0, 1), self.end_idx, self.pad_idx
+        )
+        hypotheses = iter(self.dataset.decode_target(predictions))
+        return [
+            "\t".join(
+                f"{next(hypotheses)}\t{score:.4f}" for score in row_scores
+            )
+            for row_scores in scores.tolist()
+        ]
+
+    def on_predict_batch_end(
+        self,
+        trainer: pl.Trainer,
+        model: models.BaseEncoderDecoder,
+        outputs: Union[torch.Tensor, Tuple[torch.Tensor, torch.Tensor]],
+        batch: data.PaddedBatch,
+        batch_idx: int,
+        dataloader_idx: int = 0,
+    ) -> None:
+        predictions = self._format(model, outputs)
+        if self.buffer is None:
+            for prediction in predictions:
+                print(prediction, file=self.sink)
+        else:
+            for index, prediction in zip(
+                next(self.batch_indices), predictions
+            ):
+                self.buffer[index] = prediction
+
+    def on_predict_end(
+        self, trainer: pl.Trainer, model: models.BaseEncoderDecoder
+    ) -> None:
+        if self.buffer is None:
+            return
+        for prediction in self.buffer:
+            print(prediction, file=self.sink)
+        self.buffer = None
+
+
 def predict(
     trainer: pl.Trainer,
     model: models.BaseEncoderDecoder,
@@ -105,12 +222,14 @@ def predict(
     _mkdir(output)
     loader = datamodule.predict_dataloader()
     with open(output, "w") as sink:
-        for batch in trainer.predict(model, loader):
-            batch = model.evaluator.finalize_predictions(
-                batch, datamodule.index.end_idx, datamodule.index.pad_idx
-            )
-            for prediction in loader.dataset.decode_target(batch):
-                print(prediction, file=sink)
+        writer = _PredictionWriter(sink, datamodule, loader)
+        trainer.callbacks.append(writer)
+        try:
+            # Predictions are written by the callback rather than returned,
+            # so they need not all be held in memory.
+            trainer.predict(model, loader, return_predictions=False)
+        finally:
+            trainer.callbacks.remove(writer)
 
 
 def add_argparse_args(parser: argparse.ArgumentParser) -> None:
@@ -142,7 +261,48 @@ def add_argparse_args(parser: argparse.ArgumentParser) -> None:
         help="Path to prediction output data TSV.",
     )
     # Prediction arguments.
-    # TODO: add --beam_width.
+    parser.add_argument(
+        "--beam_width",
+        type=int,
+        default=defaults.BEAM_WIDTH,
+        help="Size of the beam for beam search; 1 decodes greedily. "
+        "Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--nbest",
+        type=int,
+        default=defaults.NBEST,
+        help="Number of beam search hypotheses to write for each input, "
+        "best first; if more than 1, each is followed by its log-likelihood "
+        "(divided by its length with --length_normalization), as "
+        "tab-separated columns. Cannot exceed --beam_width. "
+        "Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--length_normalization",
+        action="store_true",
+        default=defaults.LENGTH_NORMALIZATION,
+        help="Compares beam search hypotheses, both when pruning the beam "
+        "and when ranking the final hypotheses, by their log-likelihood "
+        "divided by their length. Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--no_length_normalization",
+        action="store_false",
+        dest="length_normalization",
+    )
+    parser.add_argument(
+        "--compact_decoding",
+        action="store_true",
+        default=defaults.COMPACT_DECODING,
+        help="Drops sequences from the batch as they finish during greedy "
+        "decoding. Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--no_compact_decoding",
+        action="store_false",
+        dest="compact_decoding",
+    )
     # Data arguments.
     data.add_argparse_args(parser)
     # Architecture arguments; the architecture-specific ones are not needed.
@@ -165,7 +325,8 @@ def main() -> None:
     predict(trainer, model, datamodule, args.output)
 
     with open(args.output) as predictions:
-        preds = csv.reader(predictions)
+        # N-best predictions are tab-separated; the first is the best.
+        preds = csv.reader(predictions, delimiter="\t", quoting=csv.QUOTE_NONE)
         hyp = [p[0] for p in preds]
         gld = ["".join(t[-1]) for t in datamodule.parser.samples(datamodule.predict)]
         print(f"Final PER: {char_error_rate(hyp, gld).item()}")
@@ -113,6 +113,8 @@ def get_datamodule_from_argparse_args(
         train=args.train,
         val=args.val,
         batch_size=args.batch_size,
+        bucket_by_length=args.bucket_by_length,
+        max_tokens_per_batch=args.max_tokens_per_batch,
         source_col=args.source_col,
         features_col=args.features_col,
         target_col=args.target_col,
@@ -122,6 +124,18 @@ def get_datamodule_from_argparse_args(
         separate_features=separate_features,
         max_source_length=args.max_source_length,
         max_target_length=args.max_target_length,
+        cache_dir=(
+            data.Cache.cache_path(args.model_dir, args.experiment)
+            if args.cache_encoded
+            else None
+        ),
+        streaming=args.streaming,
+        shuffle_buffer_size=args.shuffle_buffer_size,
+        parse_processes=args.parse_processes,
+        num_workers=args.num_workers,
+        pin_memory=args.pin_memory,
+        persistent_workers=args.persistent_workers,
+        prefetch_factor=args.prefetch_factor,
     )
     if not datamodule.has_target:
         raise Error("No target column specified")
@@ -149,10 +163,16 @@ def get_model_from_argparse_args(
     )
     expert = (
         models.expert.get_expert(
-            datamodule.train_dataloader().dataset,
+            datamodule.train_dataset,
             epochs=args.oracle_em_epochs,
             oracle_factor=args.oracle_factor,
             sed_params_path=args.sed_params,
+            sed_cache_dir=(
+                models.expert.sed_cache_path(args.model_dir)
+                if args.cache_sed_params
+                else None
+            ),
+            processes=args.oracle_em_processes,
         )
         if args.arch in ["transducer"]
         else None
@@ -195,11 +215,13 @@ def get_model_from_argparse_args(
         features_encoder_cls=features_encoder_cls,
         features_vocab_size=features_vocab_size,
         hidden_size=args.hidden_size,
+        hmm_band_width=args.hmm_band_width,
         label_smoothing=args.label_smoothing,
         learning_rate=args.learning_rate,
         max_source_length=args.max_source_length,
         max_target_length=args.max_target_length,
         optimizer=args.optimizer,
+        oracle_rollout_processes=args.oracle_rollout_processes,
         output_size=datamodule.index.target_vocab_size,
         pad_idx=datamodule.index.pad_idx,
         scheduler=args.scheduler,
@@ -296,6 +318,7 @@ def add_argparse_args(parser: argparse.ArgumentParser) -> None:
     schedulers.add_argparse_args(parser)
     # Architecture-specific arguments.
     models.BaseEncoderDecoder.add_argparse_args(parser)
+    models.HardMonotonicHmm.add_argparse_args(parser)
     models.LSTMEncoderDecoder.add_argparse_args(parser)
     models.TransformerEncoderDecoder.add_argparse_args(parser)
     # models.modules.BaseEncoder.add_argparse_args(parser)